@@ -4,7 +4,6 @@ import sys
 import subprocess
 from unittest import mock
 
-from pymongo import MongoClient
 import pytest
 
 project_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,7 +11,21 @@ root = os.path.join(project_dir, "src")
 sys.path.insert(0, root)
 
 # Needed to properly mock cloud db
+from data_transfer import database
 from data_transfer.database import Database
+import start_mongod
+
+# Tests run without any mongod processes when SCOUTING_SERVER_DB is "memory"
+MEMORY_BACKEND = os.environ.get("SCOUTING_SERVER_DB") == "memory"
+if MEMORY_BACKEND:
+    from data_transfer.memory_database import MemoryClient as MongoClient
+else:
+    from pymongo import MongoClient
+
+    # The database module only starts mongod when it is first used
+    start_mongod.ensure_started()
+# Loaded before any test mocks utils.read_schema
+database.get_collection_schema()
 
 with open(f"{project_dir}/data/competition.txt") as event_key_file:
     TEST_DATABASE_NAME = "test" + event_key_file.read().rstrip()
@@ -22,6 +35,16 @@ DB = MongoClient(port=1678)[TEST_DATABASE_NAME]
 
 def pytest_configure(config):
     config.addinivalue_line("markers", "clouddb: mark that test needs the cloud db to be reset")
+    config.addinivalue_line("markers", "mongod: mark that test needs a running mongod")
+
+
+def pytest_collection_modifyitems(config, items):
+    if not MEMORY_BACKEND:
+        return
+    skip_mongod = pytest.mark.skip(reason="needs a running mongod, SCOUTING_SERVER_DB is memory")
+    for item in items:
+        if "mongod" in item.keywords:
+            item.add_marker(skip_mongod)
 
 
 def pytest_addoption(parser):
@@ -51,6 +74,10 @@ def start_cloud_test_mongod():
 
     This removes the need for the tests to connect to the remote database
     """
+    if MEMORY_BACKEND:
+        # Memory clients on port 9678 already act as a separate database server
+        yield
+        return
     db_path = f"{project_dir}/data/cloud_db"
     # Ensure cloud db directory is empty to remove errors
     if os.path.exists(db_path):
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+"""Benchmarks the calculation pipeline end to end on a synthetic event.
+
+A synthetic event from generate_synthetic_event is played back in rounds. Each round uploads the
+QRs of the next group of matches, makes the TBA results of those matches available, and runs every
+calculation in calculations.yml, just like a server cycle during an event. The wall time, MongoDB
+queries, and documents read and written by each calculation are recorded with the metrics module,
+and the results are written as JSON. Results are compared to the tracked baseline so performance
+regressions are found before an event, see benchmarks/README.md for how to refresh the baseline.
+
+The benchmark uses its own event key and database, so it does not touch the data of a real event.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+from data_transfer import database, tba_communicator
+from generate_synthetic_event import SyntheticEvent
+import metrics
+import server
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+# Directory that benchmark results are written to
+RESULTS_DIRECTORY = "data/benchmarks"
+# Tracked baseline results to compare against
+BASELINE_FILE = "benchmarks/baseline.json"
+# Stages that take less time than this in the baseline are too noisy to compare
+MIN_COMPARED_SECONDS = 0.05
+
+
+@contextmanager
+def event_key(key: str) -> Iterator[None]:
+    """Makes the calculations use 'key' as the event key inside of the `with` block"""
+    previous_utils_key, previous_server_key = utils.TBA_EVENT_KEY, server.Server.TBA_EVENT_KEY
+    utils.TBA_EVENT_KEY = server.Server.TBA_EVENT_KEY = key
+    try:
+        yield
+    finally:
+        utils.TBA_EVENT_KEY, server.Server.TBA_EVENT_KEY = previous_utils_key, previous_server_key
+
+
+def summarize(rounds: List[Dict[str, metrics.Stats]], scope_prefix: str) -> Dict[str, dict]:
+    """Summarizes the stats of every scope starting with 'scope_prefix' over all rounds"""
+    names = sorted({name for stats in rounds for name in stats if name.startswith(scope_prefix)})
+    summary = {}
+    for name in names:
+        round_stats = [stats[name] for stats in rounds if name in stats]
+        latencies = [stats.wall_time for stats in round_stats]
+        total = metrics.Stats()
+        for stats in round_stats:
+            total.add(stats)
+        summary[name[len(scope_prefix) :]] = {
+            "rounds": len(round_stats),
+            "calls": total.calls,
+            "total_seconds": total.wall_time,
+            "latency_mean_seconds": statistics.mean(latencies),
+            "latency_median_seconds": statistics.median(latencies),
+            "latency_max_seconds": max(latencies),
+            "queries": total.queries,
+            "documents_read": total.documents_read,
+            "documents_written": total.documents_written,
+            "documents_per_second": (
+                (total.documents_read + total.documents_written) / total.wall_time
+                if total.wall_time > 0
+                else 0
+            ),
+        }
+    return summary
+
+
+def run_benchmark(
+    num_teams: int = 40,
+    num_matches: int = 80,
+    num_rounds: int = 10,
+    min_scouts: int = 1,
+    max_scouts: int = 3,
+    seed: int = 1678,
+    keep_database: bool = False,
+) -> Dict[str, Any]:
+    """Plays back a synthetic event through the calculations, returns the benchmark results"""
+    event = SyntheticEvent(num_teams, num_matches, min_scouts, max_scouts, seed)
+    event.write_event_files()
+    qrs = event.generate_qrs()
+    db = database.Database(tba_event_key=event.event_key)
+    db.client.drop_database(db.name)
+    db.setup_db()
+    # Split the matches as evenly as possible between the rounds
+    match_numbers = sorted(qrs)
+    round_size = -(-len(match_numbers) // num_rounds)
+    round_matches = [
+        match_numbers[start : start + round_size]
+        for start in range(0, len(match_numbers), round_size)
+    ]
+
+    round_stats = []
+    # The current directory is used by the calculations to find the event files
+    previous_directory = os.getcwd()
+    os.chdir(utils.MAIN_DIRECTORY)
+    try:
+        with event_key(event.event_key):
+            benchmark_server = server.Server(write_cloud=False, calc_all_data=False, db=db)
+            # QRs are uploaded directly instead of being read from stdin
+            qr_input = [c for c in benchmark_server.calculations if type(c).__name__ == "QRInput"]
+            benchmark_server.calculations = [
+                c for c in benchmark_server.calculations if type(c).__name__ != "QRInput"
+            ]
+            metrics.RECORDER.reset()
+            start = time.perf_counter()
+            for matches in round_matches:
+                # Results of the matches in this round are available from TBA
+                tba_communicator.use_local_payloads(event.generate_tba_payloads(matches[-1]))
+                with metrics.scope("cycle"):
+                    with metrics.scope("calc.QRInput"):
+                        round_qrs = [qr for match in matches for qr in qrs[match]]
+                        if qr_input != []:
+                            qr_input[0].upload_qr_codes(round_qrs)
+                    benchmark_server.run_calculations()
+                round_stats.append(metrics.RECORDER.reset())
+                log.info(f"Benchmarked matches {matches[0]}-{matches[-1]}")
+            total_seconds = time.perf_counter() - start
+    finally:
+        tba_communicator.use_local_payloads(None)
+        os.chdir(previous_directory)
+        if not keep_database:
+            db.client.drop_database(db.name)
+
+    num_qrs = sum(len(match_qrs) for match_qrs in qrs.values())
+    return {
+        "config": {
+            "teams": num_teams,
+            "matches": num_matches,
+            "rounds": len(round_matches),
+            "min_scouts": min_scouts,
+            "max_scouts": max_scouts,
+            "seed": seed,
+        },
+        "time": time.time(),
+        "python": sys.version.split()[0],
+        "qrs": num_qrs,
+        "total_seconds": total_seconds,
+        "qrs_per_second": num_qrs / total_seconds if total_seconds > 0 else 0,
+        "cycle": summarize(round_stats, "cycle").get("", {}),
+        "stages": summarize(round_stats, "calc."),
+        "database": summarize(round_stats, "db."),
+    }
+
+
+def compare_to_baseline(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2
+) -> List[str]:
+    """Returns a description of every stage that is more than 'tolerance' slower than 'baseline'"""
+    regressions = []
+    if results["config"] != baseline["config"]:
+        log.warning("Benchmark config does not match the baseline, comparison may not be useful")
+    for stage, baseline_stage in baseline["stages"].items():
+        if stage not in results["stages"]:
+            continue
+        baseline_seconds = baseline_stage["total_seconds"]
+        seconds = results["stages"][stage]["total_seconds"]
+        if baseline_seconds >= MIN_COMPARED_SECONDS and seconds > baseline_seconds * (
+            1 + tolerance
+        ):
+            regressions.append(
+                f"{stage}: {seconds:.3f}s, baseline {baseline_seconds:.3f}s "
+                f"(+{(seconds / baseline_seconds - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def parser():
+    parse = argparse.ArgumentParser()
+    parse.add_argument("--teams", help="Number of teams, 30-120", type=int, default=40)
+    parse.add_argument("--matches", help="Number of qualification matches", type=int, default=80)
+    parse.add_argument(
+        "--rounds", help="Number of server cycles to play the event in", type=int, default=10
+    )
+    parse.add_argument("--min-scouts", help="Minimum scouts per robot", type=int, default=1)
+    parse.add_argument("--max-scouts", help="Maximum scouts per robot", type=int, default=3)
+    parse.add_argument("--seed", help="Random seed for the synthetic event", type=int, default=1678)
+    parse.add_argument("--output", help="File to write results to, defaults to a new file")
+    parse.add_argument("--baseline", help="Baseline results to compare to", default=BASELINE_FILE)
+    parse.add_argument(
+        "--save-baseline", help="Save the results as the baseline", action="store_true"
+    )
+    parse.add_argument(
+        "--tolerance", help="Allowed slowdown compared to the baseline", type=float, default=0.2
+    )
+    parse.add_argument(
+        "--keep-database", help="Don't delete the benchmark database", action="store_true"
+    )
+    return parse.parse_args()
+
+
+if __name__ == "__main__":
+    args = parser()
+    results = run_benchmark(
+        args.teams,
+        args.matches,
+        args.rounds,
+        args.min_scouts,
+        args.max_scouts,
+        args.seed,
+        args.keep_database,
+    )
+    output = args.output or f"{RESULTS_DIRECTORY}/{int(results['time'])}.json"
+    with open(utils.create_file_path(output), "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"{results['qrs']} QRs in {results['total_seconds']:.2f}s, results written to {output}")
+    for stage, stage_results in results["stages"].items():
+        print(
+            f"{stage}: {stage_results['total_seconds']:.3f}s total, "
+            f"{stage_results['latency_median_seconds']:.3f}s median per cycle"
+        )
+
+    baseline_path = utils.create_file_path(args.baseline)
+    if args.save_baseline:
+        with open(baseline_path, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as baseline_file:
+            regressions = compare_to_baseline(results, json.load(baseline_file), args.tolerance)
+        if regressions != []:
+            print("Performance regressions compared to the baseline:")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print("No performance regressions compared to the baseline")
+    else:
+        print(f"No baseline at {args.baseline}, save one with --save-baseline")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""Measures how long it takes to start the command line tools.
+
+Each tool module is imported in a new Python process, several times, and the median wall time is
+reported. Importing a tool runs everything it does on startup, but not its main block, so this is
+the time an operator waits before the tool does anything useful. Tools that ask for input on
+startup are timed until their first question. The modules that take the most
+time to import are found with `python -X importtime`.
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import utils
+
+log = logging.getLogger(__name__)
+
+# Tools that are run many times during an event
+TOOLS = ["export_csvs", "override_data", "list_missing_devices", "server"]
+
+
+def time_import(module: str) -> float:
+    """Returns the wall time of importing 'module' in a new Python process"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", f"import {module}"],
+        cwd=os.path.join(utils.MAIN_DIRECTORY, "src"),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    seconds = time.perf_counter() - start
+    # Reading input from an empty stdin raises EOFError, which is where the timing is meant to end
+    if result.returncode != 0 and b"EOFError" not in result.stderr:
+        log.error(f"Importing {module} failed:\n{result.stderr.decode('utf-8')}")
+    return seconds
+
+
+def slowest_imports(module: str, count: int = 10) -> List[Tuple[str, float]]:
+    """Returns the 'count' imported modules of 'module' that take the most time, including their
+    own imports"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.join(utils.MAIN_DIRECTORY, "src"),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    imports = []
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    for line in result.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        imports.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(imports, key=lambda entry: entry[1], reverse=True)[:count]
+
+
+def benchmark_startup(tools: List[str], repeats: int = 5) -> Dict[str, dict]:
+    """Returns startup time statistics of each of 'tools'"""
+    results = {}
+    for tool in tools:
+        # The first import compiles bytecode, which only happens once after each change
+        time_import(tool)
+        times = [time_import(tool) for _ in range(repeats)]
+        results[tool] = {
+            "median_seconds": statistics.median(times),
+            "min_seconds": min(times),
+            "max_seconds": max(times),
+            "slowest_imports": slowest_imports(tool),
+        }
+    return results
+
+
+def parser():
+    parse = argparse.ArgumentParser()
+    parse.add_argument("tools", help="Tool modules to time, defaults to common tools", nargs="*")
+    parse.add_argument("--repeats", help="Times to start each tool", type=int, default=5)
+    parse.add_argument("--output", help="File to write results to as JSON")
+    return parse.parse_args()
+
+
+if __name__ == "__main__":
+    args = parser()
+    results = benchmark_startup(args.tools or TOOLS, args.repeats)
+    for tool, tool_results in results.items():
+        print(
+            f"{tool}: {tool_results['median_seconds']:.3f}s median, "
+            f"{tool_results['min_seconds']:.3f}s-{tool_results['max_seconds']:.3f}s"
+        )
+        for name, seconds in tool_results["slowest_imports"][:5]:
+            print(f"    {name}: {seconds:.3f}s")
+    if args.output is not None:
+        with open(utils.create_file_path(args.output), "w") as results_file:
+            json.dump(results, results_file, indent=2)
@@ -3,6 +3,7 @@
 """Holds functions used to determine auto scoring and paths"""
 
 from typing import List, Dict
+from calculations import records, timeline_features
 from calculations.base_calculations import BaseCalculations
 import logging
 import statistics
@@ -26,13 +27,11 @@ class AutoPathCalc(BaseCalculations):
 
         # Extract auto timelines
         for unconsolidated_tim in unconsolidated_obj_tims:
-            unconsolidated_auto_timelines.append(
-                [
-                    action
-                    for action in unconsolidated_tim["timeline"]
-                    if action["in_teleop"] == False
-                ]
-            )
+            if (features := timeline_features.get_features(unconsolidated_tim)) is not None:
+                unconsolidated_auto_timelines.append(features["auto_timeline"])
+                continue
+            timeline = records.unconsolidated_tim(unconsolidated_tim)["timeline"]
+            unconsolidated_auto_timelines.append(timeline.filter({"in_teleop": False}))
         return unconsolidated_auto_timelines
 
     def consolidate_timelines(self, unconsolidated_timelines: List[List[Dict]]) -> List[Dict]:
@@ -480,14 +479,17 @@ class AutoPathCalc(BaseCalculations):
 
         # Check if changes need to be made to teams
         if (entries := self.entries_since_last()) != []:
+            team_set = self.team_set
             for entry in entries:
                 # Check that the entry is an unconsolidated_obj_tim
-                if "timeline" not in entry["o"].keys() or "team_number" not in entry["o"].keys():
+                if "team_number" not in entry["o"] or (
+                    "timeline" not in entry["o"] and records.PACKED_TIMELINE_FIELD not in entry["o"]
+                ):
                     continue
 
                 # Check that the team is in the team list, ignore team if not in teams list
                 team_num = entry["o"]["team_number"]
-                if team_num not in self.teams_list:
+                if team_num not in team_set:
                     log.warning(f"auto_paths: team number {team_num} is not in teams list")
                     continue
 
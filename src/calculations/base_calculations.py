@@ -1,9 +1,10 @@
-import json
-
 import pymongo
 import statistics
+from typing import Dict, FrozenSet, List, Optional
 
+import match_schedule
 import server
+from data_transfer import change_tracker
 
 import utils
 import logging
@@ -18,15 +19,63 @@ class BaseCalculations:
     def __init__(self, server: "server.Server"):
         self.server = server
         self.oplog = self.server.oplog
-        self.calc_all_data = self.server.calc_all_data
-        self.update_timestamp()
+        # Position in the changes of the database, see `changed_keys`
+        self.change_position = self.server.db.changes.position
+        if self.server.initial_timestamp is not None:
+            self.timestamp = self.server.initial_timestamp
+        else:
+            self.update_timestamp()
+        if not self.calc_all_data:
+            self.resume_from_checkpoint()
+        # Oplog timestamp of the latest change returned by `changed_keys`
+        self.keys_timestamp = self.timestamp
         self.watched_collections = NotImplemented  # Calculations should override this attribute
-        self.teams_list = self.get_teams_list()
+
+    @property
+    def calc_all_data(self) -> bool:
+        """Whether all data is recalculated this cycle
+
+        Read from the server, which asks again before every cycle, so calculations only recalculate
+        all data while the server rebuilds it.
+        """
+        return self.server.calc_all_data
+
+    @property
+    def teams_list(self) -> List[str]:
+        """Teams at the event, from the current team list so a changed list is used right away"""
+        return self.get_teams_list()
+
+    @property
+    def team_set(self) -> FrozenSet[str]:
+        """Used to check if a team is in the team list, without scanning it
+
+        Read it once before a loop, since each read checks if the team list changed.
+        """
+        return match_schedule.get().team_set
 
     def update_timestamp(self):
         """Updates the timestamp to the most recent oplog entry timestamp"""
         last_op = self.oplog.find({}).sort("ts", pymongo.DESCENDING).limit(1)
         self.timestamp = last_op.next()["ts"]
+        self.keys_timestamp = self.timestamp
+        self.change_position = self.server.db.changes.position
+
+    def resume_from_checkpoint(self) -> None:
+        """Starts from the checkpoint saved by the server, so changes written while the server
+        was stopped are calculated"""
+        if self.server.checkpoints is not None:
+            checkpoint = self.server.checkpoints.get(self.__class__.__name__)
+        else:
+            checkpoint = self.server.db.get_checkpoints().get(self.__class__.__name__)
+        if checkpoint is None or checkpoint >= self.timestamp:
+            return
+        oldest_op = self.oplog.find({}).sort("ts", pymongo.ASCENDING).limit(1).next()
+        if oldest_op["ts"] > checkpoint:
+            log.warning(
+                f"{self.__class__.__name__}: changes since the checkpoint are no longer in the "
+                "oplog, run calculations on all data to include them"
+            )
+        self.timestamp = checkpoint
 
     def entries_since_last(self):
         """Find changes in watched collections since the last update_timestamp()
@@ -53,20 +102,81 @@ class BaseCalculations:
             )
         )
 
-    def get_updated_teams(self) -> list:
-        """Returns a list of team numbers that appear in watched_collections"""
-        teams = set()
-        for entry in self.entries_since_last():
-            # Prevents error from not having a team num
-            if "team_number" in entry["o"].keys():
-                teams.add(entry["o"]["team_number"])
-            # If the doc was updated, need to manually find the document
+    def changed_keys(self) -> change_tracker.ChangedKeys:
+        """Returns the keys that changed in watched_collections since the last call
+
+        Unlike `entries_since_last`, each change is only returned once. Changes are read from the
+        oplog, so writes by other processes are included. The keys of deleted documents are not in
+        the oplog, so they come from the deletes made by this process, see `change_tracker`.
+        """
+        local_changes = self.server.db.changes.changes_since(
+            self.change_position, self.watched_collections
+        )
+        self.change_position = local_changes.position
+        changed = change_tracker.ChangedKeys()
+        self.keys_timestamp = self.add_oplog_changes(changed, self.keys_timestamp, local_changes)
+        return changed
+
+    def add_oplog_changes(
+        self,
+        changed: change_tracker.ChangedKeys,
+        timestamp,
+        local_changes: Optional[change_tracker.ChangedKeys] = None,
+    ):
+        """Adds the keys changed in watched_collections after 'timestamp' from the oplog
+
+        Deleted documents can't be looked up, so a collection with deletes is unkeyed, unless
+        'local_changes', the changes made by this process, have the keys of as many deletes.
+        Returns the timestamp of the latest change that was added, or 'timestamp' if none were.
+        """
+        namespaces = {f"{self.server.db.name}.{c}": c for c in self.watched_collections}
+        updated_ids: Dict[str, list] = {}
+        deletes: Dict[str, int] = {}
+        for entry in self.oplog.find(
+            {
+                "ts": {"$gt": timestamp},
+                "op": {"$in": ["i", "d", "u"]},
+                "ns": {"$in": list(namespaces)},
+            }
+        ):
+            collection = namespaces[entry["ns"]]
+            timestamp = max(timestamp, entry["ts"])
+            if entry["op"] == "i":
+                changed.add(collection, change_tracker.document_keys(entry["o"]))
             elif entry["op"] == "u":
-                document_id = entry["o2"]["_id"]
-                if (
-                    query := self.server.db.find(entry["ns"].split(".")[-1], {"_id": document_id})
-                ) != [] and "team_number" in query[0].keys():
-                    teams.add(query[0]["team_number"])
+                updated_ids.setdefault(collection, []).append(entry["o2"]["_id"])
+            else:
+                deletes[collection] = deletes.get(collection, 0) + 1
+        # Updated documents are looked up together, documents deleted since are in 'deletes'
+        for collection, document_ids in updated_ids.items():
+            for document in self.server.db.find(collection, {"_id": {"$in": document_ids}}):
+                changed.add(collection, change_tracker.document_keys(document))
+        for collection, deleted in deletes.items():
+            changed.deleted_collections.add(collection)
+            if local_changes is None or deleted > local_changes.keyed_deletes.get(collection, 0):
+                changed.add(collection, None)
+        if local_changes is not None:
+            changed.update(local_changes)
+        return timestamp
+
+    def take_dirty_matches(self) -> set:
+        """Returns the matches with TBA data pushed by `tba_webhook` since the last call"""
+        return self.server.db.take_dirty_matches(self.__class__.__name__)
+
+    def get_updated_teams(self) -> list:
+        """Returns a list of team numbers with documents in watched_collections that changed"""
+        if self.calc_all_data:
+            changed_collections = self.watched_collections
+            teams = set()
+        else:
+            changed = self.changed_keys()
+            changed_collections = changed.unkeyed_collections
+            teams = changed.teams()
+        # Every team in a collection is updated when it isn't known which documents changed
+        for collection in changed_collections:
+            for document in self.server.db.find(collection):
+                if "team_number" in document:
+                    teams.add(document["team_number"])
         return list(teams)
 
     @staticmethod
@@ -111,14 +221,8 @@ class BaseCalculations:
 
     @staticmethod
     def get_teams_list():
-        try:
-            with open(f"data/{utils.TBA_EVENT_KEY}_team_list.json") as file:
-                reader = json.load(file)
-
-                return reader
-        except FileNotFoundError:
-            log.error(f"base_calculations: data/{utils.TBA_EVENT_KEY}_team_list.json not found")
-            return []
+        """Returns the team list of the event, see `match_schedule`"""
+        return list(match_schedule.get().teams)
 
     @staticmethod
     def get_aim_list():
@@ -127,20 +231,7 @@ class BaseCalculations:
         Each team dict contains alliance color and team number.
         Returns a list of dictionaries of aims with match_number, alliance_color, and team_list data.
         """
-        try:
-            with open(f"data/{utils.TBA_EVENT_KEY}_match_schedule.json") as file:
-                reader = json.load(file)
-        except FileNotFoundError:
-            log.error(
-                f"base_calculations: data/{utils.TBA_EVENT_KEY}_match_schedule.json not found"
-            )
-            return []
-        aim_list = []
-        for match in reader:
-            for alliance in ["blue", "red"]:
-                aim = {"match_number": int(match), "alliance_color": alliance[0].upper()}
-                aim["team_list"] = [
-                    team["number"] for team in reader[match]["teams"] if alliance == team["color"]
-                ]
-                aim_list.append(aim)
-        return aim_list
+        # Copied, since the schedule is shared by every calculation
+        return [
+            {**aim, "team_list": list(aim["team_list"])} for aim in match_schedule.get().aim_list
+        ]
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""Consolidates the reports of every scout for many TIMs at once.
+
+Reports are laid out as an array of TIMs by scouts by fields, with a mask of the scouts that
+reported each TIM, since TIMs can have different numbers of scouts. Each function applies the
+same rules as consolidating one field of one TIM at a time, to every field of every TIM:
+- Numbers use their mean if a scout reported it, otherwise the modes if scouts agree, and the mean
+  weighted by the reciprocal square z-score of each report if they don't
+- Booleans use the majority, and False when scouts are evenly split
+- Categories use the mode if there is only one, otherwise the category at the rounded mean of the
+  indices of the reported categories
+
+Rounding is half to even, the same as `round`.
+"""
+
+import statistics
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def stack_reports(
+    reports: Sequence[Sequence[Sequence[Any]]], field_count: int, dtype: Any = float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Lays out the reports of each TIM as an array of TIMs by scouts by fields
+
+    'reports' has a list of reports for each TIM, each with a value for each of 'field_count'
+    fields. Returns the array and the mask of the scouts that reported each TIM.
+    """
+    scout_count = max((len(tim_reports) for tim_reports in reports), default=0)
+    values = np.zeros((len(reports), scout_count, field_count), dtype)
+    mask = np.zeros((len(reports), scout_count), bool)
+    for tim_index, tim_reports in enumerate(reports):
+        if len(tim_reports) > 0:
+            values[tim_index, : len(tim_reports)] = tim_reports
+            mask[tim_index, : len(tim_reports)] = True
+    return values, mask
+
+
+def _modes(values: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the mask of the first report of each mode, and the number of times the modes were
+    reported, for each field of each TIM
+
+    'mask' has the same shape as 'values', so reports can be ignored for only some fields.
+    """
+    # equal[t, s, o, f] is whether scouts s and o reported the same value of field f
+    equal = (values[:, :, np.newaxis] == values[:, np.newaxis]) & mask[:, np.newaxis]
+    counts = np.where(mask, equal.sum(axis=2), 0)
+    max_counts = counts.max(axis=1, initial=0)
+    # A report is the first of its value if no earlier scout reported the same value
+    earlier = np.tril(np.ones((values.shape[1], values.shape[1]), bool), -1)
+    first = mask & ~(equal & earlier[np.newaxis, :, :, np.newaxis]).any(axis=2)
+    return first & (counts == max_counts[:, np.newaxis]), max_counts
+
+
+def _mean(values: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the mean of the values in 'mask', 0 if there are none, and whether it is one of
+    them"""
+    count = mask.sum(axis=1)
+    mean = np.where(mask, values, 0).sum(axis=1) / np.maximum(count, 1)
+    return mean, (mask & (values == mean[:, np.newaxis])).any(axis=1)
+
+
+def _weighted_mean(nums: List[float]) -> float:
+    """Mean of 'nums' weighted by the reciprocal square z-score of each number, computed one number
+    at a time"""
+    mean = sum(nums) / len(nums)
+    std_dev = statistics.pstdev(nums)
+    weights = [1 / ((num - mean) / std_dev) ** 2 for num in nums]
+    return sum([num * weight for num, weight in zip(nums, weights)]) / sum(weights)
+
+
+def consolidate_nums(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Returns the estimated actual value of each numeric field of each TIM, as integers"""
+    values = values.astype(float)
+    field_mask = np.broadcast_to(mask[:, :, np.newaxis], values.shape)
+    mean, mean_reported = _mean(values, field_mask)
+    # If two or more scouts agree, only the modes are consolidated
+    mode_mask, max_counts = _modes(values, field_mask)
+    selected = np.where(max_counts[:, np.newaxis] > 1, mode_mask, field_mask)
+    selected_mean, selected_mean_reported = _mean(values, selected)
+    # Weighted average, where the weight of each value is its reciprocal square z-score, so values
+    # farther from the mean count less. The mean isn't a selected value, so no z-score is zero.
+    deviations = np.where(selected, values - selected_mean[:, np.newaxis], 0)
+    std_dev = np.sqrt((deviations**2).sum(axis=1) / np.maximum(selected.sum(axis=1), 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.where(selected, 1 / (deviations / std_dev[:, np.newaxis]) ** 2, 0)
+        weighted_mean = (values * weights).sum(axis=1) / weights.sum(axis=1)
+    is_weighted = field_mask.any(axis=1) & ~mean_reported & ~selected_mean_reported
+    # Weighted means of evenly spread numbers are halfway between two integers, where the last bit
+    # decides how they are rounded. NumPy can round differently than Python in the last bit, so
+    # those are computed again the same way as for a single TIM.
+    for tim_index, field_index in zip(
+        *np.nonzero(is_weighted & (np.abs(weighted_mean % 1 - 0.5) < 1e-9))
+    ):
+        weighted_mean[tim_index, field_index] = _weighted_mean(
+            values[tim_index, selected[tim_index, :, field_index], field_index].tolist()
+        )
+    consolidated = np.where(
+        mean_reported | ~field_mask.any(axis=1),
+        mean,
+        np.where(selected_mean_reported, selected_mean, weighted_mean),
+    )
+    return np.rint(consolidated).astype(int)
+
+
+def consolidate_bools(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Returns the majority value of each boolean field of each TIM, False if scouts are evenly
+    split"""
+    values = values.astype(bool)
+    field_mask = mask[:, :, np.newaxis]
+    trues = (values & field_mask).sum(axis=1)
+    falses = (~values & field_mask).sum(axis=1)
+    return trues > falses
+
+
+def consolidate_categories(indices: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Returns the index of the consolidated category of each categorical field of each TIM
+
+    'indices' are the indices of the reported categories in the list of categories of each field,
+    -1 for reports that aren't in the list, which are ignored.
+    """
+    mask = mask[:, :, np.newaxis] & (indices >= 0)
+    values = indices.astype(float)
+    mode_mask, _ = _modes(values, mask)
+    mean, _ = _mean(values, mask)
+    # If there is only one mode, it is used, otherwise the mean of every reported category
+    only_mode = np.where(mode_mask, values, 0).sum(axis=1)
+    return np.where(mode_mask.sum(axis=1) == 1, only_mode, np.rint(mean)).astype(int)
+
+
+def category_indices(
+    reports: Sequence[Sequence[Dict[str, Any]]], categories: Dict[str, List[Any]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Lays out the index of each reported category of each TIM, -1 if it isn't in the list"""
+    lookups = [
+        {value: index for index, value in reversed(list(enumerate(category_list)))}
+        for category_list in categories.values()
+    ]
+    return stack_reports(
+        [
+            [
+                [lookup.get(report[category], -1) for category, lookup in zip(categories, lookups)]
+                for report in tim_reports
+            ]
+            for tim_reports in reports
+        ],
+        len(categories),
+        int,
+    )
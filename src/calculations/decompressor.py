@@ -11,6 +11,8 @@ import yaml
 import utils
 from calculations import base_calculations
 from calculations import qr_state
+from calculations import records
+from calculations import timeline_features
 from calculations.qr_state import QRState
 import logging
 from data_transfer import database
@@ -35,6 +37,9 @@ class Decompressor(base_calculations.BaseCalculations):
     OBJECTIVE_QR_FIELDS = _GENERIC_DATA_FIELDS.union(QRState._get_data_fields("objective_tim"))
     SUBJECTIVE_QR_FIELDS = _GENERIC_DATA_FIELDS.union(QRState._get_data_fields("subjective_aim"))
     TIMELINE_FIELDS = QRState.get_timeline_info()
+    # Store timelines in unconsolidated_obj_tim packed, as their QR string, instead of as a list
+    # of action documents, which makes the documents several times smaller
+    PACK_TIMELINES = os.environ.get("SCOUTING_SERVER_TIMELINES") == "packed"
 
     MISSING_TIM_IGNORE_FILE_PATH = utils.create_file_path("data/missing_tim_ignore.yml")
 
@@ -278,6 +283,15 @@ class Decompressor(base_calculations.BaseCalculations):
                 # add override to data for obj_tim calcs to handle
                 if qr_type == QRType.OBJECTIVE and not_overriden != {}:
                     decompressed["override"] = not_overriden
+                if qr_type == QRType.OBJECTIVE:
+                    # Extracted once here so calculations don't scan the timeline every cycle
+                    features = timeline_features.extract_features(decompressed["timeline"])
+                    if features is not None:
+                        decompressed[timeline_features.FEATURES_FIELD] = features
+                if qr_type == QRType.OBJECTIVE and self.PACK_TIMELINES:
+                    decompressed[records.PACKED_TIMELINE_FIELD] = records.pack_timeline(
+                        decompressed.pop("timeline")
+                    )
             if qr_type == QRType.OBJECTIVE:
                 output["unconsolidated_obj_tim"].extend(decompressed_qr)
             elif qr_type == QRType.SUBJECTIVE:
@@ -394,10 +408,51 @@ class Decompressor(base_calculations.BaseCalculations):
                     if {"match_number": match, "scout_id": id_} not in items_to_ignore:
                         log.warning(f"Scout ID {id_} missing from Match {match}")
 
+    def remove_corrected_qrs(self, qr_ids: list) -> list:
+        """Removes the decompressed data of raw QRs that were blocklisted or overridden after they
+        were inserted, and returns the QRs to decompress again
+
+        The data is found from the match number, scout name and team number of each QR, and only
+        the QRs with the same keys are decompressed again, so the other QRs aren't read.
+        """
+        qrs_to_decompress = {}
+        for qr_id in dict.fromkeys(qr_ids):
+            for corrected_qr in self.server.db.find("raw_qr", {"_id": qr_id}):
+                keys = qr_state.qr_keys(corrected_qr["data"])
+                if "match_number" not in keys or "scout_name" not in keys:
+                    log.warning(f"Unable to find the data of corrected QR {corrected_qr['data']}")
+                    continue
+                if "team_number" in keys:
+                    self.server.db.delete_data("unconsolidated_obj_tim", keys)
+                else:
+                    # Subjective QRs have a TIM for each team in the alliance, which are deleted
+                    # one at a time so the TIMs are recalculated
+                    for tim in self.server.db.find("subj_tim", keys):
+                        self.server.db.delete_data(
+                            "subj_tim", {**keys, "team_number": tim["team_number"]}
+                        )
+                same_keys = self.server.db.find("raw_qr", {**keys, "blocklisted": False})
+                if corrected_qr["_id"] not in [qr["_id"] for qr in same_keys]:
+                    # QRs inserted before raw QRs were indexed don't have the keys
+                    same_keys.append(corrected_qr)
+                for qr in same_keys:
+                    # Objective and subjective QRs of the same scout have different data
+                    if not qr["blocklisted"] and qr["data"][:1] == corrected_qr["data"][:1]:
+                        qrs_to_decompress[qr["_id"]] = qr
+        return list(qrs_to_decompress.values())
+
     def run(self):
+        entries = self.entries_since_last()
+        # Updates to raw QRs are blocklists and overrides, which only change the TIMs of the QR
+        corrected_ids = [entry["o2"]["_id"] for entry in entries if entry["op"] == "u"]
         new_qrs = [
-            entry["o"] for entry in self.entries_since_last() if not entry["o"]["blocklisted"]
+            entry["o"]
+            for entry in entries
+            if entry["op"] in ["i", None] and not entry["o"]["blocklisted"]
+            # The current version of corrected QRs is decompressed instead
+            and entry["o"]["_id"] not in corrected_ids
         ]
+        new_qrs.extend(self.remove_corrected_qrs(corrected_ids))
         decompressed_qrs = self.decompress_qrs(new_qrs)
 
         # Checks if two subjective scouts scouted the same alliance in a match
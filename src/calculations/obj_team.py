@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Calculate objective team data from Team in Match (TIM) data."""
 
+import compiled_schema
 import utils
 from typing import List, Dict
 from calculations import base_calculations
@@ -11,7 +12,7 @@ class OBJTeamCalc(base_calculations.BaseCalculations):
     """Runs OBJ Team calculations"""
 
     # Get the last section of each entry (so foo.bar.baz becomes baz)
-    SCHEMA = utils.unprefix_schema_dict(utils.read_schema("schema/calc_obj_team_schema.yml"))
+    SCHEMA = compiled_schema.load("schema/calc_obj_team_schema.yml").unprefixed
     TIM_SCHEMA = utils.read_schema("schema/calc_obj_tim_schema.yml")
 
     def __init__(self, server):
@@ -371,8 +372,6 @@ class OBJTeamCalc(base_calculations.BaseCalculations):
 
     def run(self):
         """Executes the OBJ Team calculations"""
-        # Get oplog entries
-        entries = self.entries_since_last()
         teams = []
         # Filter out teams that are in subj_tim but not obj_tim
         for team in self.get_updated_teams():
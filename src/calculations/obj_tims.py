@@ -5,6 +5,7 @@
 import copy
 import statistics
 import utils
+from calculations import consolidation, records, timeline_features
 from calculations.base_calculations import BaseCalculations
 from typing import List, Union, Dict
 import logging
@@ -13,6 +14,23 @@ from data_transfer import tba_communicator
 log = logging.getLogger(__name__)
 
 
+def mark_failed_supercharges(tim: records.Record) -> None:
+    """Changes the action after each supercharge to a failed score, for alliances whose grid was not
+    full, since supercharging is only possible with a full grid
+
+    The timeline features of 'tim' are removed if its timeline changes, since they no longer match.
+    """
+    timeline = tim["timeline"]
+    changed = None
+    for index in timeline.indices({"action_type": "supercharge"}):
+        # A supercharge that was changed to a failed score doesn't change the action after it
+        if index != changed and index + 1 < len(timeline):
+            timeline.set_value(index + 1, "action_type", "score_fail")
+            changed = index + 1
+    if changed is not None:
+        tim.pop(timeline_features.FEATURES_FIELD, None)
+
+
 class ObjTIMCalcs(BaseCalculations):
     schema = utils.read_schema("schema/calc_obj_tim_schema.yml")
     type_check_dict = {"float": float, "int": int, "str": str, "bool": bool}
@@ -28,81 +46,51 @@ class ObjTIMCalcs(BaseCalculations):
         but future improvements might change the algorithm to account for other alliance members,
         since TBA can give us the total action counts for the alliance
         """
-        mean = self.avg(nums)
-        if len(nums) == 0 or mean in nums:
-            # Avoid getting a divide by zero error when calculating standard deviation
-            return round(mean)
-        # If two or more scouts agree, automatically go with what they say
-        if len(nums) > len(set(nums)):
-            # Still need to consolidate, in case there are multiple modes
-            return self.consolidate_nums(self.modes(nums))
-        # Population standard deviation:
-        std_dev = statistics.pstdev(nums)
-        # Calculate weighted average, where the weight for each num is its reciprocal square z-score
-        # That way, we account less for data farther from the mean
-        z_scores = [(num - mean) / std_dev for num in nums]
-        weights = [1 / z**2 for z in z_scores]
-        float_nums = self.avg(nums, weights)
-        return round(float_nums)
+        values, mask = consolidation.stack_reports([[[num] for num in nums]], 1)
+        return int(consolidation.consolidate_nums(values, mask)[0, 0])
 
     def consolidate_bools(self, bools: list) -> bool:
         """Given a list of booleans reported by multiple scouts, returns the actual value"""
-        bools = self.modes(bools)
-        if len(bools) == 1:
-            # Go with the majority
-            return bools[0]
-        # Scouts are evenly split, so just go with False
-        return False
+        values, mask = consolidation.stack_reports([[[value] for value in bools]], 1, bool)
+        return bool(consolidation.consolidate_bools(values, mask)[0, 0])
 
     def consolidate_categorical_actions(self, unconsolidated_tims: List[Dict]):
         """Given string type obj_tims, return actual string"""
-        # Dictionary for final calculated tims
-        final_categorical_actions = {}
-        for category in self.schema["categorical_actions"]:
-            scout_categorical_actions = [scout[category] for scout in unconsolidated_tims]
-            # Enums for associated category actions and shortened representation
-            actions = self.schema["categorical_actions"][category]["list"]
-            # Turn the shortened categorical actions from the scout into full strings
-            categorical_actions = []
-            for action in scout_categorical_actions:
-                for value in actions:
-                    if value == action:
-                        categorical_actions.append(value)
-                        break
-            # If at least 2 scouts agree, take their answer
-            if len(self.modes(categorical_actions)) == 1:
-                final_categorical_actions[category] = self.modes(categorical_actions)[0]
-                continue
-
-            # Add up the indexes of the scout responses
-            category_avg = self.avg([list(actions).index(value) for value in categorical_actions])
-            # Round the average and append the correct action to the final dict
-            final_categorical_actions[category] = list(actions)[round(category_avg)]
-        return final_categorical_actions
+        return self.consolidate_all_categorical_actions([unconsolidated_tims])[0]
+
+    def consolidate_all_categorical_actions(self, tims_reports: List[List[Dict]]) -> List[dict]:
+        """Given the unconsolidated TIMs of each TIM, returns the categorical actions of each"""
+        categories = {
+            category: list(info["list"])
+            for category, info in self.schema["categorical_actions"].items()
+        }
+        indices, mask = consolidation.category_indices(tims_reports, categories)
+        consolidated = consolidation.consolidate_categories(indices, mask)
+        return [
+            {
+                category: category_list[index]
+                for category, category_list, index in zip(
+                    categories, categories.values(), tim_indices
+                )
+            }
+            for tim_indices in consolidated.tolist()
+        ]
 
     def filter_timeline_actions(self, tim: dict, **filters) -> list:
-        """Removes timeline actions that don't meet the filters and returns all the actions that do"""
-        actions = tim["timeline"]
-        for field, required_value in filters.items():
-            if field == "time":
-                # Times are given as closed intervals: either [0,134] or [135,150]
-                actions = filter(
-                    lambda action: required_value[0] <= action["time"] <= required_value[1],
-                    actions,
-                )
-            elif required_value == "score":
-                # Removes actions for which required_value is not contained within action[field] (eg score and score_cone_high)
-                actions = filter(lambda action: str(required_value) in str(action[field]), actions)
-            else:
-                # Removes actions for which action[field] != required_value
-                actions = filter(lambda action: action[field] == required_value, actions)
-            # filter returns an iterable object
-            actions = list(actions)
-        return actions
+        """Removes timeline actions that don't meet the filters and returns all the actions that do
+
+        Times are given as closed intervals: either [0,134] or [135,150]. A filter value of "score"
+        matches every action containing it, such as score_cone_high.
+        """
+        return records.as_timeline(tim["timeline"]).filter(filters, partial=["score"])
 
     def count_timeline_actions(self, tim: dict, **filters) -> int:
         """Returns the number of actions in one TIM timeline that meets the required filters"""
-        return len(self.filter_timeline_actions(tim, **filters))
+        if (features := timeline_features.get_features(tim)) is not None:
+            count = timeline_features.count_actions(features, filters, partial=["score"])
+            if count is not None:
+                return count
+        return records.as_timeline(tim["timeline"]).count(filters, partial=["score"])
 
     def total_time_between_actions(
         self, tim: dict, start_action: str, end_action: str, min_time: int
@@ -113,14 +101,20 @@ class ObjTIMCalcs(BaseCalculations):
         such as start_incap and end_climb.
         min_time is the minimum number of seconds between the two types of actions that we want to count
         """
+        features = timeline_features.get_features(tim)
         # Separate calculation for scoring cycle times
         if start_action == "score":
-            scoring_actions = self.filter_timeline_actions(tim, action_type=start_action)
+            if features is not None:
+                scoring_times = features["score_times"]
+            else:
+                scoring_times = records.as_timeline(tim["timeline"]).values(
+                    "time", {"action_type": start_action}, ["score"]
+                )
             cycle_times = []
 
             # Calculates time difference between every pair of scoring actions
-            for i in range(1, len(scoring_actions)):
-                cycle_times.append(scoring_actions[i - 1]["time"] - scoring_actions[i]["time"])
+            for i in range(1, len(scoring_times)):
+                cycle_times.append(scoring_times[i - 1] - scoring_times[i])
 
             # Calculate median cycle time (if cycle times is not an empty list)
             if cycle_times:
@@ -133,74 +127,69 @@ class ObjTIMCalcs(BaseCalculations):
 
         # Other time calculations (incap)
         else:
-            start_actions = self.filter_timeline_actions(tim, action_type=start_action)
-            end_actions = self.filter_timeline_actions(tim, action_type=end_action)
+            intervals = None
+            if features is not None:
+                intervals = timeline_features.action_intervals(features, start_action, end_action)
+            if intervals is None:
+                timeline = records.as_timeline(tim["timeline"])
+                start_times = timeline.values("time", {"action_type": start_action}, ["score"])
+                end_times = timeline.values("time", {"action_type": end_action}, ["score"])
+                intervals = zip(start_times, end_times)
             # Match scout app should automatically add an end action at the end of the match,
             # if there isn't already an end action after the last start action. That way there are the
             # same number of start actions and end actions.
             total_time = 0
-            for start, end in zip(start_actions, end_actions):
-                if start["time"] - end["time"] >= min_time:
-                    total_time += start["time"] - end["time"]
+            for start, end in intervals:
+                if start - end >= min_time:
+                    total_time += start - end
             return total_time
 
-    def calculate_tim_counts(self, unconsolidated_tims: List[Dict]) -> dict:
-        """Given a list of unconsolidated TIMs, returns the calculated count based data fields"""
-        calculated_tim = {}
-
-        for num_1, tim in enumerate(unconsolidated_tims):
+    def mark_failed_supercharges(self, unconsolidated_tims: List[records.Record]) -> None:
+        """Marks the failed supercharges of TIMs whose alliance did not fill its grid"""
+        for tim in unconsolidated_tims:
             alliance = "blue"
             if tim["alliance_color_is_red"]:
                 alliance = "red"
 
             if self.grid_status[tim["match_number"]][alliance] == False:
-                timeline = tim["timeline"]
-                for num, action_dict in enumerate(timeline):
-                    if action_dict["action_type"] == "supercharge":
-                        unconsolidated_tims[num_1]["timeline"][num + 1][
-                            "action_type"
-                        ] = "score_fail"
+                mark_failed_supercharges(tim)
 
+    def scout_counts(self, tim: records.Record) -> list:
+        """Given one unconsolidated TIM, returns the count based data fields reported by its scout,
+        in schema order"""
+        counts = []
         for calculation, filters in self.schema["timeline_counts"].items():
-            unconsolidated_counts = []
             # Variable type of a calculation is in the schema, but it's not a filter
             filters_ = copy.deepcopy(filters)
             expected_type = filters_.pop("type")
-            for tim in unconsolidated_tims:
-                new_count = self.count_timeline_actions(tim, **filters_)
-                if not isinstance(new_count, self.type_check_dict[expected_type]):
-                    raise TypeError(f"Expected {new_count} calculation to be a {expected_type}")
-                unconsolidated_counts.append(new_count)
-            calculated_tim[calculation] = self.consolidate_nums(unconsolidated_counts)
-        return calculated_tim
-
-    def calculate_tim_times(self, unconsolidated_tims: List[Dict]) -> dict:
-        """Given a list of unconsolidated TIMs, returns the calculated time data fields"""
-        calculated_tim = {}
+            new_count = self.count_timeline_actions(tim, **filters_)
+            if not isinstance(new_count, self.type_check_dict[expected_type]):
+                raise TypeError(f"Expected {new_count} calculation to be a {expected_type}")
+            counts.append(new_count)
+        return counts
+
+    def scout_times(self, tim: records.Record) -> list:
+        """Given one unconsolidated TIM, returns the time data fields reported by its scout, in
+        schema order"""
+        times = []
         for calculation, action_types in self.schema["timeline_cycle_time"].items():
-            unconsolidated_cycle_times = []
             # Variable type of a calculation is in the schema, but it's not a filter
-            filters_ = copy.deepcopy(action_types)
-            expected_type = filters_.pop("type")
-            for tim in unconsolidated_tims:
-                # action_types is a list of dictionaries, where each dictionary is
-                # "action_type" to the name of either the start or end action
-                new_cycle_time = self.total_time_between_actions(
-                    tim,
-                    action_types["start_action"],
-                    action_types["end_action"],
-                    action_types["minimum_time"],
-                )
-                if not isinstance(new_cycle_time, self.type_check_dict[expected_type]):
-                    raise TypeError(
-                        f"Expected {new_cycle_time} calculation to be a {expected_type}"
-                    )
-                unconsolidated_cycle_times.append(new_cycle_time)
-            calculated_tim[calculation] = self.consolidate_nums(unconsolidated_cycle_times)
-        return calculated_tim
+            expected_type = action_types["type"]
+            # action_types is a list of dictionaries, where each dictionary is
+            # "action_type" to the name of either the start or end action
+            new_cycle_time = self.total_time_between_actions(
+                tim,
+                action_types["start_action"],
+                action_types["end_action"],
+                action_types["minimum_time"],
+            )
+            if not isinstance(new_cycle_time, self.type_check_dict[expected_type]):
+                raise TypeError(f"Expected {new_cycle_time} calculation to be a {expected_type}")
+            times.append(new_cycle_time)
+        return times
 
     def calculate_aggregates(self, calculated_tim: List[Dict]):
-        """Given a list of consolidated tims by calculate_tim_counts, return consolidated aggregates"""
+        """Given a list of consolidated tims by calculate_tims, return consolidated aggregates"""
         final_aggregates = {}
         # Get each aggregate and its associated counts
         for aggregate, filters in self.schema["aggregates"].items():
@@ -220,39 +209,78 @@ class ObjTIMCalcs(BaseCalculations):
 
     def calculate_tim(self, unconsolidated_tims: List[Dict]) -> dict:
         """Given a list of unconsolidated TIMs, returns a calculated TIM"""
-        if len(unconsolidated_tims) == 0:
-            log.warning("calculate_tim: zero TIMs given")
-            return {}
-        calculated_tim = {}
-        calculated_tim.update(self.calculate_tim_counts(unconsolidated_tims))
-        calculated_tim.update(self.calculate_tim_times(unconsolidated_tims))
-        calculated_tim.update(self.consolidate_categorical_actions(unconsolidated_tims))
-        calculated_tim.update(self.calculate_aggregates(calculated_tim))
-        # Use any of the unconsolidated TIMs to get the team and match number,
-        # since that should be the same for each unconsolidated TIM
-        calculated_tim["match_number"] = unconsolidated_tims[0]["match_number"]
-        calculated_tim["team_number"] = unconsolidated_tims[0]["team_number"]
-        # confidence_rating is the number of scouts that scouted one robot
-        calculated_tim["confidence_ranking"] = len(unconsolidated_tims)
-        return calculated_tim
+        return self.calculate_tims([unconsolidated_tims])[0]
+
+    def calculate_tims(self, tims_reports: List[List[Dict]]) -> List[dict]:
+        """Given the unconsolidated TIMs of each TIM, returns the calculated TIMs
+
+        The reports of every TIM are consolidated together, as arrays of TIMs by scouts by fields.
+        """
+        calculated_tims = [{} for _ in tims_reports]
+        # Timelines are converted once here instead of by every count
+        tims_reports = [
+            [records.unconsolidated_tim(tim) for tim in unconsolidated_tims]
+            for unconsolidated_tims in tims_reports
+        ]
+        reported = []
+        for index, unconsolidated_tims in enumerate(tims_reports):
+            if len(unconsolidated_tims) == 0:
+                log.warning("calculate_tim: zero TIMs given")
+                continue
+            self.mark_failed_supercharges(unconsolidated_tims)
+            reported.append(index)
+        if reported == []:
+            return calculated_tims
+        reported_tims = [tims_reports[index] for index in reported]
+        count_fields = list(self.schema["timeline_counts"])
+        time_fields = list(self.schema["timeline_cycle_time"])
+        values, mask = consolidation.stack_reports(
+            [
+                [self.scout_counts(tim) + self.scout_times(tim) for tim in unconsolidated_tims]
+                for unconsolidated_tims in reported_tims
+            ],
+            len(count_fields) + len(time_fields),
+        )
+        consolidated = consolidation.consolidate_nums(values, mask).tolist()
+        categorical_actions = self.consolidate_all_categorical_actions(reported_tims)
+
+        for index, unconsolidated_tims, nums, categories in zip(
+            reported, reported_tims, consolidated, categorical_actions
+        ):
+            calculated_tim = dict(zip(count_fields + time_fields, nums))
+            calculated_tim.update(categories)
+            calculated_tim.update(self.calculate_aggregates(calculated_tim))
+            # Use any of the unconsolidated TIMs to get the team and match number,
+            # since that should be the same for each unconsolidated TIM
+            calculated_tim["match_number"] = unconsolidated_tims[0]["match_number"]
+            calculated_tim["team_number"] = unconsolidated_tims[0]["team_number"]
+            # confidence_rating is the number of scouts that scouted one robot
+            calculated_tim["confidence_ranking"] = len(unconsolidated_tims)
+            calculated_tims[index] = calculated_tim
+        return calculated_tims
 
     def update_calcs(self, tims: List[Dict[str, Union[str, int]]]) -> List[dict]:
         """Calculate data for each of the given TIMs. Those TIMs are represented as dictionaries:
         {'team_number': '1678', 'match_number': 69}"""
-        calculated_tims = []
+        tims_reports = []
+        overrides = []
         for tim in tims:
-            unconsolidated_obj_tims = self.server.db.find("unconsolidated_obj_tim", tim)
+            unconsolidated_obj_tims = [
+                records.unconsolidated_tim(document)
+                for document in self.server.db.find("unconsolidated_obj_tim", tim)
+            ]
             # Check for overriding datapoints
             override = {}
             for t in unconsolidated_obj_tims:
                 if "override" in t:
                     override.update(t.pop("override"))
-            calculated_tim = self.calculate_tim(unconsolidated_obj_tims)
-            if override != {}:
-                for edited_datapoint in override:
-                    if edited_datapoint in calculated_tim:
-                        calculated_tim[edited_datapoint] = override[edited_datapoint]
-            calculated_tims.append(calculated_tim)
+            tims_reports.append(unconsolidated_obj_tims)
+            overrides.append(override)
+        calculated_tims = self.calculate_tims(tims_reports)
+        for calculated_tim, override in zip(calculated_tims, overrides):
+            for edited_datapoint in override:
+                if edited_datapoint in calculated_tim:
+                    calculated_tim[edited_datapoint] = override[edited_datapoint]
         return calculated_tims
 
     def get_grid_status(self, matches):
@@ -280,12 +308,16 @@ class ObjTIMCalcs(BaseCalculations):
 
         # Get oplog entries
         tims = []
+        team_set = self.team_set
         # Check if changes need to be made to teams
         if (entries := self.entries_since_last()) != []:
 
             for entry in entries:
+                # Deleted TIMs are found from the changed keys
+                if "team_number" not in entry["o"]:
+                    continue
                 team_num = entry["o"]["team_number"]
-                if team_num not in self.teams_list:
+                if team_num not in team_set:
                     log.warning(f"obj_tims: team number {team_num} is not in teams list")
                     continue
                 tims.append(
@@ -294,16 +326,22 @@ class ObjTIMCalcs(BaseCalculations):
                         "match_number": entry["o"]["match_number"],
                     }
                 )
+        # TIMs with reports removed by a blocklisted or overridden QR
+        for team_num, match_num in self.changed_keys().tims():
+            if team_num in team_set:
+                tims.append({"team_number": team_num, "match_number": match_num})
         unique_tims = []
+        seen_tims = set()
         for tim in tims:
-            if tim not in unique_tims:
+            if (tim["team_number"], tim["match_number"]) not in seen_tims:
+                seen_tims.add((tim["team_number"], tim["match_number"]))
                 unique_tims.append(tim)
         # Delete and re-insert if updating all data
         if self.calc_all_data:
             self.server.db.delete_data("obj_tim")
 
         updates = self.update_calcs(unique_tims)
-        for update in updates:
+        for tim, update in zip(unique_tims, updates):
             if update != {}:
                 self.server.db.update_document(
                     "obj_tim",
@@ -313,3 +351,6 @@ class ObjTIMCalcs(BaseCalculations):
                         "match_number": update["match_number"],
                     },
                 )
+            elif not self.calc_all_data:
+                # Every report of the TIM was blocklisted
+                self.server.db.delete_data("obj_tim", tim)
@@ -69,10 +69,10 @@ class PickabilityCalc(base_calculations.BaseCalculations):
             return  # Can't calculate pickability without both
         return max(offensive_second_pickability, defensive_second_pickability)
 
-    def update_pickability(self):
-        """Creates updated pickability documents"""
+    def update_pickability(self, teams=None):
+        """Creates updated pickability documents for 'teams', defaults to the updated teams"""
         updates = []
-        for team in self.get_updated_teams():
+        for team in self.get_updated_teams() if teams is None else teams:
             # Data that is needed to calculate pickability
             team_data = {}
             # Get each calc name and search for it in the database
@@ -100,15 +100,15 @@ class PickabilityCalc(base_calculations.BaseCalculations):
     def run(self) -> None:
         """Detects when and for which teams to calculate pickabilty"""
 
-        # Finds oplog entries in the watched collections
-        entries = self.entries_since_last()
-        if entries == []:
+        # Only the teams whose data changed are recalculated
+        teams = self.get_updated_teams()
+        if teams == []:
             return
         # Delete and re-insert if updating all data
         if self.calc_all_data:
             self.server.db.delete_data("pickability")
 
-        for update in self.update_pickability():
+        for update in self.update_pickability(teams):
             self.server.db.update_document(
                 "pickability", update, {"team_number": update["team_number"]}
             )
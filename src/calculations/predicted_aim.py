@@ -464,6 +464,9 @@ class PredictedAimCalc(BaseCalculations):
             f"event/{self.server.TBA_EVENT_KEY}/alliances"
         )
         playoffs_alliances = []
+        # TBA has no alliances until alliance selection
+        if tba_playoffs_data is None:
+            return playoffs_alliances
 
         for alliance in tba_playoffs_data:
             # Add captain, 1st, and 2nd pick
@@ -639,15 +642,16 @@ class PredictedAimCalc(BaseCalculations):
             updates.append(update)
         return updates
 
-    def update_playoffs_alliances(self):
+    def update_playoffs_alliances(self, playoffs_alliances=None):
         """Runs the calculations for predicted values in playoffs matches
         obj_team is all the obj_team data in the database. tba_team is all the tba_team data in the database.
-        playoffs_alliances is a list of alliances with team numbers
+        playoffs_alliances is a list of alliances with team numbers, requested from TBA if it isn't given
         """
         updates = []
         obj_team = self.server.db.find("obj_team")
         tba_team = self.server.db.find("tba_team")
-        playoffs_alliances = self.get_playoffs_alliances()
+        if playoffs_alliances is None:
+            playoffs_alliances = self.get_playoffs_alliances()
 
         for alliance in playoffs_alliances:
             predicted_values = PredictedAimScores()
@@ -723,11 +727,24 @@ class PredictedAimCalc(BaseCalculations):
         return lambda difference: logr.predict(np.array([difference]))
 
     def run(self):
-        match_schedule = self.get_aim_list()
         # Check if changes need to be made to teams
         teams = self.get_updated_teams()
+        # Matches with scores pushed by TBA, None if alliance selection was pushed
+        dirty_matches = self.take_dirty_matches()
+        self.run_aims(teams, dirty_matches)
+        self.run_playoffs_alliances(teams)
+
+    def run_aims(self, teams, dirty_matches):
+        """Updates the predicted AIMs of the matches of 'teams' and 'dirty_matches'"""
+        # Win chances only change when team or TBA match data changes
+        if teams == [] and dirty_matches == set() and not self.calc_all_data:
+            return
+        match_schedule = self.get_aim_list()
         aims = []
         for alliance in match_schedule:
+            if alliance["match_number"] in dirty_matches:
+                aims.append(alliance)
+                continue
             for team in alliance["team_list"]:
                 if team in teams:
                     aims.append(alliance)
@@ -756,7 +773,23 @@ class PredictedAimCalc(BaseCalculations):
                 },
             )
 
-        for update in self.update_playoffs_alliances():
+    def run_playoffs_alliances(self, teams):
+        """Updates the predicted playoff alliances if team data or the alliances from TBA changed
+
+        The alliances are polled from TBA every cycle, so they are compared to the stored ones
+        instead of waiting for a team or a webhook message to change.
+        """
+        playoffs_alliances = self.get_playoffs_alliances()
+        stored_picks = {
+            alliance["alliance_num"]: alliance.get("picks")
+            for alliance in self.server.db.find("predicted_alliances")
+        }
+        polled_picks = {
+            alliance["alliance_num"]: alliance["picks"] for alliance in playoffs_alliances
+        }
+        if teams == [] and not self.calc_all_data and stored_picks == polled_picks:
+            return
+        for update in self.update_playoffs_alliances(playoffs_alliances):
             self.server.db.update_document(
                 "predicted_alliances", update, {"alliance_num": update["alliance_num"]}
             )
@@ -138,9 +138,19 @@ class PredictedTeamCalc(BaseCalculations):
         # Get oplog entries
         entries = self.entries_since_last()
         if entries != []:
-            self.server.db.delete_data("predicted_team")
             predicted_aim = self.server.db.find("predicted_aim")
-            self.server.db.insert_documents(
-                "predicted_team", self.update_predicted_team(predicted_aim)
-            )
+            updates = self.update_predicted_team(predicted_aim)
+            if self.calc_all_data:
+                self.server.db.delete_data("predicted_team")
+            else:
+                # Only teams that are no longer in the team list are deleted, the others are
+                # replaced, so teams whose predictions didn't change aren't written
+                self.server.db.delete_data(
+                    "predicted_team",
+                    {"team_number": {"$nin": [update["team_number"] for update in updates]}},
+                )
+            for update in updates:
+                self.server.db.replace_document(
+                    "predicted_team", update, {"team_number": update["team_number"]}
+                )
         self.update_timestamp()
@@ -1,6 +1,7 @@
 """This file houses a calculation class that allows the server to input data"""
 from data_transfer import adb_communicator
 import calculations.base_calculations
+from calculations import qr_state
 import utils
 
 import datetime
@@ -40,6 +41,8 @@ class QRInput(calculations.base_calculations.BaseCalculations):
             qr = [
                 {
                     "data": qr_code,
+                    # Indexed, so corrections in override_data.py don't decompress every QR
+                    **qr_state.qr_keys(qr_code),
                     "blocklisted": False,
                     "override": {},
                     "epoch_time": curr_time.timestamp(),
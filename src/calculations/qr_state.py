@@ -5,6 +5,7 @@ into a function, or calling a method, or setting the active QR state is not for
 us to decide. To reiterate, this class does NOT contain any functionality of its
 own - it should merely be a place for common QR variables, etc., to reside."""
 
+import compiled_schema
 import utils
 
 SCHEMA = utils.read_schema("schema/match_collection_qr_schema.yml")
@@ -13,6 +14,11 @@ SCHEMA = utils.read_schema("schema/match_collection_qr_schema.yml")
 In case we need to use this string more than once"""
 QR_SCHEMA_PATH = "schema/match_collection_qr_schema.yml"
 
+"""
+Fields of each section of a QR that raw QR documents are indexed by, so corrections can find a
+QR without decompressing every QR. Only objective QRs have a single team number."""
+QR_KEY_FIELDS = {"generic_data": ["match_number", "scout_name"], "objective_tim": ["team_number"]}
+
 """
 An instance of this class represents a state for all QR operations. So this stores
 QR-related variables, e.g. internal schema representations."""
@@ -36,25 +42,35 @@ class QRState:
         Filters out all entries beginning with '_' as they contain information about the
         (de)compression process, not what data fields should be present.
         """
-        data_fields = set()
-        for field in SCHEMA[section]:
-            # Filter out '_' at start of entry
-            if not field.startswith("_"):
-                data_fields.add(field)
-        return data_fields
+        return set(compiled_schema.load(QR_SCHEMA_PATH).data_fields[section])
 
     @staticmethod
     def get_timeline_info():
-        """Loads information about timeline fields."""
-        timeline_fields = []
-        for field, field_list in SCHEMA["timeline"].items():
-            field_data = {
-                "name": field,
-                "length": field_list[0],
-                "type": field_list[1],
-                "position": field_list[2],
-            }
-            timeline_fields.append(field_data)
-        # Sort timeline_fields by the position they appear in
-        timeline_fields.sort(key=lambda x: x["position"])
-        return timeline_fields
+        """Loads information about timeline fields, sorted by the position they appear in."""
+        return [dict(field) for field in compiled_schema.load(QR_SCHEMA_PATH).timeline_info]
+
+
+def qr_keys(qr: str) -> dict:
+    """Returns the fields in QR_KEY_FIELDS of a raw QR, without decompressing the rest of it.
+
+    Fields that are missing or can't be converted are left out.
+    """
+    sections = qr[1:].split(SCHEMA["generic_data"]["_section_separator"])
+    section_data = {"generic_data": sections[0].split(SCHEMA["generic_data"]["_separator"])}
+    if qr[:1] == SCHEMA["objective_tim"]["_start_character"] and len(sections) > 1:
+        section_data["objective_tim"] = sections[1].split(SCHEMA["objective_tim"]["_separator"])
+    keys = {}
+    for section, data in section_data.items():
+        for name in QR_KEY_FIELDS[section]:
+            compressed_name, type_ = SCHEMA[section][name][:2]
+            for data_field in data:
+                if data_field[:1] != compressed_name:
+                    continue
+                value = data_field[1:]
+                if type_ == "int":
+                    if value.isdecimal():
+                        keys[name] = int(value)
+                else:
+                    keys[name] = value
+                break
+    return keys
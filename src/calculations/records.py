@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+
+"""Compact record types that calculations use instead of nested dictionaries.
+
+A record stores its fields in `__slots__`, and a timeline stores each action field as a NumPy array,
+with text fields like `action_type` stored as integer codes. Record types are generated from the
+field names in the schema. Records and timeline actions can still be read like the documents they
+were made from, so code written for documents keeps working with them.
+
+Timelines can also be stored packed, as the fixed-width string they are sent as in QRs, which
+`Timeline.from_packed` decodes without building a document for each action.
+"""
+
+import functools
+import threading
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+
+import compiled_schema
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+QR_SCHEMA_PATH = "schema/match_collection_qr_schema.yml"
+# Field of unconsolidated TIMs that stores a packed timeline instead of `timeline`
+PACKED_TIMELINE_FIELD = "packed_timeline"
+# Fields of unconsolidated TIMs when the QR schema can't be loaded
+CORE_TIM_FIELDS = (
+    "alliance_color_is_red",
+    "match_number",
+    "scout_name",
+    "team_number",
+    "timeline",
+)
+
+# Marks a field that an action does not have
+_MISSING = object()
+# Codes of the text values of each timeline field, shared by every timeline in the process
+_codes: Dict[str, Dict[str, int]] = {}
+_code_values: Dict[str, List[str]] = {}
+# Held while codes are added, since calculations can decode timelines in parallel threads
+_codes_lock = threading.Lock()
+
+
+class Record:
+    """A fixed set of fields stored in `__slots__`, that can be read and written like a dictionary
+
+    Fields of a document that are not one of the fields of the record type are kept in `extra`.
+    """
+
+    __slots__ = ("extra",)
+    FIELDS: Tuple[str, ...] = ()
+    _FIELD_SET: frozenset = frozenset()
+
+    def __init__(self, **fields):
+        self.extra = {}
+        for name, value in fields.items():
+            self[name] = value
+
+    @classmethod
+    def from_document(cls, document: dict) -> "Record":
+        return cls(**document)
+
+    def to_document(self) -> dict:
+        document = {}
+        for name in self.FIELDS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                document[name] = value.to_documents() if isinstance(value, Timeline) else value
+        document.update(self.extra)
+        return document
+
+    def keys(self) -> List[str]:
+        return [name for name in self.FIELDS if hasattr(self, name)] + list(self.extra)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def pop(self, name: str, *default) -> Any:
+        try:
+            value = self[name]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        if name in self._FIELD_SET:
+            delattr(self, name)
+        else:
+            del self.extra[name]
+        return value
+
+    def __getitem__(self, name: str) -> Any:
+        if name in self._FIELD_SET:
+            try:
+                return getattr(self, name)
+            except AttributeError:
+                raise KeyError(name) from None
+        return self.extra[name]
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        if name in self._FIELD_SET:
+            setattr(self, name, value)
+        else:
+            self.extra[name] = value
+
+    def __contains__(self, name: str) -> bool:
+        return hasattr(self, name) if name in self._FIELD_SET else name in self.extra
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Record):
+            return self.to_document() == other.to_document()
+        if isinstance(other, dict):
+            return self.to_document() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_document()!r})"
+
+
+@functools.lru_cache(maxsize=None)
+def record_type(name: str, fields: Tuple[str, ...]) -> Type[Record]:
+    """Creates a record type with 'fields', which is reused for the same name and fields"""
+    # Fields that aren't valid attribute names or would hide a method are kept in `extra`
+    fields = tuple(field for field in fields if field.isidentifier() and not hasattr(Record, field))
+    return type(
+        name, (Record,), {"__slots__": fields, "FIELDS": fields, "_FIELD_SET": frozenset(fields)}
+    )
+
+
+def _code(name: str, value: str) -> int:
+    """Returns the code of the text 'value' of the timeline field 'name', adding it if it is new"""
+    code = _codes.get(name, {}).get(value)
+    if code is not None:
+        return code
+    with _codes_lock:
+        codes = _codes.setdefault(name, {})
+        if value not in codes:
+            values = _code_values.setdefault(name, [])
+            values.append(value)
+            # The value is added before its code, so a code read without the lock can be decoded
+            codes[value] = len(values) - 1
+        return codes[value]
+
+
+class Timeline:
+    """Timeline actions stored as one array for each field of the actions
+
+    Fields where every action has a bool, an int or a string are stored as bool, int64 or code
+    arrays. Other fields are stored as object arrays.
+    """
+
+    __slots__ = ("columns", "text_columns", "length", "conditions")
+
+    def __init__(self, columns: Dict[str, np.ndarray], text_columns: frozenset, length: int):
+        self.columns = columns
+        self.text_columns = text_columns
+        self.length = length
+        # Actions matching each filter that has been used, see `mask`
+        self.conditions: Dict[tuple, np.ndarray] = {}
+
+    @classmethod
+    def from_documents(cls, actions: Sequence[dict]) -> "Timeline":
+        names = {}
+        for action in actions:
+            for name in action:
+                names[name] = None
+        columns = {}
+        text_columns = set()
+        for name in names:
+            values = [action.get(name, _MISSING) for action in actions]
+            if all(type(value) is bool for value in values):
+                columns[name] = np.array(values, dtype=np.bool_)
+            elif all(type(value) is int for value in values):
+                columns[name] = np.array(values, dtype=np.int64)
+            elif all(type(value) is str for value in values):
+                columns[name] = np.array([_code(name, value) for value in values], dtype=np.int32)
+                text_columns.add(name)
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+                columns[name] = column
+        return cls(columns, frozenset(text_columns), len(actions))
+
+    @classmethod
+    def from_packed(cls, packed: str) -> "Timeline":
+        """Decodes a timeline in the fixed-width QR format, like "059AD060AO061AE"
+
+        Every action has the fields in the timeline section of the QR schema, each with a fixed
+        number of characters, so the characters are split into fields as a 2D array. Actions from
+        the first `to_teleop` action on are in teleop.
+        """
+        fields, action_length = _packed_fields()
+        if len(packed) % action_length != 0:
+            raise ValueError(f"Invalid timeline -- Timeline length invalid: {packed}")
+        length = len(packed) // action_length
+        characters = np.frombuffer(packed.encode("ascii"), dtype=np.uint8).reshape(
+            length, action_length
+        )
+        columns = {}
+        text_columns = set()
+        for name, type_, start, stop, decompressed in fields:
+            field_characters = characters[:, start:stop]
+            if type_ == "int":
+                digits = field_characters.astype(np.int64) - ord("0")
+                if ((digits < 0) | (digits > 9)).any():
+                    raise ValueError(f"Invalid timeline -- {name} is not an int: {packed}")
+                columns[name] = digits @ (10 ** np.arange(stop - start - 1, -1, -1))
+            elif decompressed is not None:
+                compressed = field_characters.copy().view(f"S{stop - start}").ravel().tolist()
+                try:
+                    codes = [decompressed[value] for value in compressed]
+                except KeyError as error:
+                    raise ValueError(f"Invalid timeline -- Unknown {name} {error}") from None
+                columns[name] = np.array(codes, dtype=np.int32)
+                text_columns.add(name)
+            else:
+                column = np.empty(length, dtype=object)
+                column[:] = [
+                    _convert_packed_value(bytes(value).decode("ascii"), type_)
+                    for value in field_characters
+                ]
+                columns[name] = column
+        in_teleop = np.zeros(length, dtype=np.bool_)
+        if "action_type" in columns and "to_teleop" in _codes.get("action_type", {}):
+            to_teleop = np.flatnonzero(columns["action_type"] == _codes["action_type"]["to_teleop"])
+            if len(to_teleop) > 0:
+                in_teleop[to_teleop[0] :] = True
+        columns["in_teleop"] = in_teleop
+        return cls(columns, frozenset(text_columns), length)
+
+    def to_documents(self) -> List[dict]:
+        return [self.action(index).to_document() for index in range(self.length)]
+
+    def value(self, index: int, name: str) -> Any:
+        """Returns field 'name' of the action at 'index', _MISSING if it does not have the field"""
+        value = self.columns[name][index]
+        if name in self.text_columns:
+            return _code_values[name][value]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def set_value(self, index: int, name: str, value: Any) -> None:
+        self.conditions.clear()
+        if name in self.text_columns and type(value) is str:
+            self.columns[name][index] = _code(name, value)
+        elif self.columns[name].dtype != object and type(value) is not type(
+            self.value(index, name)
+        ):
+            # The new value doesn't fit the array type, so the field is stored as objects instead
+            column = np.empty(self.length, dtype=object)
+            column[:] = [self.value(i, name) for i in range(self.length)]
+            column[index] = value
+            self.columns[name] = column
+            self.text_columns = self.text_columns - {name}
+        else:
+            self.columns[name][index] = value
+
+    def action(self, index: int) -> Record:
+        action_type = record_type("TimelineAction", tuple(self.columns))
+        action = action_type()
+        for name in self.columns:
+            if (value := self.value(index, name)) is not _MISSING:
+                action[name] = value
+        return action
+
+    def mask(self, filters: Dict[str, Any], partial: Collection[str] = ()) -> np.ndarray:
+        """Returns which actions match every filter
+
+        A "time" filter is a closed interval of times such as [0, 134]. Other filters match actions
+        where the field is equal to the filter value. Values in 'partial' instead match actions where
+        the field contains the value, such as "score" for "score_cone_high".
+        """
+        return self._mask(filters, partial).copy()
+
+    def _mask(self, filters: Dict[str, Any], partial: Collection[str] = ()) -> np.ndarray:
+        """Like `mask`, but the returned array may be cached and must not be modified"""
+        mask = None
+        for name, required_value in filters.items():
+            is_partial = required_value in partial
+            key = (
+                name,
+                tuple(required_value) if isinstance(required_value, list) else required_value,
+                is_partial,
+            )
+            # The same filters are used for every TIM, and many filters share conditions
+            if (condition := self.conditions.get(key)) is None:
+                condition = self.conditions[key] = self._condition(name, required_value, is_partial)
+            mask = condition if mask is None else mask & condition
+        return np.ones(self.length, dtype=np.bool_) if mask is None else mask
+
+    def _condition(self, name: str, required_value: Any, is_partial: bool) -> np.ndarray:
+        """Returns which actions match one filter"""
+        column = self.columns.get(name)
+        if column is None:
+            return np.zeros(self.length, dtype=np.bool_)
+        if name == "time":
+            times = column if column.dtype != object else self._object_values(name)
+            return (required_value[0] <= times) & (times <= required_value[1])
+        if name in self.text_columns:
+            codes = _codes[name]
+            if is_partial:
+                with _codes_lock:
+                    code_items = list(codes.items())
+                matching = [code for value, code in code_items if str(required_value) in value]
+                return np.isin(column, matching)
+            if type(required_value) is str and required_value in codes:
+                return column == codes[required_value]
+            return np.zeros(self.length, dtype=np.bool_)
+        if is_partial:
+            return np.array([str(required_value) in str(value) for value in column], np.bool_)
+        if column.dtype == object or not isinstance(required_value, (bool, int, float)):
+            return np.array([value == required_value for value in column], dtype=np.bool_)
+        return column == required_value
+
+    def _object_values(self, name: str) -> np.ndarray:
+        """Values of an object column as floats, with NaN for missing and non-numeric values"""
+        return np.array(
+            [
+                value if type(value) in (int, float) else np.nan
+                for value in self.columns[name].tolist()
+            ],
+            dtype=np.float64,
+        )
+
+    def count(self, filters: Dict[str, Any], partial: Collection[str] = ()) -> int:
+        return int(np.count_nonzero(self._mask(filters, partial)))
+
+    def indices(self, filters: Dict[str, Any], partial: Collection[str] = ()) -> List[int]:
+        return np.flatnonzero(self._mask(filters, partial)).tolist()
+
+    def filter(self, filters: Dict[str, Any], partial: Collection[str] = ()) -> List[Record]:
+        return [self.action(index) for index in self.indices(filters, partial)]
+
+    def values(self, name: str, filters: Dict[str, Any], partial: Collection[str] = ()) -> list:
+        """Returns field 'name' of every action that matches 'filters'"""
+        return [self.value(index, name) for index in self.indices(filters, partial)]
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[Record]:
+        return (self.action(index) for index in range(self.length))
+
+    def __getitem__(self, index: int) -> Record:
+        if not -self.length <= index < self.length:
+            raise IndexError("timeline index out of range")
+        return self.action(index % self.length)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (Timeline, list)):
+            return self.to_documents() == (
+                other.to_documents() if isinstance(other, Timeline) else other
+            )
+        return NotImplemented
+
+
+@functools.lru_cache(maxsize=None)
+def _packed_fields() -> Tuple[List[tuple], int]:
+    """Where each timeline field is in a packed action, and the length of a packed action
+
+    Each field is (name, type, start, stop, codes), where codes are the codes of the text values of
+    an Enum field by their compressed value, and None for other fields.
+    """
+    qr_schema = compiled_schema.load(QR_SCHEMA_PATH)
+    fields = []
+    start = 0
+    for field in qr_schema.timeline_info:
+        codes = None
+        if "Enum" in field["type"]:
+            codes = {
+                (value if isinstance(value, str) else value[0]).encode("ascii"): _code(
+                    field["name"], key
+                )
+                for key, value in qr_schema.schema[field["name"]].items()
+            }
+        fields.append((field["name"], field["type"], start, start + field["length"], codes))
+        start += field["length"]
+    return fields, start
+
+
+def _convert_packed_value(value: str, type_: str) -> Any:
+    """Converts a field of a packed action that is not an int or Enum"""
+    if type_ == "float":
+        return float(value)
+    if type_ == "bool":
+        return utils.get_bool(value)
+    return value
+
+
+def as_timeline(timeline: Any) -> Timeline:
+    """Returns 'timeline' as a Timeline, decoding it if it is packed or a list of action documents"""
+    if isinstance(timeline, Timeline):
+        return timeline
+    if isinstance(timeline, str):
+        return Timeline.from_packed(timeline)
+    return Timeline.from_documents(list(timeline))
+
+
+def pack_timeline(timeline: Iterable[dict]) -> str:
+    """Encodes timeline actions in the fixed-width QR format that `Timeline.from_packed` decodes
+
+    `in_teleop` is not stored, since it is decoded from the position of the `to_teleop` action.
+    """
+    qr_schema = compiled_schema.load(QR_SCHEMA_PATH)
+    packed = []
+    for action in timeline:
+        for field in qr_schema.timeline_info:
+            value = action[field["name"]]
+            if "Enum" in field["type"]:
+                compressed = qr_schema.schema[field["name"]][value]
+                packed.append(compressed if isinstance(compressed, str) else compressed[0])
+            else:
+                value = str(int(value)) if field["type"] == "bool" else str(value)
+                if len(value) > field["length"]:
+                    raise ValueError(f"{field['name']} {value} does not fit in a packed timeline")
+                packed.append(value.rjust(field["length"], "0"))
+    return "".join(packed)
+
+
+@functools.lru_cache(maxsize=None)
+def tim_fields() -> Tuple[str, ...]:
+    """Fields of unconsolidated TIMs, from the generic and objective sections of the QR schema"""
+    schema = compiled_schema.load(QR_SCHEMA_PATH)
+    if schema is None:
+        return CORE_TIM_FIELDS
+    fields = set(CORE_TIM_FIELDS)
+    for section in ["generic_data", "objective_tim"]:
+        fields.update(schema.data_fields.get(section, ()))
+    return tuple(sorted(fields))
+
+
+def unconsolidated_tim(document: Any) -> Record:
+    """Returns an unconsolidated TIM document as a record, with its timeline as a Timeline"""
+    if isinstance(document, Record):
+        return document
+    tim = record_type("UnconsolidatedTIM", tim_fields()).from_document(document)
+    if PACKED_TIMELINE_FIELD in tim:
+        tim["timeline"] = Timeline.from_packed(tim.pop(PACKED_TIMELINE_FIELD))
+    elif "timeline" in tim:
+        tim["timeline"] = as_timeline(tim["timeline"])
+    return tim
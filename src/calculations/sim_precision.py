@@ -250,12 +250,23 @@ class SimPrecisionCalc(BaseCalculations):
         entries = self.entries_since_last()
         sims = []
         for entry in entries:
+            # Deleted totals don't have a scout name in the oplog
+            if "scout_name" not in entry["o"]:
+                continue
             sims.append(
                 {
                     "scout_name": entry["o"]["scout_name"],
                     "match_number": entry["o"]["match_number"],
                 }
             )
+        # Scores pushed by TBA change the precision of every scout in the match
+        if dirty_matches := self.take_dirty_matches() - {None}:
+            for sim in self.server.db.find(
+                "unconsolidated_totals", {"match_number": {"$in": list(dirty_matches)}}
+            ):
+                sim = {"scout_name": sim["scout_name"], "match_number": sim["match_number"]}
+                if sim not in sims:
+                    sims.append(sim)
         # Delete and re-insert if updating all data
         if self.calc_all_data:
             self.server.db.delete_data("sim_precision")
@@ -4,6 +4,7 @@
 
 from typing import Dict, List
 from calculations import base_calculations
+import compiled_schema
 import utils
 from server import Server
 from data_transfer import tba_communicator
@@ -19,7 +20,7 @@ class TBATeamCalc(base_calculations.BaseCalculations):
     """Runs TBA Team calculations"""
 
     # Get the last section of each entry (so foo.bar.baz becomes baz)
-    SCHEMA = utils.unprefix_schema_dict(utils.read_schema("schema/calc_tba_team_schema.yml"))
+    SCHEMA = compiled_schema.load("schema/calc_tba_team_schema.yml").unprefixed
 
     def __init__(self, server):
         """Overrides watched collections, passes server object"""
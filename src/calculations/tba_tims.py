@@ -6,6 +6,7 @@ import copy
 from typing import List, Dict, Tuple, Any
 
 from calculations import base_calculations
+import compiled_schema
 from data_transfer import tba_communicator
 import utils
 from server import Server
@@ -17,7 +18,7 @@ log = logging.getLogger(__name__)
 class TBATIMCalc(base_calculations.BaseCalculations):
     """Runs TBA Tim calculations"""
 
-    SCHEMA = utils.unprefix_schema_dict(utils.read_schema("schema/calc_tba_tim_schema.yml"))["tba"]
+    SCHEMA = compiled_schema.load("schema/calc_tba_tim_schema.yml").unprefixed["tba"]
 
     def __init__(self, server):
         """Creates an empty list to add references of calculated tims to"""
@@ -33,6 +34,9 @@ class TBATIMCalc(base_calculations.BaseCalculations):
         """
         tba_match_data = tba_communicator.tba_request(f"event/{Server.TBA_EVENT_KEY}/matches")
         not_calculated: List[Dict[str, Any]] = []
+        # Matches whose scores were pushed by TBA, which could have changed after they were
+        # calculated
+        dirty_matches = self.take_dirty_matches()
 
         # Go through the matches that it pulled from tba to check if the each
         # team in match has been calculated already
@@ -43,7 +47,10 @@ class TBATIMCalc(base_calculations.BaseCalculations):
             if self.calc_all_data:
                 not_calculated.append(match)
             # If we only want to run calcs on new data, check if the reference is already calculated
-            elif match["match_number"] not in self.calculated:
+            elif (
+                match["match_number"] not in self.calculated
+                or match["match_number"] in dirty_matches
+            ):
                 # Add the actual match data to the not_calculated list, to
                 # be calculated when called by update_calc_tba_tims
                 not_calculated.append(match)
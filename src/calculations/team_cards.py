@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Keeps one merged document per team with the fields of every team collection.
+
+Exports and viewers used to merge the team collections themselves, reading every document of each
+one. Team cards are kept up to date from the oplog instead, so only the cards of teams whose data
+changed are rebuilt, and consumers read one document per team. When the same field is in more
+than one collection, the value from the collection that is later in `SOURCE_COLLECTIONS` is used.
+Cards are replaced in place, and the collection is only emptied when all data is rebuilt into a
+shadow collection, so readers never see it empty.
+"""
+
+from typing import Dict, Iterable, List, Set
+
+from calculations.base_calculations import BaseCalculations
+from data_transfer import database
+import logging
+
+log = logging.getLogger(__name__)
+
+SOURCE_COLLECTIONS = [
+    "raw_obj_pit",
+    "obj_team",
+    "subj_team",
+    "tba_team",
+    "pickability",
+    "predicted_team",
+]
+
+
+class TeamCardCalc(BaseCalculations):
+    def __init__(self, server):
+        super().__init__(server)
+        self.watched_collections = SOURCE_COLLECTIONS
+
+    def all_teams(self) -> Set[str]:
+        """Returns every team with a document in the source collections"""
+        teams = set()
+        for collection in SOURCE_COLLECTIONS:
+            for document in self.server.db.find(collection):
+                if "team_number" in document:
+                    teams.add(str(document["team_number"]))
+        return teams
+
+    def build_cards(self, teams: Iterable[str]) -> List[Dict]:
+        """Merges the documents of 'teams' from each source collection"""
+        teams = sorted(teams)
+        cards: Dict[str, Dict] = {}
+        for collection in SOURCE_COLLECTIONS:
+            for document in self.server.db.find(collection, {"team_number": {"$in": teams}}):
+                card = cards.setdefault(str(document["team_number"]), {})
+                card.update((field, value) for field, value in document.items() if field != "_id")
+        return [{**card, "team_number": team} for team, card in sorted(cards.items())]
+
+    def run(self):
+        if self.calc_all_data:
+            # Rebuilt into a shadow collection, so the current cards stay readable until the swap
+            self.server.db.delete_data(database.TEAM_CARD_COLLECTION)
+            teams = self.all_teams()
+        else:
+            # Includes pit data, which is written by other scripts
+            changed = self.changed_keys()
+            if changed.unkeyed_collections:
+                # The changed teams aren't known, so every card is rebuilt in place
+                teams = self.all_teams()
+                self.server.db.delete_data(
+                    database.TEAM_CARD_COLLECTION, {"team_number": {"$nin": sorted(teams)}}
+                )
+            else:
+                # Includes the teams of documents deleted by this process
+                teams = {str(team) for team in changed.teams()}
+        if teams == set():
+            return
+        cards = self.build_cards(teams)
+        # Cards are replaced, so fields of deleted documents are removed from them
+        for card in cards:
+            self.server.db.replace_document(
+                database.TEAM_CARD_COLLECTION, card, {"team_number": card["team_number"]}
+            )
+        # Teams that have no documents left
+        removed = teams - {card["team_number"] for card in cards}
+        if removed:
+            self.server.db.delete_data(
+                database.TEAM_CARD_COLLECTION, {"team_number": {"$in": sorted(removed)}}
+            )
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+"""Features of a timeline that are extracted once, when its unconsolidated TIM is inserted.
+
+Calculations that used to scan every timeline each cycle read these instead:
+- Action counts overall and for each phase (auto or teleop), for counts filtered by action type and
+  phase
+- The time of each scoring action, for cycle times
+- The start and end time of each incap, for incap time
+- The auto actions, for auto paths
+
+Features are stored in the `timeline_features` field of the unconsolidated TIM. Counts with other
+filters, and TIMs whose features are missing or from another version, use the timeline instead.
+"""
+
+from typing import Any, Collection, Dict, List, Optional
+
+from calculations import records
+import logging
+
+log = logging.getLogger(__name__)
+
+FEATURES_FIELD = "timeline_features"
+# Changed when the stored features change, so features stored by older versions are not used
+FEATURES_VERSION = 1
+# Filters that can be answered from the action counts
+COUNT_FILTERS = {"action_type", "in_teleop"}
+
+
+def phase(in_teleop: bool) -> str:
+    return "teleop" if in_teleop else "auto"
+
+
+def extract_features(timeline: Any) -> Optional[dict]:
+    """Returns the features of 'timeline', or None if its actions don't all have an action type,
+    time and phase"""
+    timeline = records.as_timeline(timeline)
+    if len(timeline) == 0:
+        actions = []
+    elif "action_type" in timeline.text_columns and all(
+        name in timeline.columns and timeline.columns[name].dtype != object
+        for name in ["time", "in_teleop"]
+    ):
+        actions = list(
+            zip(
+                timeline.values("action_type", {}),
+                timeline.values("time", {}),
+                timeline.values("in_teleop", {}),
+            )
+        )
+    else:
+        return None
+    action_counts: Dict[str, int] = {}
+    phase_action_counts: Dict[str, Dict[str, int]] = {"auto": {}, "teleop": {}}
+    score_times = []
+    start_incaps, end_incaps = [], []
+    for action_type, time, in_teleop in actions:
+        action_counts[action_type] = action_counts.get(action_type, 0) + 1
+        phase_counts = phase_action_counts[phase(in_teleop)]
+        phase_counts[action_type] = phase_counts.get(action_type, 0) + 1
+        if "score" in action_type:
+            score_times.append(time)
+        elif action_type == "start_incap":
+            start_incaps.append(time)
+        elif action_type == "end_incap":
+            end_incaps.append(time)
+    return {
+        "version": FEATURES_VERSION,
+        "action_counts": action_counts,
+        "phase_action_counts": phase_action_counts,
+        "score_times": score_times,
+        # Incaps are paired in order, the same as when incap time is calculated from the timeline
+        "incap_intervals": [list(interval) for interval in zip(start_incaps, end_incaps)],
+        "auto_timeline": [action.to_document() for action in timeline.filter({"in_teleop": False})],
+    }
+
+
+def get_features(tim: Any) -> Optional[dict]:
+    """Returns the features stored in 'tim', None if it has none from this version"""
+    features = tim.get(FEATURES_FIELD)
+    if not isinstance(features, dict) or features.get("version") != FEATURES_VERSION:
+        return None
+    return features
+
+
+def count_actions(
+    features: dict, filters: Dict[str, Any], partial: Collection[str] = ()
+) -> Optional[int]:
+    """Returns the number of actions matching 'filters', the same as `Timeline.count`
+
+    Returns None if the filters can't be answered from the action counts.
+    """
+    if not set(filters) <= COUNT_FILTERS:
+        return None
+    if "in_teleop" in filters:
+        if not isinstance(filters["in_teleop"], bool):
+            return None
+        counts = features["phase_action_counts"][phase(filters["in_teleop"])]
+    else:
+        counts = features["action_counts"]
+    if "action_type" not in filters:
+        return sum(counts.values())
+    required_type = filters["action_type"]
+    if required_type in partial:
+        return sum(
+            count for action_type, count in counts.items() if str(required_type) in action_type
+        )
+    return counts.get(required_type, 0)
+
+
+def action_intervals(features: dict, start_action: str, end_action: str) -> Optional[List[list]]:
+    """Returns the start and end times of pairs of actions, None if they are not in the features"""
+    if (start_action, end_action) == ("start_incap", "end_incap"):
+        return features["incap_intervals"]
+    return None
@@ -1,11 +1,12 @@
 # Copyright (c) 2023 FRC Team 1678: Citrus Circuits
 
-import copy
 import utils
+from calculations import records, timeline_features
 from calculations.base_calculations import BaseCalculations
+from calculations.obj_tims import mark_failed_supercharges
 from typing import List, Union, Dict
 import logging
-from data_transfer import tba_communicator
+from data_transfer import change_tracker, tba_communicator
 
 log = logging.getLogger(__name__)
 
@@ -19,25 +20,18 @@ class UnconsolidatedTotals(BaseCalculations):
         self.watched_collections = ["unconsolidated_obj_tim"]
 
     def filter_timeline_actions(self, tim: dict, **filters) -> list:
-        """Removes timeline actions that don't meet the filters and returns all the actions that do"""
-        actions = tim["timeline"]
-        for field, required_value in filters.items():
-            if field == "time":
-                # Times are given as closed intervals: either [0,134] or [135,150]
-                actions = filter(
-                    lambda action: required_value[0] <= action["time"] <= required_value[1],
-                    actions,
-                )
-            else:
-                # Removes actions for which action[field] != required_value
-                actions = filter(lambda action: action[field] == required_value, actions)
-            # filter returns an iterable object
-            actions = list(actions)
-        return actions
+        """Removes timeline actions that don't meet the filters and returns all the actions that do
+
+        Times are given as closed intervals: either [0,134] or [135,150]
+        """
+        return records.as_timeline(tim["timeline"]).filter(filters)
 
     def count_timeline_actions(self, tim: dict, **filters) -> int:
         """Returns the number of actions in one TIM timeline that meets the required filters"""
-        return len(self.filter_timeline_actions(tim, **filters))
+        if (features := timeline_features.get_features(tim)) is not None:
+            if (count := timeline_features.count_actions(features, filters)) is not None:
+                return count
+        return records.as_timeline(tim["timeline"]).count(filters)
 
     def calculate_unconsolidated_tims(self, unconsolidated_tims: List[Dict]):
         """Given a list of unconsolidated TIMS, returns the unconsolidated calculated TIMs"""
@@ -45,18 +39,14 @@ class UnconsolidatedTotals(BaseCalculations):
             log.warning("calculate_tim: zero TIMs given")
             return {}
 
-        for num_1, tim in enumerate(unconsolidated_tims):
+        unconsolidated_tims = [records.unconsolidated_tim(tim) for tim in unconsolidated_tims]
+        for tim in unconsolidated_tims:
             alliance = "blue"
             if tim["alliance_color_is_red"]:
                 alliance = "red"
 
             if self.grid_status[tim["match_number"]][alliance] == False:
-                timeline = tim["timeline"]
-                for num, action_dict in enumerate(timeline):
-                    if action_dict["action_type"] == "supercharge":
-                        unconsolidated_tims[num_1]["timeline"][num + 1][
-                            "action_type"
-                        ] = "score_fail"
+                mark_failed_supercharges(tim)
 
         unconsolidated_totals = []
         # Calculates unconsolidated tim counts
@@ -66,22 +56,23 @@ class UnconsolidatedTotals(BaseCalculations):
             tim_totals["match_number"] = tim["match_number"]
             tim_totals["team_number"] = tim["team_number"]
             tim_totals["alliance_color_is_red"] = tim["alliance_color_is_red"]
-            # Calculate unconsolidated tim counts
-            for aggregate, filters in self.schema["aggregates"].items():
-                total_count = 0
-                aggregate_counts = filters["counts"]
+            # Calculate unconsolidated tim counts, which are only stored with aggregates
+            if self.schema["aggregates"]:
                 for calculation, filters in self.schema["timeline_counts"].items():
-                    filters_ = copy.deepcopy(filters)
-                    expected_type = filters_.pop("type")
+                    filters_ = {field: value for field, value in filters.items() if field != "type"}
                     new_count = self.count_timeline_actions(tim, **filters_)
-                    if not isinstance(new_count, self.type_check_dict[expected_type]):
-                        raise TypeError(f"Expected {new_count} calculation to be a {expected_type}")
+                    if not isinstance(new_count, self.type_check_dict[filters["type"]]):
+                        raise TypeError(
+                            f"Expected {new_count} calculation to be a {filters['type']}"
+                        )
                     tim_totals[calculation] = new_count
-                    # Calculate unconsolidated aggregates
-                    for count in aggregate_counts:
-                        if calculation == count:
-                            total_count += new_count
-                    tim_totals[aggregate] = total_count
+            # Calculate unconsolidated aggregates
+            for aggregate, filters in self.schema["aggregates"].items():
+                tim_totals[aggregate] = sum(
+                    tim_totals[count]
+                    for count in filters["counts"]
+                    if count in self.schema["timeline_counts"]
+                )
             # Calculate unconsolidated categorical actions
             for category in self.schema["categorical_actions"]:
                 tim_totals[category] = tim[category]
@@ -113,6 +104,27 @@ class UnconsolidatedTotals(BaseCalculations):
 
         return grid_status
 
+    def remove_deleted_reports(self, changed: change_tracker.ChangedKeys) -> None:
+        """Deletes the totals of reports that were removed by a blocklisted or overridden QR"""
+        report_fields = ["team_number", "match_number", "scout_name"]
+        reports = {
+            tuple(keys[field] for field in report_fields)
+            for keys in changed.changes
+            if all(field in keys for field in report_fields)
+        }
+        if reports == set():
+            return
+        # The reports that still exist are found with one query
+        existing = {
+            tuple(document.get(field) for field in report_fields)
+            for document in self.server.db.find(
+                "unconsolidated_obj_tim",
+                {"$or": [dict(zip(report_fields, report)) for report in sorted(reports)]},
+            )
+        }
+        for report in sorted(reports - existing):
+            self.server.db.delete_data("unconsolidated_totals", dict(zip(report_fields, report)))
+
     def run(self):
         """Executes the OBJ TIM calculations"""
 
@@ -126,9 +138,13 @@ class UnconsolidatedTotals(BaseCalculations):
         tims = []
         # Check if changes need to be made to teams
         if (entries := self.entries_since_last()) != []:
+            team_set = self.team_set
             for entry in entries:
+                # Deleted reports are found from the changed keys
+                if "team_number" not in entry["o"]:
+                    continue
                 team_num = entry["o"]["team_number"]
-                if team_num not in self.teams_list:
+                if team_num not in team_set:
                     log.warning(f"obj_tims: team number {team_num} is not in teams list")
                     continue
                 tims.append(
@@ -141,9 +157,12 @@ class UnconsolidatedTotals(BaseCalculations):
         for tim in tims:
             if tim not in unique_tims:
                 unique_tims.append(tim)
+        changed = self.changed_keys()
         # Delete and re-insert if updating all data
         if self.calc_all_data:
             self.server.db.delete_data("unconsolidated_totals")
+        else:
+            self.remove_deleted_reports(changed)
 
         updates = self.update_calcs(unique_tims)
         if len(updates) > 1:
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""Parses schema files once and caches them with the lookup structures derived from them.
+
+Parsing YAML is slow, and every server process used to parse each schema it uses and then build
+the same lookup structures from it. A compiled schema holds the parsed file along with those
+structures, and is saved to a binary cache file in data/schema_cache. The cache file is used until
+the modification time or size of the schema file changes, so loading a schema that has not changed
+only unpickles the cache file.
+"""
+
+import os
+import pickle
+from typing import Dict, FrozenSet, List, Optional
+
+import yaml
+
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+CACHE_DIRECTORY = "data/schema_cache"
+# Changed when the structures in CompiledSchema change, so older cache files are not used
+COMPILED_VERSION = 1
+
+# The C YAML parser is much faster, but is only available if PyYAML was built with libyaml
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Schema files that have been loaded by this process
+_compiled_schemas: Dict[str, Optional["CompiledSchema"]] = {}
+
+
+def mongo_convert(sch):
+    """Converts a schema dictionary into a mongo-usable form."""
+    # Dictionary for translating data types in schema to recognized BSON types
+    type_to_bson = {
+        "int": "int",
+        "float": "number",
+        "str": "string",
+        "bool": "bool",
+        "List": "array",
+    }
+    out = {}
+    out["bsonType"] = "object"
+    out["required"] = []
+    out["properties"] = {}
+    for section, datapoints in sch.items():
+        # These sections aren't stored in the database; ignore them
+        if section in ["schema_file", "enums"]:
+            continue
+        for datapoint, info in datapoints.items():
+            datapoint_dict = {}
+            # Every document should have a team number, match number, and/or scout name depending on collection
+            if datapoint in ["team_number", "match_number", "scout_name"]:
+                out["required"].append(datapoint)
+            # Enums include their data type in brackets. Ex: Enum[int] is int.
+            datapoint_dict["bsonType"] = type_to_bson[
+                t[5:-1] if "Enum" in (t := info["type"]) else t
+            ]
+            out["properties"].update({datapoint: datapoint_dict})
+    return out
+
+
+class CompiledSchema:
+    """A parsed schema file and the lookup structures that are derived from it"""
+
+    def __init__(self, path: str, schema: dict):
+        self.path = path
+        self.schema = schema
+        self.unprefixed = utils.unprefix_schema_dict(schema)
+        # Data fields of each section, without the fields starting with '_' that contain
+        # information about the (de)compression process
+        self.data_fields: Dict[str, FrozenSet[str]] = {
+            section: frozenset(field for field in fields if not field.startswith("_"))
+            for section, fields in schema.items()
+            if isinstance(fields, dict)
+        }
+        self.timeline_info = self._get_timeline_info()
+        self.mongo = self._get_mongo_schema()
+
+    def _get_timeline_info(self) -> List[dict]:
+        """Timeline fields of a QR schema, in the order they appear in a timeline"""
+        timeline_fields = []
+        for field, field_list in self.schema.get("timeline", {}).items():
+            timeline_fields.append(
+                {
+                    "name": field,
+                    "length": field_list[0],
+                    "type": field_list[1],
+                    "position": field_list[2],
+                }
+            )
+        timeline_fields.sort(key=lambda field: field["position"])
+        return timeline_fields
+
+    def _get_mongo_schema(self) -> Optional[dict]:
+        """MongoDB validation schema of a collection schema, None for other schema files"""
+        try:
+            return mongo_convert(self.schema)
+        except (AttributeError, KeyError, TypeError):
+            return None
+
+
+def _cache_path(schema_file_path: str) -> str:
+    cache_name = schema_file_path.replace("/", "_").replace("\\", "_")
+    return utils.create_file_path(f"{CACHE_DIRECTORY}/{cache_name}.pickle")
+
+
+def compile_schema(schema_file_path: str) -> Optional[CompiledSchema]:
+    """Compiles a schema file, using the cache file if the schema file has not changed since"""
+    full_path = utils.create_file_path(schema_file_path, False)
+    try:
+        stat = os.stat(full_path)
+    except FileNotFoundError:
+        log.error(f"Schema file {schema_file_path} not found")
+        return None
+    cache_key = (COMPILED_VERSION, stat.st_mtime_ns, stat.st_size)
+    cache_path = _cache_path(schema_file_path)
+    try:
+        with open(cache_path, "rb") as cache_file:
+            cached_key, compiled = pickle.load(cache_file)
+        if cached_key == cache_key:
+            return compiled
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        # The cache file is missing, or is from an incompatible version of this module
+        pass
+
+    with open(full_path) as schema_file:
+        compiled = CompiledSchema(schema_file_path, yaml.load(schema_file, YAML_LOADER))
+    # Written to a temporary file first so other processes never read a partial cache file
+    temporary_path = f"{cache_path}.{os.getpid()}"
+    try:
+        with open(temporary_path, "wb") as cache_file:
+            pickle.dump((cache_key, compiled), cache_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+    except OSError as e:
+        log.warning(f"Unable to write schema cache for {schema_file_path}: {e}")
+    return compiled
+
+
+def load(schema_file_path: str) -> Optional[CompiledSchema]:
+    """Returns the compiled form of a schema file, compiling it only once per process"""
+    if schema_file_path not in _compiled_schemas:
+        _compiled_schemas[schema_file_path] = compile_schema(schema_file_path)
+    return _compiled_schemas[schema_file_path]
+
+
+def clear_cache() -> None:
+    """Removes the cache files and the schemas loaded by this process"""
+    _compiled_schemas.clear()
+    cache_directory = utils.create_file_path(CACHE_DIRECTORY)
+    for cache_name in os.listdir(cache_directory):
+        os.remove(os.path.join(cache_directory, cache_name))
+
+
+if __name__ == "__main__":
+    # Compiles every schema so the server tools don't need to on their first run
+    for schema_name in sorted(os.listdir(utils.create_file_path("schema", False))):
+        if schema_name.endswith(".yml"):
+            load(f"schema/{schema_name}")
+            print(f"Compiled schema/{schema_name}")
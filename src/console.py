@@ -2,30 +2,111 @@
 This file is responsible for setting up and configuring the logging system for the program.
 The logging system is used to log messages during the program's execution, including errors and important events.
 The messages are logged to both the console and a log file.
+
+Logging calls only put the record on a queue. A background thread renders it to the console and
+writes it to the log file, so calculations don't wait on the terminal or the disk. The console
+shows at most `console_rate_limit` messages per second below WARNING; the rest are only in the log
+file. Levels of each module are set in src/logging_config.yml.
 """
 
 from rich.console import Console
 import logging
+import logging.handlers
 from rich.logging import RichHandler
+import atexit
+import copy
+import queue
 import time
 import os
 
+import yaml
+
+import utils
+
 # Initialize the console for logging
 console = Console()
 
 # Set the format for the log messages
 FORMAT = "%(message)s"
 
-# Create the logs directory if it doesn't exist
-os.makedirs("data/logs", exist_ok=True)
-
-# Configure the logging system
-logging.basicConfig(
-    level="NOTSET",
-    format=FORMAT,
-    datefmt="[%X]",
-    handlers=[
-        RichHandler(console=console, rich_tracebacks=True),
-        logging.FileHandler(f"data/logs/{int(time.time())}"),
-    ],
-)
+LOGGING_CONFIG_FILE = utils.create_file_path("src/logging_config.yml")
+DEFAULT_CONFIG = {"level": "NOTSET", "console_rate_limit": 50, "modules": {}}
+
+
+def load_config(path: str = LOGGING_CONFIG_FILE) -> dict:
+    """Returns the logging config, with defaults for missing settings"""
+    try:
+        with open(path) as config_file:
+            config = yaml.safe_load(config_file) or {}
+    except FileNotFoundError:
+        config = {}
+    return {**DEFAULT_CONFIG, **config}
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most 'rate' records below WARNING per second
+
+    The number of records that were left out is shown with the next record that is let through.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.tokens = rate
+        self.last_time = time.monotonic()
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+        if record.levelno < logging.WARNING:
+            if self.tokens < 1:
+                self.dropped += 1
+                return False
+            self.tokens -= 1
+        if self.dropped > 0:
+            record.msg = f"({self.dropped} messages only in the log file) {record.msg}"
+            self.dropped = 0
+        return True
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """Queues records without formatting them, since they stay in this process
+
+    Only the message is filled in, since its arguments could change before it is rendered. The
+    traceback is kept so the console can render it.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(config: dict) -> logging.handlers.QueueListener:
+    """Sends log records through a queue to handlers on a background thread"""
+    # Create the logs directory if it doesn't exist
+    os.makedirs("data/logs", exist_ok=True)
+    console_handler = RichHandler(console=console, rich_tracebacks=True)
+    console_handler.setFormatter(logging.Formatter(FORMAT, datefmt="[%X]"))
+    if config["console_rate_limit"]:
+        console_handler.addFilter(RateLimitFilter(config["console_rate_limit"]))
+    file_handler = logging.FileHandler(f"data/logs/{int(time.time())}")
+    file_handler.setFormatter(logging.Formatter(FORMAT, datefmt="[%X]"))
+    log_queue = queue.SimpleQueue()
+    # The file is written first, since the console filter adds to the messages it lets through
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    root = logging.getLogger()
+    root.setLevel(config["level"])
+    root.addHandler(LocalQueueHandler(log_queue))
+    for module, level in config["modules"].items():
+        logging.getLogger(module).setLevel(level)
+    listener.start()
+    # Writes the records that are still queued when the program exits
+    atexit.register(listener.stop)
+    return listener
+
+
+listener = setup_logging(load_config())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""Tracks which keys of which collections change, so calculations only recompute what changed.
+
+Every write through `database.Database` records the keys of the documents it changed. The keys are
+teams, TIMs (team and match), AIMs (match and alliance) and scouts, from the `team_number`,
+`match_number`, `alliance_color_is_red` and `scout_name` fields. A calculation keeps its position
+in the changes, and gets the keys that changed in its watched collections since then, without
+reading the oplog or looking up the documents that changed.
+
+Writes that can't be traced to keys, such as deleting every document of a collection, mark the
+whole collection as changed. Only writes made by this process are tracked, so calculations read the
+oplog for every change, and use these keys for the changes the oplog can't be traced back to, which
+are the documents deleted by this process. See `BaseCalculations.changed_keys`.
+
+Calculations can run in parallel threads while all data is rebuilt, so each tracker is locked.
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import logging
+
+log = logging.getLogger(__name__)
+
+KEY_FIELDS = ("team_number", "match_number", "alliance_color_is_red", "scout_name")
+
+# Trackers of each database name, shared by every `Database` in the process
+_trackers: Dict[str, "ChangeTracker"] = {}
+_trackers_lock = threading.Lock()
+
+
+def document_keys(document: dict) -> Dict[str, object]:
+    """Returns the key fields of 'document'
+
+    Fields of queries that use operators, such as `$in`, aren't the key of one document, so they
+    are left out.
+    """
+    return {
+        field: document[field]
+        for field in KEY_FIELDS
+        if field in document and not isinstance(document[field], dict)
+    }
+
+
+class ChangedKeys:
+    """Keys of the documents that changed in some collections"""
+
+    def __init__(self):
+        self.changes: List[Dict[str, object]] = []
+        # Collections with changes that could not be traced to keys
+        self.unkeyed_collections: Set[str] = set()
+        # Collections with deleted documents, and the number deleted with known keys
+        self.deleted_collections: Set[str] = set()
+        self.keyed_deletes: Dict[str, int] = {}
+        # Position in the change tracker after the latest change included, see `changes_since`
+        self.position: Optional[int] = None
+
+    def add(self, collection: str, keys: Optional[Dict[str, object]], deleted: int = 0) -> None:
+        if keys is None:
+            self.unkeyed_collections.add(collection)
+        elif keys != {}:
+            self.changes.append(keys)
+        if deleted > 0:
+            self.deleted_collections.add(collection)
+            if keys is not None:
+                self.keyed_deletes[collection] = self.keyed_deletes.get(collection, 0) + deleted
+
+    def update(self, other: "ChangedKeys") -> None:
+        """Adds the changes in 'other'"""
+        self.changes.extend(other.changes)
+        self.unkeyed_collections.update(other.unkeyed_collections)
+        self.deleted_collections.update(other.deleted_collections)
+        for collection, deleted in other.keyed_deletes.items():
+            self.keyed_deletes[collection] = self.keyed_deletes.get(collection, 0) + deleted
+
+    def teams(self) -> Set[str]:
+        return {keys["team_number"] for keys in self.changes if "team_number" in keys}
+
+    def tims(self) -> Set[Tuple[str, int]]:
+        return {
+            (keys["team_number"], keys["match_number"])
+            for keys in self.changes
+            if "team_number" in keys and "match_number" in keys
+        }
+
+    def aims(self) -> Set[Tuple[int, bool]]:
+        return {
+            (keys["match_number"], keys["alliance_color_is_red"])
+            for keys in self.changes
+            if "match_number" in keys and "alliance_color_is_red" in keys
+        }
+
+    def scouts(self) -> Set[str]:
+        return {keys["scout_name"] for keys in self.changes if "scout_name" in keys}
+
+    def __bool__(self) -> bool:
+        return self.changes != [] or self.unkeyed_collections != set()
+
+
+class ChangeTracker:
+    """Ordered list of the keys changed in each collection of one database"""
+
+    def __init__(self):
+        # A collection, the keys of a changed document, None if they are unknown, and the number of
+        # documents deleted with those keys
+        self.changes: List[Tuple[str, Optional[Dict[str, object]], int]] = []
+        # Number of changes discarded from the start of `changes`
+        self.offset = 0
+        self._lock = threading.Lock()
+
+    @property
+    def position(self) -> int:
+        """Position after the latest change"""
+        return self.offset + len(self.changes)
+
+    def record(self, collection: str, documents: Iterable[dict]) -> None:
+        """Records that 'documents' were written to 'collection'"""
+        changes = [(collection, document_keys(document), 0) for document in documents]
+        with self._lock:
+            self.changes.extend(changes)
+
+    def record_delete(self, collection: str, query: dict, deleted: int) -> None:
+        """Records that 'deleted' documents matching 'query' were deleted"""
+        if deleted == 0:
+            return
+        keys = document_keys(query)
+        with self._lock:
+            self.changes.append((collection, keys if keys != {} else None, deleted))
+
+    def record_update(self, collection: str, query: dict, new_data: dict) -> None:
+        """Records an update of the documents matching 'query' with 'new_data'"""
+        keys = {**document_keys(query), **document_keys(new_data)}
+        with self._lock:
+            self.changes.append((collection, keys if keys != {} else None, 0))
+
+    def record_unkeyed(self, collection: str) -> None:
+        """Records a change to documents of 'collection' that can't be traced to keys"""
+        with self._lock:
+            self.changes.append((collection, None, 0))
+
+    def changes_since(self, position: int, collections: Iterable[str]) -> ChangedKeys:
+        """Returns the keys changed in 'collections' after 'position'
+
+        The position to read from next time is in the `position` of the returned keys.
+        """
+        collections = set(collections)
+        changed = ChangedKeys()
+        with self._lock:
+            changed.position = self.position
+            if position < self.offset:
+                # The changes were discarded, so every collection is treated as changed
+                log.warning(f"Changes after position {position} were discarded")
+                changed.unkeyed_collections.update(collections)
+                return changed
+            new_changes = self.changes[position - self.offset :]
+        for collection, keys, deleted in new_changes:
+            if collection in collections:
+                changed.add(collection, keys, deleted)
+        return changed
+
+    def discard_before(self, position: int) -> None:
+        """Removes the changes before 'position', once every calculation has read them"""
+        with self._lock:
+            position = min(position, self.position)
+            if position > self.offset:
+                del self.changes[: position - self.offset]
+                self.offset = position
+
+
+def get_tracker(database_name: str) -> ChangeTracker:
+    """Returns the change tracker of the database named 'database_name'"""
+    with _trackers_lock:
+        if database_name not in _trackers:
+            _trackers[database_name] = ChangeTracker()
+        return _trackers[database_name]
@@ -4,11 +4,12 @@
 
 import collections
 import re
+import time
 from typing import Any, Dict, List, Optional, Union
 
 import pymongo
 
-from data_transfer import database
+from data_transfer import database, db_reconciler, outbound_queue
 import utils
 import logging
 
@@ -18,15 +19,29 @@ log = logging.getLogger(__name__)
 class CloudDBUpdater:
 
     BASE_CONNECTION_STRING = "mongodb+srv://server:{}@scouting-system-3das1.gcp.mongodb.net/test?authSource=admin&replicaSet=scouting-system-shard-0&w=majority&readPreference=primary&appname=MongoDB%20Compass&retryWrites=true&ssl=true"
-    OPERATION_MAP = {"i": pymongo.InsertOne, "u": pymongo.UpdateOne, "d": pymongo.DeleteOne}
+    # Maximum number of queued documents sent in one bulk write
+    BATCH_SIZE = 500
+    # Maximum number of batches sent per server cycle, so catching up does not stall the cycle
+    MAX_BATCHES_PER_CYCLE = 10
+    # Seconds to wait before trying the cloud database again after a failure
+    INITIAL_BACKOFF = 5
+    MAX_BACKOFF = 300
 
     def __init__(self):
         self.cloud_db = self.get_cloud_db()
         self.db = database.Database()
         self.db_pattern = re.compile(r"^{}\..*".format(self.db.name))
         self.oplog = self.db.client.local.oplog.rs
-        # Get an initial timestamp
-        self.update_timestamp()
+        # Changes waiting to be sent to the cloud, kept on disk in case of server restarts
+        self.queue = outbound_queue.OutboundQueue(self.db.name)
+        self.backoff = 0
+        self.next_attempt = 0.0
+        # Resume from the newest queued change, changes made while the server was stopped are
+        # still in the oplog
+        if self.queue.watermark is not None:
+            self.last_timestamp = self.queue.watermark
+        else:
+            self.update_timestamp()
 
     def entries_since_last(self) -> List[Dict]:
         """Returns the oplog entries since the last update
@@ -37,69 +52,159 @@ class CloudDBUpdater:
             self.oplog.find({"ts": {"$gt": self.last_timestamp}, "op": {"$in": ["d", "i", "u"]}})
         )
 
-    def create_db_changes(self) -> collections.defaultdict:
-        """Creates bulk write operations from oplog"""
-        changes = collections.defaultdict(list)
-        for entry in self.entries_since_last():
-            # 'ns' in the entry is of the format <database>.<collection> and shows where the changes
-            # were written
+    def queue_db_changes(self) -> int:
+        """Adds the documents changed since the last update to the outbound queue
+
+        Returns the number of documents added to the queue. The timestamp of the newest entry is
+        saved with the queue, so a restarted server continues from it.
+        """
+        keys = []
+        entries = self.entries_since_last()
+        for entry in entries:
             location: str = entry["ns"]
-            # Ignore writes to a database other than the current local database
             if not self.db_pattern.match(location):
                 continue
-            # Get collection name from full location
             collection = location[location.index(".") + 1 :]
-            changes[collection].append(self.create_bulk_operation(entry))
-        return changes
+            if database.is_local_collection(collection):
+                continue
+            # Updates store the document `_id` in 'o2', inserts and deletes store it in 'o'
+            document_id = entry["o2"]["_id"] if "o2" in entry else entry["o"]["_id"]
+            keys.append((collection, document_id))
+        if entries == []:
+            return 0
+        self.last_timestamp = max(entry["ts"] for entry in entries)
+        return self.queue.append(keys, self.last_timestamp)
 
     def write_db_changes(self) -> Dict[str, pymongo.results.BulkWriteResult]:
-        """Writes oplog changes to cloud database"""
+        """Queues oplog changes and sends the queued changes to the cloud database
+
+        Changes are always queued first, so they are kept on disk while the cloud database can't
+        be reached. After a failed attempt, sending is skipped until the backoff has passed.
+        """
+        self.queue_db_changes()
+        if self.queue.is_empty() or time.monotonic() < self.next_attempt:
+            return {}
         # Try connecting to cloud db if connection does not exist
         if self.cloud_db is None:
             self.cloud_db = self.get_cloud_db()
             # Don't try to continue if above connection failed
             if self.cloud_db is None:
+                self.back_off()
                 return {}
+        try:
+            results = self.send_queued_changes()
+        except (pymongo.errors.ServerSelectionTimeoutError, pymongo.errors.ConnectionFailure):
+            log.warning("Unable to write to cloud db due to poor internet, changes are queued")
+            self.back_off()
+            return {}
+        self.backoff = 0
+        return results
+
+    def send_queued_changes(self) -> Dict[str, pymongo.results.BulkWriteResult]:
+        """Sends up to MAX_BATCHES_PER_CYCLE batches of queued changes to the cloud database
+
+        The current local version of each queued document is sent, and documents that no longer
+        exist locally are deleted. The queue only advances after a batch has been written. The
+        stored hashes of the written buckets are updated, so reconciling doesn't resend them.
+        """
         results = {}
-        for collection, bulk_ops in self.create_db_changes().items():
-            try:
-                results[collection] = self.cloud_db.bulk_write(collection, bulk_ops)
-            except pymongo.errors.BulkWriteError:
-                log.error(f"Error Writing to {collection}.")
-                current_documents = self.db.find(collection)
-                self.cloud_db.delete_data(collection)
-                self.cloud_db.insert_documents(collection, current_documents)
-            except pymongo.errors.ServerSelectionTimeoutError:
-                log.warning(f"Unable to write to {collection} due to poor internet")
-                break  # Don't delay server cycle with more operations without internet
-        # Update timestamp if loop exited properly
-        else:
-            self.update_timestamp()
+        reconciler = db_reconciler.Reconciler(self.db, self.cloud_db)
+        for _ in range(self.MAX_BATCHES_PER_CYCLE):
+            keys, end_offset = self.queue.next_batch(self.BATCH_SIZE)
+            if keys == []:
+                break
+            ids_by_collection = collections.defaultdict(list)
+            for collection, document_id in keys:
+                ids_by_collection[collection].append(document_id)
+            for collection, document_ids in ids_by_collection.items():
+                local_documents = self.get_local_documents(collection, document_ids)
+                bulk_ops = self.create_sync_operations(document_ids, local_documents)
+                try:
+                    result = self.cloud_db.db[collection].bulk_write(bulk_ops, ordered=False)
+                except pymongo.errors.BulkWriteError:
+                    log.error(f"Error Writing to {collection}, reconciling collection.")
+                    reconciler.reconcile_collection(collection)
+                    continue
+                if collection in results:
+                    result = self.combine_results(results[collection], result)
+                results[collection] = result
+                reconciler.update_hashes(
+                    collection,
+                    local_documents.values(),
+                    [
+                        document_id
+                        for document_id in document_ids
+                        if document_id not in local_documents
+                    ],
+                )
+            self.queue.commit(end_offset)
         return results
 
+    @staticmethod
+    def combine_results(
+        first: pymongo.results.BulkWriteResult, second: pymongo.results.BulkWriteResult
+    ) -> pymongo.results.BulkWriteResult:
+        """Adds up the results of two bulk writes to the same collection"""
+        combined = dict(first.bulk_api_result)
+        for key, value in second.bulk_api_result.items():
+            if key in combined:
+                combined[key] = combined[key] + value
+            else:
+                combined[key] = value
+        return pymongo.results.BulkWriteResult(combined, True)
+
+    def get_local_documents(self, collection: str, document_ids: List[Any]) -> Dict[Any, Dict]:
+        """Returns the local documents with 'document_ids' that still exist, by `_id`"""
+        return {
+            document["_id"]: document
+            for document in self.db.db[collection].find({"_id": {"$in": document_ids}})
+        }
+
+    @staticmethod
+    def create_sync_operations(
+        document_ids: List[Any], local_documents: Dict[Any, Dict]
+    ) -> List[Union[pymongo.ReplaceOne, pymongo.DeleteOne]]:
+        """Creates operations that make the cloud copies of 'document_ids' match the local ones"""
+        bulk_ops = []
+        for document_id in document_ids:
+            if document_id in local_documents:
+                bulk_ops.append(
+                    pymongo.ReplaceOne(
+                        {"_id": document_id}, local_documents[document_id], upsert=True
+                    )
+                )
+            else:
+                bulk_ops.append(pymongo.DeleteOne({"_id": document_id}))
+        return bulk_ops
+
+    def back_off(self):
+        """Waits longer before each attempt to reach the cloud database, up to MAX_BACKOFF"""
+        self.backoff = min(max(self.backoff * 2, self.INITIAL_BACKOFF), self.MAX_BACKOFF)
+        self.next_attempt = time.monotonic() + self.backoff
+
+    def reconcile(
+        self,
+        collections: Optional[List[str]] = None,
+        full: bool = False,
+        trust_hashes: bool = False,
+    ) -> Dict[str, db_reconciler.ReconcileResult]:
+        """Sends only the documents that differ between the local and cloud databases
+
+        See `db_reconciler.Reconciler.reconcile_collection` for 'full' and 'trust_hashes'.
+        """
+        try:
+            return db_reconciler.Reconciler(self.db, self.cloud_db).reconcile(
+                collections, full, trust_hashes
+            )
+        except pymongo.errors.ServerSelectionTimeoutError:
+            log.warning("Unable to reconcile cloud db due to poor internet")
+            return {}
+
     def update_timestamp(self):
         """Updates the timestamp to the most recent oplog entry timestamp"""
         last_op = self.oplog.find({}).sort("ts", pymongo.DESCENDING).limit(1)
         self.last_timestamp = last_op.next()["ts"]
 
-    @classmethod
-    def create_bulk_operation(
-        cls, entry: Dict[str, Any]
-    ) -> Optional[Union[pymongo.DeleteOne, pymongo.InsertOne, pymongo.UpdateOne]]:
-        """Creates a pymongo bulk write operation for the entry.
-
-        Note: this does not handle the collection that is written to, and the operations need to be
-        applied to a specific collection to work.
-        """
-        operation = cls.OPERATION_MAP.get(entry["op"])
-        if operation is None:
-            return None
-        if "o" in entry and "$v" in entry["o"].keys():
-            entry["o"].pop("$v")
-        if "o2" in entry:
-            return operation(entry["o2"], entry["o"])
-        return operation(entry["o"])
-
     @classmethod
     def get_cloud_db(cls) -> Optional[database.Database]:
         """Connects to the cloud database and returns a database object.
@@ -4,21 +4,27 @@
 
 All communication with the MongoDB local database go through this file.
 """
+import hashlib
 import os
+import threading
+import time
 from collections import OrderedDict
-from typing import Any, Optional, Union
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Union
 
+import bson
 import pymongo
 
+import compiled_schema
+from data_transfer import change_tracker, memory_database
+import metrics
 import start_mongod
 import utils
 import logging
 
 log = logging.getLogger(__name__)
 
-# Load collection names
-COLLECTION_SCHEMA = utils.read_schema("schema/collection_schema.yml")
-COLLECTION_NAMES = [collection for collection in COLLECTION_SCHEMA["collections"].keys()]
+COLLECTION_SCHEMA_FILE = "schema/collection_schema.yml"
 VALID_COLLECTIONS = [
     "auto_paths",
     "obj_team",
@@ -34,14 +40,80 @@ VALID_COLLECTIONS = [
     "pickability",
     "raw_obj_pit",
 ]
+# Oplog timestamp up to which each calculation has processed changes, kept across restarts
+CHECKPOINT_COLLECTION = "calc_checkpoints"
+# One document per team with the fields of every team collection, see `calculations.team_cards`
+TEAM_CARD_COLLECTION = "team_cards"
+# Matches with TBA data that changed, for each calculation that has not recalculated them yet
+DIRTY_MATCH_COLLECTION = "tba_dirty_matches"
+# Collections written by the server itself that are not part of the collection schema
+INTERNAL_COLLECTIONS = [
+    metrics.METRICS_COLLECTION,
+    CHECKPOINT_COLLECTION,
+    TEAM_CARD_COLLECTION,
+    DIRTY_MATCH_COLLECTION,
+]
+# Internal collections that only have data for this server, not for the cloud
+LOCAL_COLLECTIONS = [metrics.METRICS_COLLECTION, CHECKPOINT_COLLECTION, DIRTY_MATCH_COLLECTION]
+
+# Indexes of raw QRs, by the fields from `calculations.qr_state.qr_keys`, so corrections find the
+# QRs of a match, scout or TIM without decompressing every QR
+RAW_QR_INDEXES = [["match_number", "scout_name"], ["match_number", "team_number"]]
+
+# Suffix of the shadow collections that calculations write to while all data is rebuilt
+REBUILD_SUFFIX = "_rebuild"
+# Number of buffered updates to a shadow collection that are sent in one bulk write
+REBUILD_BATCH_SIZE = 1000
+# Writes to shadow collections aren't waited on to be journaled, since a failed rebuild is redone
+REBUILD_WRITE_CONCERN = pymongo.WriteConcern(w=1, j=False)
+
+# Database backend, "memory" keeps all data in memory instead of starting mongod
+BACKEND = os.environ.get("SCOUTING_SERVER_DB", "mongod")
+
+_collection_schema: Optional[dict] = None
+
+
+def get_collection_schema() -> dict:
+    """Loads the collection schema the first time it is used instead of on import"""
+    global _collection_schema
+    if _collection_schema is None:
+        _collection_schema = utils.read_schema(COLLECTION_SCHEMA_FILE)
+    return _collection_schema
+
+
+def __getattr__(name: str) -> Any:
+    if name == "COLLECTION_SCHEMA":
+        return get_collection_schema()
+    if name == "COLLECTION_NAMES":
+        return list(get_collection_schema()["collections"].keys())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _sort_keys(value: Any) -> Any:
+    """Recursively sorts dictionary keys so equal documents always encode to the same bytes"""
+    if isinstance(value, dict):
+        return bson.SON((key, _sort_keys(value[key])) for key in sorted(value))
+    if isinstance(value, list):
+        return [_sort_keys(item) for item in value]
+    return value
+
+
+def hash_document(document: dict) -> str:
+    """Returns a hash of the contents of 'document' that does not depend on field order"""
+    return hashlib.sha1(bson.encode(_sort_keys(document))).hexdigest()
 
-# Start mongod and initialize replica set
-start_mongod.start_mongod()
+
+def is_local_collection(collection_name: str) -> bool:
+    """Returns whether 'collection_name' only has data for this server, not for the cloud"""
+    return collection_name in LOCAL_COLLECTIONS or collection_name.endswith(REBUILD_SUFFIX)
 
 
 def check_collection_name(collection_name: str) -> None:
     """Checks if a collection name exists, prints a warning if it doesn't"""
-    if collection_name not in COLLECTION_NAMES:
+    if (
+        collection_name not in get_collection_schema()["collections"]
+        and collection_name not in INTERNAL_COLLECTIONS
+    ):
         log.warning(f'database.py: Unexpected collection name: "{collection_name}"')
 
 
@@ -56,11 +128,43 @@ class Database:
     ) -> None:
         self.connection = connection
         self.port = port
-        self.client = pymongo.MongoClient(connection, port)
+        # Created on first use, so scripts that don't use the database don't wait for mongod
+        self._client = None
+        # Updates that didn't change anything, because the document already had the same data
+        self.writes_skipped = 0
+        # Calculations can write from parallel threads while all data is rebuilt
+        self._writes_skipped_lock = threading.Lock()
+        # While rebuilding, the shadow collection of each collection that is being rebuilt, see
+        # `rebuild`, and the updates waiting to be written to it
+        self._rebuilding: Optional[Dict[str, str]] = None
+        self._pending_updates: Dict[str, List[Union[pymongo.UpdateOne, pymongo.ReplaceOne]]] = {}
+        self._rebuild_lock = threading.RLock()
         production_mode: bool = os.environ.get("SCOUTING_SERVER_ENV") == "production"
         self.name = tba_event_key if production_mode else f"test{tba_event_key}"
-        self.db = self.client[self.name]
 
+    @property
+    def client(self) -> pymongo.MongoClient:
+        """Client for the database, starts mongod if needed the first time it is used"""
+        if self._client is None:
+            if BACKEND == "memory":
+                self._client = memory_database.MemoryClient(self.connection, self.port)
+            else:
+                start_mongod.ensure_started()
+                self._client = pymongo.MongoClient(
+                    self.connection, self.port, event_listeners=[metrics.LISTENER]
+                )
+        return self._client
+
+    @property
+    def db(self) -> pymongo.database.Database:
+        return self.client[self.name]
+
+    @property
+    def changes(self) -> change_tracker.ChangeTracker:
+        """Keys changed by writes to this database, see `change_tracker`"""
+        return change_tracker.get_tracker(self.name)
+
+    @metrics.timed("db.setup_db")
     def setup_db(self):
         self.set_indexes()
         # All document names and their files
@@ -68,71 +172,222 @@ class Database:
         for entry in coll_to_path.keys():
             self._enable_validation(entry, coll_to_path[entry])
 
+    @metrics.timed("db.set_indexes")
     def set_indexes(self) -> None:
         """Adds indexes into competition collections"""
-        for collection in COLLECTION_SCHEMA["collections"]:
-            collection_dict = COLLECTION_SCHEMA["collections"][collection]
-            if collection_dict["indexes"] is not None:
-                for index in collection_dict["indexes"]:
-                    self.db[collection].create_index(
-                        [(field, pymongo.ASCENDING) for field in index["fields"]],
-                        unique=index["unique"],
-                    )
+        for collection in get_collection_schema()["collections"]:
+            self._create_indexes(collection, collection)
+        for fields in RAW_QR_INDEXES:
+            self.db["raw_qr"].create_index([(field, pymongo.ASCENDING) for field in fields])
+        # Processes that create the same cache at the same time can't both insert it
+        self.db.tba_cache.create_index([("api_url", pymongo.ASCENDING)], unique=True)
 
+    def _create_indexes(self, collection: str, target: str) -> None:
+        """Adds the indexes of 'collection' from the collection schema to the 'target' collection"""
+        collection_dict = get_collection_schema()["collections"].get(collection)
+        if collection_dict is not None and collection_dict["indexes"] is not None:
+            for index in collection_dict["indexes"]:
+                self.db[target].create_index(
+                    [(field, pymongo.ASCENDING) for field in index["fields"]],
+                    unique=index["unique"],
+                )
+
+    def _collection(self, collection: str) -> pymongo.collection.Collection:
+        """Returns the collection that 'collection' is read from and written to
+
+        While it is being rebuilt, this is its shadow collection, after its buffered updates are
+        written so they can be read.
+        """
+        if self._rebuilding is None or collection not in self._rebuilding:
+            return self.db[collection]
+        self._flush_updates(collection)
+        return self.db.get_collection(
+            self._rebuilding[collection], write_concern=REBUILD_WRITE_CONCERN
+        )
+
+    @metrics.timed("db.find")
     def find(self, collection: str, query: dict = {}) -> list:
         """Finds documents in 'collection', filtering by 'filters'"""
         check_collection_name(collection)
-        return list(self.db[collection].find(query))
+        return list(self._collection(collection).find(query))
 
+    @metrics.timed("db.get_tba_cache")
     def get_tba_cache(self, api_url: str) -> Optional[dict]:
         """Gets the TBA Cache of 'api_url'"""
         return self.db.tba_cache.find_one({"api_url": api_url})
 
-    def update_tba_cache(self, data: Any, api_url: str, etag: Optional[str] = None) -> None:
-        """Updates one TBA Cache at 'api_url'"""
-        write_object = {"data": data}
+    @metrics.timed("db.update_tba_cache")
+    def update_tba_cache(
+        self, data: Any, api_url: str, etag: Optional[str] = None, cached: Optional[dict] = None
+    ) -> bool:
+        """Updates one TBA Cache at 'api_url', returns whether it was updated
+
+        'cached' is the cache that 'data' was made from. If it is given, the cache is only updated
+        if no other process wrote it since it was read, otherwise the caller should read it again.
+        Only the given fields are set, so the ETag is kept if 'etag' is None.
+        """
+        write_object = {"data": data, "last_modified": time.time()}
         if etag is not None:
             write_object["etag"] = etag
-        self.db.tba_cache.update_one({"api_url": api_url}, {"$set": write_object}, upsert=True)
+        query = {"api_url": api_url}
+        if cached is not None:
+            # A cache from before `last_modified` was added matches the missing field
+            query["last_modified"] = cached.get("last_modified")
+        try:
+            result = self.db.tba_cache.update_one(
+                query, {"$set": write_object}, upsert=cached is None
+            )
+        except pymongo.errors.DuplicateKeyError:
+            # Another process created the cache after it was read
+            return False
+        return result.matched_count > 0 or result.upserted_id is not None
+
+    @metrics.timed("db.get_checkpoints")
+    def get_checkpoints(self) -> Dict[str, bson.Timestamp]:
+        """Returns the oplog timestamp of the checkpoint of each calculation"""
+        return {
+            checkpoint["calculation"]: checkpoint["timestamp"]
+            for checkpoint in self.db[CHECKPOINT_COLLECTION].find({})
+        }
+
+    @metrics.timed("db.save_checkpoints")
+    def save_checkpoints(self, calculations: List[str], timestamp: bson.Timestamp) -> None:
+        """Saves that 'calculations' have processed every change up to 'timestamp'"""
+        if calculations == []:
+            return
+        self.db[CHECKPOINT_COLLECTION].bulk_write(
+            [
+                pymongo.UpdateOne(
+                    {"calculation": calculation},
+                    {"$set": {"timestamp": timestamp, "saved_time": time.time()}},
+                    upsert=True,
+                )
+                for calculation in calculations
+            ]
+        )
 
+    @metrics.timed("db.mark_matches_dirty")
+    def mark_matches_dirty(
+        self, match_numbers: Iterable[Optional[int]], calculations: Iterable[str]
+    ) -> None:
+        """Marks that 'calculations' need to recalculate 'match_numbers'
+
+        A match number of None marks a change to the event, such as alliance selection.
+        """
+        dirty = {f"dirty.{calculation}": True for calculation in calculations}
+        operations = [
+            pymongo.UpdateOne({"match_number": match_number}, {"$set": dirty}, upsert=True)
+            for match_number in set(match_numbers)
+        ]
+        if operations != [] and dirty != {}:
+            self.db[DIRTY_MATCH_COLLECTION].bulk_write(operations)
+
+    @metrics.timed("db.take_dirty_matches")
+    def take_dirty_matches(self, calculation: str) -> Set[Optional[int]]:
+        """Returns the matches marked dirty for 'calculation', and unmarks them"""
+        field = f"dirty.{calculation}"
+        match_numbers = {
+            document["match_number"]
+            for document in self.db[DIRTY_MATCH_COLLECTION].find({field: True})
+        }
+        if match_numbers != set():
+            self.db[DIRTY_MATCH_COLLECTION].update_many(
+                {"match_number": {"$in": list(match_numbers)}}, {"$unset": {field: ""}}
+            )
+        return match_numbers
+
+    @metrics.timed("db.delete_data")
     def delete_data(self, collection: str, query: dict = {}) -> None:
         """Deletes data in 'collection' according to 'filters'"""
         check_collection_name(collection)
         if "raw" in collection:
             log.warning(f"Attempted to delete raw data from collection {collection}")
             return
-        self.db[collection].delete_many(query)
+        if self._rebuilding is not None and query == {}:
+            # The whole collection is rewritten, so it is written to an empty shadow collection
+            # while the documents in the collection stay readable
+            self._start_shadow(collection)
+            self.changes.record_unkeyed(collection)
+        else:
+            result = self._collection(collection).delete_many(query)
+            self.changes.record_delete(collection, query, result.deleted_count)
 
+    @metrics.timed("db.insert_documents")
     def insert_documents(self, collection: str, data: Union[list, dict]) -> None:
         """Inserts documents from 'data' list in 'collection'"""
         check_collection_name(collection)
         if data != [] and isinstance(data, list):
-            self.db[collection].insert_many(data)
+            self._collection(collection).insert_many(data)
+            self.changes.record(collection, data)
         elif data != {} and isinstance(data, dict):
-            self.db[collection].insert_one(data)
+            self._collection(collection).insert_one(data)
+            self.changes.record(collection, [data])
         else:
             log.warning(
                 f'database.py: data for insertion to "{collection}" is not a list or dictionary, or is empty'
             )
 
+    @metrics.timed("db.update_document")
     def update_document(
         self,
         collection: str,
         new_data: dict,
         query: dict,
     ) -> None:
-        """Updates one document that matches 'query' with 'new_data', uses upsert"""
+        """Updates one document that matches 'query' with 'new_data', uses upsert
+
+        MongoDB doesn't modify a document or add an oplog entry when it already has the same data,
+        so such an update is counted as skipped, and no change is recorded for later calculations.
+        """
+        check_collection_name(collection)
+        if collection == "raw_qr":
+            log.warning(f"Attempted to modify raw qr data")
+            return
+        if self._is_shadowed(collection):
+            # Shadow collections start empty, so their updates are buffered and always recorded
+            self._buffer_update(
+                collection, pymongo.UpdateOne(query, {"$set": new_data}, upsert=True)
+            )
+        else:
+            # The stored data is compared by the update itself, without reading it first
+            result = self.db[collection].update_one(query, {"$set": new_data}, upsert=True)
+            if result.modified_count == 0 and result.upserted_id is None:
+                with self._writes_skipped_lock:
+                    self.writes_skipped += 1
+                metrics.RECORDER.record(writes_skipped=1)
+                return
+        self.changes.record_update(collection, query, new_data)
+
+    @metrics.timed("db.replace_document")
+    def replace_document(self, collection: str, document: dict, query: dict) -> None:
+        """Replaces the document that matches 'query' with 'document', uses upsert
+
+        Unlike `update_document`, fields that are not in 'document' are removed. Replacements that
+        don't change anything are counted as skipped.
+        """
         check_collection_name(collection)
         if collection == "raw_qr":
             log.warning(f"Attempted to modify raw qr data")
             return
-        self.db[collection].update_one(query, {"$set": new_data}, upsert=True)
+        if self._is_shadowed(collection):
+            self._buffer_update(collection, pymongo.ReplaceOne(query, document, upsert=True))
+        else:
+            result = self.db[collection].replace_one(query, document, upsert=True)
+            if result.modified_count == 0 and result.upserted_id is None:
+                with self._writes_skipped_lock:
+                    self.writes_skipped += 1
+                metrics.RECORDER.record(writes_skipped=1)
+                return
+        self.changes.record_update(collection, query, document)
 
+    @metrics.timed("db.update_qr_blocklist_status")
     def update_qr_blocklist_status(self, query, blocklist=True) -> None:
         """Changes the status of a raw qr matching 'query' from blocklisted: true to blocklisted: false
         Lowers risk of data loss from using normal update."""
         self.db["raw_qr"].update_one(query, {"$set": {"blocklisted": blocklist}})
+        self.changes.record_update("raw_qr", query, {})
 
+    @metrics.timed("db.update_qr_data_override")
     def update_qr_data_override(self, query, datapoint, new_value, clear=False) -> None:
         """Changes the override of a datapoint of a raw qr matching 'query' to new_value
         Lowers risk of data loss from using normal update."""
@@ -140,13 +395,13 @@ class Database:
             self.db["raw_qr"].update_one(query, {"$set": {f"override": {}}})
         else:
             self.db["raw_qr"].update_one(query, {"$set": {f"override.{datapoint}": new_value}})
+        self.changes.record_update("raw_qr", query, {})
 
-    def _enable_validation(self, collection: str, file: str):
-        sch = utils.read_schema("schema/" + file)
-        sch = mongo_convert(sch)
+    def _enable_validation(self, collection: str, file: str, target: Optional[str] = None):
+        sch = compiled_schema.load("schema/" + file).mongo
         cmd = OrderedDict(
             [
-                ("collMod", collection),
+                ("collMod", collection if target is None else target),
                 ("validator", {"$jsonSchema": sch}),
                 ("validationLevel", "moderate"),
             ]
@@ -155,47 +410,90 @@ class Database:
 
     def _get_all_schema_names(self) -> dict:
         out = {}
-        for entry in COLLECTION_SCHEMA["collections"].keys():
-            out[entry] = COLLECTION_SCHEMA["collections"][entry]["schema"]
+        collection_schema = get_collection_schema()
+        for entry in collection_schema["collections"].keys():
+            out[entry] = collection_schema["collections"][entry]["schema"]
             if out[entry] == None:
                 out.pop(entry)
         return out
 
+    @metrics.timed("db.bulk_write")
     def bulk_write(self, collection: str, actions: list) -> pymongo.results.BulkWriteResult:
         """Bulk write `actions` into `collection` in order of `actions`"""
         check_collection_name(collection)
         if collection in VALID_COLLECTIONS:
-            return self.db[collection].bulk_write(actions)
+            result = self._collection(collection).bulk_write(actions)
+            self.changes.record_unkeyed(collection)
+            return result
         else:
             log.info(f'database.py: Invalid collection name: "{collection}"')
 
+    def _is_shadowed(self, collection: str) -> bool:
+        return self._rebuilding is not None and collection in self._rebuilding
 
-def mongo_convert(sch):
-    """Converts a schema dictionary into a mongo-usable form."""
-    # Dictionary for translating data types in schema to recognized BSON types
-    type_to_bson = {
-        "int": "int",
-        "float": "number",
-        "str": "string",
-        "bool": "bool",
-        "List": "array",
-    }
-    out = {}
-    out["bsonType"] = "object"
-    out["required"] = []
-    out["properties"] = {}
-    for section, datapoints in sch.items():
-        # These sections aren't stored in the database; ignore them
-        if section in ["schema_file", "enums"]:
-            continue
-        for datapoint, info in datapoints.items():
-            datapoint_dict = {}
-            # Every document should have a team number, match number, and/or scout name depending on collection
-            if datapoint in ["team_number", "match_number", "scout_name"]:
-                out["required"].append(datapoint)
-            # Enums include their data type in brackets. Ex: Enum[int] is int.
-            datapoint_dict["bsonType"] = type_to_bson[
-                t[5:-1] if "Enum" in (t := info["type"]) else t
-            ]
-            out["properties"].update({datapoint: datapoint_dict})
-    return out
+    def _start_shadow(self, collection: str) -> None:
+        """Creates an empty shadow collection for 'collection', with its indexes and validation"""
+        shadow = f"{collection}{REBUILD_SUFFIX}"
+        with self._rebuild_lock:
+            self._pending_updates.pop(collection, None)
+            # Left over from a rebuild that was stopped before it was swapped in
+            self.db.drop_collection(shadow)
+            self.db.create_collection(shadow)
+            self._create_indexes(collection, shadow)
+            schema_file = self._get_all_schema_names().get(collection)
+            if schema_file is not None:
+                self._enable_validation(collection, schema_file, shadow)
+            self._rebuilding[collection] = shadow
+
+    def _buffer_update(
+        self, collection: str, update: Union[pymongo.UpdateOne, pymongo.ReplaceOne]
+    ) -> None:
+        with self._rebuild_lock:
+            pending = self._pending_updates.setdefault(collection, [])
+            pending.append(update)
+            full = len(pending) >= REBUILD_BATCH_SIZE
+        if full:
+            self._flush_updates(collection)
+
+    def _flush_updates(self, collection: str) -> None:
+        """Writes the buffered updates to the shadow collection of 'collection'"""
+        with self._rebuild_lock:
+            pending = self._pending_updates.pop(collection, [])
+            if pending != []:
+                # Updates of the same document must be applied in order
+                self.db.get_collection(
+                    self._rebuilding[collection], write_concern=REBUILD_WRITE_CONCERN
+                ).bulk_write(pending, ordered=True)
+
+    @contextmanager
+    def rebuild(self) -> Iterator[Set[str]]:
+        """Writes collections that are rebuilt inside of the `with` block to shadow collections
+
+        A collection is rebuilt when all of its documents are deleted with `delete_data`. Its
+        documents stay readable by the viewers and the cloud while the calculations write to its
+        shadow collection, which later reads in this process are also sent to. Updates of shadow
+        collections are buffered and sent in bulk writes. When the block finishes, each shadow
+        collection atomically replaces its collection with `renameCollection`. If the block raises
+        an exception, the shadow collections are dropped and the collections are left unchanged.
+
+        Yields the set of collections that are rebuilt, which is filled in as they are swapped in.
+        """
+        if self._rebuilding is not None:
+            raise RuntimeError("A rebuild is already running")
+        self._rebuilding = {}
+        swapped: Set[str] = set()
+        try:
+            yield swapped
+            for collection, shadow in list(self._rebuilding.items()):
+                self._flush_updates(collection)
+                self.db[shadow].rename(collection, dropTarget=True)
+                swapped.add(collection)
+            log.info(f"Swapped in rebuilt collections: {', '.join(sorted(swapped))}")
+        except BaseException:
+            for collection, shadow in self._rebuilding.items():
+                if collection not in swapped:
+                    self.db.drop_collection(shadow)
+            raise
+        finally:
+            self._rebuilding = None
+            self._pending_updates = {}
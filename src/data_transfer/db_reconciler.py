@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""Reconciles the cloud database with the local database using document hashes.
+
+Each document is hashed and placed in a bucket based on its `_id`, giving every collection a
+Merkle-style summary: one hash per bucket, and a root hash over all of the buckets. The cloud
+database stores the summary of its documents, which is saved by each reconciliation and kept up to
+date by `CloudDBUpdater` as it sends changes, so finding which buckets differ only requires
+downloading the bucket hashes, and only the documents that actually differ are sent.
+"""
+
+import dataclasses
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional
+
+import bson
+import pymongo
+
+from data_transfer import database
+from data_transfer.database import hash_document
+import logging
+
+log = logging.getLogger(__name__)
+
+# Number of buckets the documents of each collection are split into
+NUM_BUCKETS = 64
+# Collection in the cloud database that stores the hashes of the cloud documents
+HASH_COLLECTION = "reconcile_hashes"
+
+
+def bucket_of(document_id: Any) -> int:
+    """Returns the bucket that the document with '_id' 'document_id' belongs to"""
+    id_hash = hashlib.sha1(bson.encode({"_id": document_id})).hexdigest()
+    return int(id_hash[:8], 16) % NUM_BUCKETS
+
+
+class CollectionDigest:
+    """Hashes of every document in one collection, grouped into buckets by `_id`"""
+
+    def __init__(self):
+        self.buckets: List[Dict[Any, str]] = [{} for _ in range(NUM_BUCKETS)]
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[dict]) -> "CollectionDigest":
+        digest = cls()
+        for document in documents:
+            digest.add(document["_id"], hash_document(document))
+        return digest
+
+    def add(self, document_id: Any, document_hash: str) -> None:
+        self.buckets[bucket_of(document_id)][document_id] = document_hash
+
+    def bucket_hash(self, bucket: int) -> str:
+        """Hash of a bucket, computed from the hashes of the documents inside of it
+
+        Document hashes include the `_id`, so sorting them gives an order independent hash.
+        """
+        return hashlib.sha1("".join(sorted(self.buckets[bucket].values())).encode()).hexdigest()
+
+    def bucket_hashes(self) -> List[str]:
+        return [self.bucket_hash(bucket) for bucket in range(NUM_BUCKETS)]
+
+    def root_hash(self) -> str:
+        return hashlib.sha1("".join(self.bucket_hashes()).encode()).hexdigest()
+
+
+@dataclasses.dataclass
+class ReconcileResult:
+    collection: str
+    differing_buckets: int = 0
+    documents_sent: int = 0
+    documents_deleted: int = 0
+
+
+class Reconciler:
+    """Makes collections in 'cloud_db' match the same collections in 'local_db'"""
+
+    def __init__(self, local_db: database.Database, cloud_db: database.Database):
+        self.local_db = local_db
+        self.cloud_db = cloud_db
+
+    def get_cloud_bucket_hashes(self, collection: str) -> Dict[int, str]:
+        """Returns the stored hashes of the cloud buckets, by bucket number"""
+        return {
+            document["bucket"]: document["bucket_hash"]
+            for document in self.cloud_db.db[HASH_COLLECTION].find(
+                {"collection": collection}, {"bucket": 1, "bucket_hash": 1}
+            )
+        }
+
+    def get_cloud_digest(
+        self, collection: str, buckets: List[int], local: CollectionDigest
+    ) -> CollectionDigest:
+        """Hashes the cloud documents that could be in 'buckets'
+
+        The cloud documents can be written outside of the server, so the documents in the
+        differing buckets are re-hashed instead of trusting the stored hashes.
+        """
+        candidate_ids = set()
+        for bucket in buckets:
+            candidate_ids.update(local.buckets[bucket])
+        for document in self.cloud_db.db[HASH_COLLECTION].find(
+            {"collection": collection, "bucket": {"$in": buckets}}, {"documents": 1}
+        ):
+            candidate_ids.update(entry["_id"] for entry in document["documents"])
+        return CollectionDigest.from_documents(
+            self.cloud_db.db[collection].find({"_id": {"$in": list(candidate_ids)}})
+        )
+
+    def get_stored_digest(self, collection: str, buckets: List[int]) -> CollectionDigest:
+        """Returns the stored hashes of the cloud documents in 'buckets'"""
+        digest = CollectionDigest()
+        for document in self.cloud_db.db[HASH_COLLECTION].find(
+            {"collection": collection, "bucket": {"$in": buckets}}, {"documents": 1}
+        ):
+            for entry in document["documents"]:
+                digest.add(entry["_id"], entry["hash"])
+        return digest
+
+    def reconcile_collection(
+        self, collection: str, full: bool = False, trust_hashes: bool = False
+    ) -> ReconcileResult:
+        """Sends the documents that differ between the local and cloud copies of 'collection'
+
+        If 'full' is True, or the cloud has no stored hashes for the collection, every cloud
+        document is hashed instead of using the stored bucket hashes. If 'trust_hashes' is True,
+        the cloud documents of the differing buckets are taken from the stored hashes instead of
+        being downloaded, which is only correct if the cloud was only written by the server.
+        """
+        result = ReconcileResult(collection)
+        local_documents = {document["_id"]: document for document in self.local_db.find(collection)}
+        local = CollectionDigest.from_documents(local_documents.values())
+        stored_hashes = {} if full else self.get_cloud_bucket_hashes(collection)
+        if stored_hashes == {}:
+            cloud = CollectionDigest.from_documents(self.cloud_db.db[collection].find())
+            differing = [
+                b for b in range(NUM_BUCKETS) if local.bucket_hash(b) != cloud.bucket_hash(b)
+            ]
+        else:
+            # Hashes are only stored for buckets that had documents, other buckets were empty
+            empty_hash = CollectionDigest().bucket_hash(0)
+            differing = [
+                b
+                for b in range(NUM_BUCKETS)
+                if local.bucket_hash(b) != stored_hashes.get(b, empty_hash)
+            ]
+            if trust_hashes:
+                cloud = self.get_stored_digest(collection, differing)
+            else:
+                cloud = self.get_cloud_digest(collection, differing, local)
+        result.differing_buckets = len(differing)
+
+        operations = []
+        for bucket in differing:
+            local_bucket = local.buckets[bucket]
+            cloud_bucket = cloud.buckets[bucket]
+            for document_id, document_hash in local_bucket.items():
+                if cloud_bucket.get(document_id) != document_hash:
+                    operations.append(
+                        pymongo.ReplaceOne(
+                            {"_id": document_id}, local_documents[document_id], upsert=True
+                        )
+                    )
+                    result.documents_sent += 1
+            for document_id in cloud_bucket.keys() - local_bucket.keys():
+                operations.append(pymongo.DeleteOne({"_id": document_id}))
+                result.documents_deleted += 1
+        if operations != []:
+            self.cloud_db.db[collection].bulk_write(operations, ordered=False)
+        if stored_hashes == {}:
+            # Store every bucket, including empty ones and the ones that already matched, so the
+            # hashes are found and kept up to date even if the collection is empty
+            self.store_hashes(collection, local, list(range(NUM_BUCKETS)))
+        else:
+            self.store_hashes(collection, local, differing)
+        log.info(
+            f"Reconciled {collection}: {result.differing_buckets} buckets differed, "
+            f"sent {result.documents_sent} documents, deleted {result.documents_deleted}"
+        )
+        return result
+
+    def update_hashes(
+        self, collection: str, documents: Iterable[dict], deleted_ids: Iterable[Any]
+    ) -> None:
+        """Updates the stored hashes after 'documents' were written to the cloud
+
+        'deleted_ids' are the `_id`s of the documents deleted from the cloud. Only the buckets of
+        the changed documents are read and saved again. Collections that were never reconciled
+        don't have stored hashes, the first reconciliation hashes every cloud document instead.
+        """
+        changed = CollectionDigest.from_documents(documents)
+        deleted_ids = list(deleted_ids)
+        buckets = {b for b in range(NUM_BUCKETS) if changed.buckets[b]}
+        buckets.update(bucket_of(document_id) for document_id in deleted_ids)
+        if buckets == set():
+            return
+        stored = CollectionDigest()
+        stored_buckets = []
+        for document in self.cloud_db.db[HASH_COLLECTION].find(
+            {"collection": collection, "bucket": {"$in": list(buckets)}},
+            {"bucket": 1, "documents": 1},
+        ):
+            stored_buckets.append(document["bucket"])
+            for entry in document["documents"]:
+                stored.add(entry["_id"], entry["hash"])
+        for document_id in deleted_ids:
+            stored.buckets[bucket_of(document_id)].pop(document_id, None)
+        for bucket in stored_buckets:
+            stored.buckets[bucket].update(changed.buckets[bucket])
+        self.store_hashes(collection, stored, stored_buckets)
+
+    def store_hashes(self, collection: str, local: CollectionDigest, buckets: List[int]) -> None:
+        """Saves the local hashes of 'buckets' in the cloud"""
+        operations = [
+            pymongo.ReplaceOne(
+                {"collection": collection, "bucket": bucket},
+                {
+                    "collection": collection,
+                    "bucket": bucket,
+                    "bucket_hash": local.bucket_hash(bucket),
+                    "documents": [
+                        {"_id": document_id, "hash": document_hash}
+                        for document_id, document_hash in local.buckets[bucket].items()
+                    ],
+                },
+                upsert=True,
+            )
+            for bucket in buckets
+        ]
+        if operations != []:
+            self.cloud_db.db[HASH_COLLECTION].bulk_write(operations, ordered=False)
+
+    def reconcile(
+        self,
+        collections: Optional[List[str]] = None,
+        full: bool = False,
+        trust_hashes: bool = False,
+    ) -> Dict[str, ReconcileResult]:
+        """Reconciles 'collections', or every collection in the local database if not given"""
+        if collections is None:
+            collections = [
+                collection
+                for collection in self.local_db.db.list_collection_names()
+                if collection in database.COLLECTION_NAMES
+            ]
+        return {
+            collection: self.reconcile_collection(collection, full, trust_hashes)
+            for collection in collections
+        }
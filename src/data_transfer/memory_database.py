@@ -0,0 +1,723 @@
+#!/usr/bin/env python3
+
+"""In-memory stand-in for a MongoDB server, used to run the server without a mongod process.
+
+`MemoryClient` implements the part of the `pymongo.MongoClient` API that the server uses, so
+`database.Database` works the same on top of it. Set the `SCOUTING_SERVER_DB` environment
+variable to "memory" to use it. Clients with the same host and port share their data, like
+clients connected to the same mongod. Every write is recorded in a simulated oplog at
+`client.local.oplog.rs`, so calculations can find changes with `entries_since_last`.
+
+Queries support equality (including dotted fields and arrays), `$in`, `$nin`, `$ne`, `$gt`,
+`$gte`, `$lt`, `$lte`, `$exists`, `$and` and `$or`. Updates support `$set`, `$unset`, `$inc`,
+`$push` and `$setOnInsert`. Indexes created with `create_index` are used for equality queries on
+their fields, and unique indexes are enforced. Schema validation is not applied. Collections can
+be renamed over an existing collection, like `renameCollection` with `dropTarget`.
+"""
+
+import bisect
+import copy
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import bson
+import pymongo
+from pymongo import operations, results
+
+import metrics
+import logging
+
+log = logging.getLogger(__name__)
+
+# Servers by (host, port), shared by every client connected to the same address
+_SERVERS: Dict[Tuple[str, int], "MemoryServer"] = {}
+_SERVERS_LOCK = threading.Lock()
+# Marks a dotted field that does not exist in a document
+_MISSING = object()
+
+
+def _hashable(value: Any) -> Any:
+    """Converts 'value' to a form that can be used as a dictionary key"""
+    if isinstance(value, dict):
+        return tuple((key, _hashable(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+def get_field(document: dict, path: str) -> Any:
+    """Returns the value of a dotted field in 'document', or _MISSING if it does not exist"""
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _candidate_values(document: dict, path: str) -> List[Any]:
+    """Returns the values a query on 'path' is compared to, including elements of arrays"""
+    value = get_field(document, path)
+    if isinstance(value, list):
+        return [value] + value
+    return [value]
+
+
+def _compare(operator: str, value: Any, target: Any) -> bool:
+    if value is _MISSING:
+        return False
+    try:
+        if operator == "$gt":
+            return value > target
+        if operator == "$gte":
+            return value >= target
+        if operator == "$lt":
+            return value < target
+        return value <= target
+    except TypeError:
+        # Values of different types never match comparisons
+        return False
+
+
+def _matches_condition(document: dict, path: str, condition: Any) -> bool:
+    values = _candidate_values(document, path)
+    if not (isinstance(condition, dict) and condition and next(iter(condition)).startswith("$")):
+        if condition is None:
+            return any(value is None or value is _MISSING for value in values)
+        return any(value == condition for value in values)
+    for operator, target in condition.items():
+        if operator == "$in":
+            # Missing fields match None, like in MongoDB
+            if not any(value in target for value in values if value is not _MISSING) and not (
+                None in target and values[0] is _MISSING
+            ):
+                return False
+        elif operator == "$nin":
+            if any(value in target for value in values if value is not _MISSING):
+                return False
+        elif operator == "$ne":
+            if any(value == target for value in values):
+                return False
+        elif operator == "$exists":
+            if (values[0] is not _MISSING) != bool(target):
+                return False
+        elif operator in ["$gt", "$gte", "$lt", "$lte"]:
+            if not any(_compare(operator, value, target) for value in values):
+                return False
+        else:
+            raise NotImplementedError(f"Query operator {operator} is not supported")
+    return True
+
+
+def matches(document: dict, query: dict) -> bool:
+    """Returns whether 'document' matches the MongoDB 'query'"""
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(document, subquery) for subquery in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, subquery) for subquery in condition):
+                return False
+        elif not _matches_condition(document, key, condition):
+            return False
+    return True
+
+
+def _set_field(document: dict, path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+
+def _unset_field(document: dict, path: str) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(parts[-1], None)
+
+
+def apply_update(document: dict, update: dict, inserting: bool = False) -> None:
+    """Applies the update operators in 'update' to 'document'"""
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if operator == "$set" or (operator == "$setOnInsert" and inserting):
+                _set_field(document, path, copy.deepcopy(value))
+            elif operator == "$unset":
+                _unset_field(document, path)
+            elif operator == "$inc":
+                current = get_field(document, path)
+                _set_field(document, path, (0 if current is _MISSING else current) + value)
+            elif operator == "$push":
+                current = get_field(document, path)
+                _set_field(document, path, (([] if current is _MISSING else current) + [value]))
+            elif operator != "$setOnInsert":
+                raise NotImplementedError(f"Update operator {operator} is not supported")
+
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    """Returns a copy of 'document' with only the fields selected by 'projection'"""
+    if not projection:
+        return copy.deepcopy(document)
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and all(fields.values()):
+        projected = {}
+        if include_id and "_id" in document:
+            projected["_id"] = document["_id"]
+        for path in fields:
+            value = get_field(document, path)
+            if value is not _MISSING:
+                _set_field(projected, path, copy.deepcopy(value))
+        return projected
+    projected = copy.deepcopy(document)
+    for path in fields:
+        _unset_field(projected, path)
+    if not include_id:
+        projected.pop("_id", None)
+    return projected
+
+
+def _sort_key(value: Any) -> Tuple:
+    # Missing and null values sort before every other value, like in MongoDB
+    if value is _MISSING or value is None:
+        return (0, 0)
+    return (1, value)
+
+
+class MemoryCursor:
+    """Results of a `find`, evaluated when iteration starts"""
+
+    def __init__(self, collection: "MemoryCollection", query: dict, projection: Optional[dict]):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[Iterator[dict]] = None
+
+    def sort(self, key_or_list: Any, direction: int = None) -> "MemoryCursor":
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction or pymongo.ASCENDING)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, skip: int) -> "MemoryCursor":
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> "MemoryCursor":
+        self._limit = limit
+        return self
+
+    def _evaluate(self) -> Iterator[dict]:
+        documents = self.collection._find_documents(self.query)
+        # Sort by each key in reverse order, since Python sorts are stable
+        for key, direction in reversed(self._sort):
+            documents.sort(
+                key=lambda document: _sort_key(get_field(document, key)),
+                reverse=direction == pymongo.DESCENDING,
+            )
+        documents = documents[self._skip :]
+        if self._limit:
+            documents = documents[: self._limit]
+        metrics.RECORDER.record(queries=1, documents_read=len(documents))
+        return iter([project(document, self.projection) for document in documents])
+
+    def __iter__(self) -> "MemoryCursor":
+        return self
+
+    def __next__(self) -> dict:
+        if self._results is None:
+            self._results = self._evaluate()
+        return next(self._results)
+
+    def next(self) -> dict:
+        return self.__next__()
+
+
+class MemoryCollection:
+    """Documents of one collection, by `_id`, with the indexes of the collection"""
+
+    def __init__(self, database: "MemoryDB", name: str):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self.documents: Dict[Any, dict] = {}
+        # Index fields, whether the index is unique, and the `_id`s of documents by index value
+        self.indexes: List[Tuple[Tuple[str, ...], bool, Dict[Any, set]]] = []
+
+    @property
+    def _lock(self) -> threading.RLock:
+        return self.database.server.lock
+
+    def __getattr__(self, name: str) -> "MemoryCollection":
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.database[f"{self.name}.{name}"]
+
+    def __getitem__(self, name: str) -> "MemoryCollection":
+        return self.database[f"{self.name}.{name}"]
+
+    # Indexes
+
+    def create_index(self, keys: Any, unique: bool = False, **kwargs) -> str:
+        if isinstance(keys, str):
+            keys = [(keys, pymongo.ASCENDING)]
+        fields = tuple(field for field, _ in keys)
+        with self._lock:
+            if not any(index[0] == fields for index in self.indexes):
+                entries: Dict[Any, set] = {}
+                for document_id, document in self.documents.items():
+                    key = self._index_key(fields, document)
+                    if unique and key in entries:
+                        raise pymongo.errors.DuplicateKeyError(
+                            f"E11000 duplicate key error collection: {self.full_name}"
+                        )
+                    entries.setdefault(key, set()).add(_hashable(document_id))
+                self.indexes.append((fields, unique, entries))
+        return "_".join(f"{field}_1" for field in fields)
+
+    def list_indexes(self) -> List[dict]:
+        return [{"name": "_id_", "key": {"_id": 1}}] + [
+            {
+                "name": "_".join(f"{field}_1" for field in fields),
+                "key": {field: 1 for field in fields},
+                "unique": unique,
+            }
+            for fields, unique, _ in self.indexes
+        ]
+
+    @staticmethod
+    def _index_key(fields: Tuple[str, ...], document: dict) -> Any:
+        values = [get_field(document, field) for field in fields]
+        return _hashable([None if value is _MISSING else value for value in values])
+
+    def _check_unique(self, document: dict, ignore_id: Any = _MISSING) -> None:
+        for fields, unique, entries in self.indexes:
+            if not unique:
+                continue
+            existing = entries.get(self._index_key(fields, document), set())
+            if existing - {_hashable(ignore_id)}:
+                raise pymongo.errors.DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.full_name} index: {fields}"
+                )
+
+    def _add_to_indexes(self, document: dict) -> None:
+        for fields, _, entries in self.indexes:
+            entries.setdefault(self._index_key(fields, document), set()).add(
+                _hashable(document["_id"])
+            )
+
+    def _remove_from_indexes(self, document: dict) -> None:
+        for fields, _, entries in self.indexes:
+            key = self._index_key(fields, document)
+            entries.get(key, set()).discard(_hashable(document["_id"]))
+            if entries.get(key) == set():
+                del entries[key]
+
+    def _find_documents(self, query: dict) -> List[dict]:
+        """Returns the stored documents matching 'query', using an index when possible"""
+        with self._lock:
+            candidates = None
+            id_condition = query.get("_id", _MISSING)
+            if id_condition is not _MISSING and not isinstance(id_condition, dict):
+                candidates = [self.documents.get(_hashable(id_condition))]
+            elif isinstance(id_condition, dict) and list(id_condition) == ["$in"]:
+                candidates = [self.documents.get(_hashable(i)) for i in id_condition["$in"]]
+            else:
+                for fields, _, entries in self.indexes:
+                    values = [query.get(field, _MISSING) for field in fields]
+                    if all(
+                        value is not _MISSING and not isinstance(value, (dict, list))
+                        for value in values
+                    ):
+                        ids = entries.get(_hashable(values), set())
+                        candidates = [self.documents[document_id] for document_id in ids]
+                        break
+            if candidates is None:
+                candidates = list(self.documents.values())
+            return [
+                document
+                for document in candidates
+                if document is not None and matches(document, query)
+            ]
+
+    # Reads
+
+    def find(self, filter: dict = None, projection: dict = None, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, filter or {}, projection)
+
+    def find_one(self, filter: dict = None, projection: dict = None, **kwargs) -> Optional[dict]:
+        return next(self.find(filter, projection).limit(1), None)
+
+    def count_documents(self, filter: dict, **kwargs) -> int:
+        return len(self._find_documents(filter))
+
+    # Writes
+
+    def _insert(self, document: dict) -> Any:
+        if "_id" not in document:
+            # Like pymongo, the inserted document is given its generated `_id`
+            document["_id"] = bson.ObjectId()
+        stored = copy.deepcopy(document)
+        key = _hashable(stored["_id"])
+        if key in self.documents:
+            raise pymongo.errors.DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.full_name} index: _id_"
+            )
+        self._check_unique(stored)
+        self.documents[key] = stored
+        self._add_to_indexes(stored)
+        self.database.server.log_operation("i", self.full_name, copy.deepcopy(stored))
+        return stored["_id"]
+
+    def _replace_document(self, old: dict, new: dict, oplog_entry: dict) -> None:
+        self._check_unique(new, ignore_id=old["_id"])
+        self._remove_from_indexes(old)
+        self.documents[_hashable(old["_id"])] = new
+        self._add_to_indexes(new)
+        self.database.server.log_operation("u", self.full_name, oplog_entry, {"_id": old["_id"]})
+
+    def _update(self, filter: dict, update: dict, upsert: bool, many: bool) -> dict:
+        """Applies 'update' to the documents matching 'filter', returns a raw write result"""
+        found = self._find_documents(filter)
+        if not many:
+            found = found[:1]
+        result = {"n": 0, "nModified": 0}
+        for document in found:
+            updated = copy.deepcopy(document)
+            apply_update(updated, update)
+            result["n"] += 1
+            if updated == document:
+                # Updates that don't change anything are not written to the oplog
+                continue
+            changed = {key: value for key, value in updated.items() if document.get(key) != value}
+            removed = {key: True for key in document if key not in updated}
+            oplog_entry = {"$set": copy.deepcopy(changed)} if changed else {}
+            if removed:
+                oplog_entry["$unset"] = removed
+            self._replace_document(document, updated, oplog_entry)
+            result["nModified"] += 1
+        if found == [] and upsert:
+            document = {
+                key: value
+                for key, value in filter.items()
+                if not key.startswith("$") and not isinstance(value, dict)
+            }
+            apply_update(document, update, inserting=True)
+            result["n"] = 1
+            result["upserted"] = self._insert(document)
+        return result
+
+    def _replace(self, filter: dict, replacement: dict, upsert: bool) -> dict:
+        found = self._find_documents(filter)[:1]
+        if found == []:
+            if not upsert:
+                return {"n": 0, "nModified": 0}
+            document = copy.deepcopy(replacement)
+            if "_id" not in document and "_id" in filter and not isinstance(filter["_id"], dict):
+                document["_id"] = filter["_id"]
+            return {"n": 1, "nModified": 0, "upserted": self._insert(document)}
+        old = found[0]
+        new = copy.deepcopy(replacement)
+        new["_id"] = old["_id"]
+        if new == old:
+            return {"n": 1, "nModified": 0}
+        self._replace_document(old, new, copy.deepcopy(new))
+        return {"n": 1, "nModified": 1}
+
+    def _delete(self, filter: dict, many: bool) -> int:
+        found = self._find_documents(filter)
+        if not many:
+            found = found[:1]
+        for document in found:
+            del self.documents[_hashable(document["_id"])]
+            self._remove_from_indexes(document)
+            self.database.server.log_operation("d", self.full_name, {"_id": document["_id"]})
+        return len(found)
+
+    def insert_one(self, document: dict, **kwargs) -> results.InsertOneResult:
+        with self._lock:
+            inserted_id = self._insert(document)
+        metrics.RECORDER.record(queries=1, documents_written=1)
+        return results.InsertOneResult(inserted_id, True)
+
+    def insert_many(self, documents: List[dict], ordered: bool = True, **kwargs):
+        with self._lock:
+            inserted_ids = [self._insert(document) for document in documents]
+        metrics.RECORDER.record(queries=1, documents_written=len(inserted_ids))
+        return results.InsertManyResult(inserted_ids, True)
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        with self._lock:
+            raw_result = self._update(filter, update, upsert, many=False)
+        metrics.RECORDER.record(queries=1, documents_written=raw_result["n"])
+        return results.UpdateResult(raw_result, True)
+
+    def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        with self._lock:
+            raw_result = self._update(filter, update, upsert, many=True)
+        metrics.RECORDER.record(queries=1, documents_written=raw_result["n"])
+        return results.UpdateResult(raw_result, True)
+
+    def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs):
+        with self._lock:
+            raw_result = self._replace(filter, replacement, upsert)
+        metrics.RECORDER.record(queries=1, documents_written=raw_result["n"])
+        return results.UpdateResult(raw_result, True)
+
+    def delete_one(self, filter: dict, **kwargs) -> results.DeleteResult:
+        with self._lock:
+            deleted = self._delete(filter, many=False)
+        metrics.RECORDER.record(queries=1, documents_written=deleted)
+        return results.DeleteResult({"n": deleted}, True)
+
+    def delete_many(self, filter: dict, **kwargs) -> results.DeleteResult:
+        with self._lock:
+            deleted = self._delete(filter, many=True)
+        metrics.RECORDER.record(queries=1, documents_written=deleted)
+        return results.DeleteResult({"n": deleted}, True)
+
+    def bulk_write(self, requests: list, ordered: bool = True, **kwargs):
+        """Applies pymongo bulk write operations, raising BulkWriteError if any of them fail"""
+        result = {
+            "nInserted": 0,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+            "upserted": [],
+            "writeErrors": [],
+        }
+        with self._lock:
+            for index, request in enumerate(requests):
+                try:
+                    if isinstance(request, operations.InsertOne):
+                        self._insert(request._doc)
+                        result["nInserted"] += 1
+                        continue
+                    if isinstance(request, (operations.DeleteOne, operations.DeleteMany)):
+                        result["nRemoved"] += self._delete(
+                            request._filter, isinstance(request, operations.DeleteMany)
+                        )
+                        continue
+                    if isinstance(request, operations.ReplaceOne):
+                        raw_result = self._replace(request._filter, request._doc, request._upsert)
+                    elif isinstance(request, (operations.UpdateOne, operations.UpdateMany)):
+                        raw_result = self._update(
+                            request._filter,
+                            request._doc,
+                            request._upsert,
+                            isinstance(request, operations.UpdateMany),
+                        )
+                    else:
+                        raise TypeError(f"{request!r} is not a valid request")
+                    if "upserted" in raw_result:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": raw_result["upserted"]})
+                    else:
+                        result["nMatched"] += raw_result["n"]
+                        result["nModified"] += raw_result["nModified"]
+                except pymongo.errors.DuplicateKeyError as error:
+                    result["writeErrors"].append(
+                        {"index": index, "code": 11000, "errmsg": str(error), "op": request}
+                    )
+                    if ordered:
+                        break
+        metrics.RECORDER.record(queries=1, documents_written=len(requests))
+        if result["writeErrors"] != []:
+            raise pymongo.errors.BulkWriteError(result)
+        return results.BulkWriteResult(result, True)
+
+    def drop(self) -> None:
+        self.database.drop_collection(self.name)
+
+    def rename(self, new_name: str, dropTarget: bool = False, **kwargs) -> None:
+        """Moves the documents, indexes and validator to 'new_name' in one step"""
+        self.database.rename_collection(self.name, new_name, dropTarget)
+
+    def with_options(self, **kwargs) -> "MemoryCollection":
+        """Options such as the write concern don't apply, every write is applied immediately"""
+        return self
+
+
+class MemoryOplog(MemoryCollection):
+    """Simulated replica set oplog, entries are kept in timestamp order"""
+
+    def __init__(self, database: "MemoryDB"):
+        super().__init__(database, "oplog.rs")
+        self.entries: List[dict] = []
+
+    def append(self, entry: dict) -> None:
+        self.entries.append(entry)
+
+    def _find_documents(self, query: dict) -> List[dict]:
+        with self._lock:
+            start = 0
+            # Entries are in timestamp order, so a query on a minimum timestamp can skip ahead
+            ts_condition = query.get("ts")
+            if isinstance(ts_condition, dict):
+                timestamps = [entry["ts"] for entry in self.entries]
+                if "$gt" in ts_condition:
+                    start = bisect.bisect_right(timestamps, ts_condition["$gt"])
+                elif "$gte" in ts_condition:
+                    start = bisect.bisect_left(timestamps, ts_condition["$gte"])
+            return [entry for entry in self.entries[start:] if matches(entry, query)]
+
+
+class MemoryDB:
+    """One database of a memory server, creates collections when they are first used"""
+
+    def __init__(self, server: "MemoryServer", name: str):
+        self.server = server
+        self.name = name
+        self.collections: Dict[str, MemoryCollection] = {}
+        self.validators: Dict[str, dict] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if self.name == "local" and name == "oplog.rs":
+            return self.server.oplog
+        with self.server.lock:
+            if name not in self.collections:
+                self.collections[name] = MemoryCollection(self, name)
+            return self.collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    def create_collection(self, name: str, **kwargs) -> MemoryCollection:
+        with self.server.lock:
+            if name in self.collections:
+                raise pymongo.errors.CollectionInvalid(f"collection {name} already exists")
+            if "validator" in kwargs:
+                self.validators[name] = kwargs["validator"]
+            return self[name]
+
+    def rename_collection(self, name: str, new_name: str, drop_target: bool = False) -> None:
+        with self.server.lock:
+            if name not in self.collections:
+                raise pymongo.errors.OperationFailure(f"source namespace {name} does not exist")
+            if new_name in self.collections and not drop_target:
+                raise pymongo.errors.OperationFailure(f"target namespace {new_name} exists")
+            collection = self.collections.pop(name)
+            collection.name = new_name
+            collection.full_name = f"{self.name}.{new_name}"
+            self.collections[new_name] = collection
+            self.validators.pop(new_name, None)
+            if name in self.validators:
+                self.validators[new_name] = self.validators.pop(name)
+            self.server.log_operation(
+                "c",
+                f"{self.name}.$cmd",
+                {
+                    "renameCollection": f"{self.name}.{name}",
+                    "to": f"{self.name}.{new_name}",
+                    "dropTarget": drop_target,
+                },
+            )
+
+    def list_collection_names(self) -> List[str]:
+        return list(self.collections.keys())
+
+    def drop_collection(self, name: str) -> None:
+        with self.server.lock:
+            self.collections.pop(name, None)
+            self.validators.pop(name, None)
+
+    def command(self, command: Any, *args, **kwargs) -> dict:
+        """Supports `collMod` to set validators, which are stored but not enforced"""
+        command = dict(command) if not isinstance(command, str) else {command: 1}
+        if "collMod" in command:
+            self.validators[command["collMod"]] = command.get("validator", {})
+            return {"ok": 1.0}
+        if "ping" in command:
+            return {"ok": 1.0}
+        raise NotImplementedError(f"Command {list(command)[0]} is not supported")
+
+
+class MemoryServer:
+    """Data shared by every client of one address, including the oplog"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.databases: Dict[str, MemoryDB] = {}
+        self.oplog = MemoryOplog(MemoryDB(self, "local"))
+        self._last_timestamp = bson.Timestamp(0, 0)
+        # A replica set always has an oplog entry from when it was started
+        self.log_operation("n", "", {"msg": "initiating set"})
+
+    def next_timestamp(self) -> bson.Timestamp:
+        seconds = int(time.time())
+        if seconds <= self._last_timestamp.time:
+            timestamp = bson.Timestamp(self._last_timestamp.time, self._last_timestamp.inc + 1)
+        else:
+            timestamp = bson.Timestamp(seconds, 1)
+        self._last_timestamp = timestamp
+        return timestamp
+
+    def log_operation(self, op: str, namespace: str, o: dict, o2: dict = None) -> None:
+        with self.lock:
+            entry = {"ts": self.next_timestamp(), "op": op, "ns": namespace, "o": o}
+            if o2 is not None:
+                entry["o2"] = o2
+            self.oplog.append(entry)
+
+    def get_database(self, name: str) -> MemoryDB:
+        with self.lock:
+            if name not in self.databases:
+                self.databases[name] = MemoryDB(self, name)
+            return self.databases[name]
+
+
+class MemoryClient:
+    """Replaces `pymongo.MongoClient`, clients with the same host and port share their data"""
+
+    def __init__(self, host: str = "localhost", port: int = 27017, **kwargs):
+        self.address = (host, port)
+        with _SERVERS_LOCK:
+            if self.address not in _SERVERS:
+                _SERVERS[self.address] = MemoryServer()
+            self.server = _SERVERS[self.address]
+
+    def __getitem__(self, name: str) -> MemoryDB:
+        if name == "local":
+            return self.server.oplog.database
+        return self.server.get_database(name)
+
+    def __getattr__(self, name: str) -> MemoryDB:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_database_names(self) -> List[str]:
+        return list(self.server.databases.keys())
+
+    def drop_database(self, name: str) -> None:
+        with self.server.lock:
+            self.server.databases.pop(name, None)
+
+    def close(self) -> None:
+        pass
+
+
+def reset(host: Optional[str] = None, port: Optional[int] = None) -> None:
+    """Removes the data of the memory server at 'host' and 'port', or of every server"""
+    with _SERVERS_LOCK:
+        if host is None:
+            _SERVERS.clear()
+        else:
+            _SERVERS.pop((host, port), None)
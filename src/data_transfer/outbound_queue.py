@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+"""Durable, disk-backed queue of documents waiting to be sent to the cloud database.
+
+Only the collection and `_id` of each changed document are queued. When the queue is drained, the
+current version of each document is read from the local database, so any number of changes to
+one document while offline are sent as a single write. Records are appended to a file of BSON
+documents, and the position of the first unsent record is stored next to it, so queued changes
+survive server restarts. The oplog timestamp of the newest queued change is stored as well, so a
+restarted server resumes queueing from where it stopped instead of skipping the changes in between.
+"""
+
+import os
+import struct
+from typing import Any, List, Optional, Tuple
+
+import bson
+
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class OutboundQueue:
+    QUEUE_DIRECTORY = "data/cloud_queue"
+
+    def __init__(self, name: str, directory: str = None):
+        if directory is None:
+            directory = utils.create_file_path(self.QUEUE_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.bson")
+        self.offset_path = os.path.join(directory, f"{name}.offset")
+        self.watermark_path = os.path.join(directory, f"{name}.watermark")
+        self._file = open(self.path, "ab")
+        self.offset = self._read_offset()
+        self.watermark = self._read_watermark()
+        # Keys already waiting in the queue, used to avoid queueing the same document twice
+        self._pending = set()
+        keys, end_offset = self.read(self.offset)
+        for collection, document_id in keys:
+            self._pending.add((collection, self._hashable(document_id)))
+        # Remove a partially written record left by a crash so new records can be read after it
+        if end_offset < os.path.getsize(self.path):
+            self._file.truncate(end_offset)
+
+    @staticmethod
+    def _hashable(document_id: Any) -> Any:
+        """Dictionary `_id`s can't be put in a set, so use their encoded form instead"""
+        if isinstance(document_id, dict):
+            return bson.encode(document_id)
+        return document_id
+
+    def _read_offset(self) -> int:
+        try:
+            with open(self.offset_path) as offset_file:
+                return int(offset_file.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _read_watermark(self) -> Optional[bson.Timestamp]:
+        try:
+            with open(self.watermark_path, "rb") as watermark_file:
+                return bson.decode(watermark_file.read())["ts"]
+        except (FileNotFoundError, bson.errors.InvalidBSON, KeyError):
+            return None
+
+    def _write_watermark(self, watermark: bson.Timestamp) -> None:
+        temp_path = f"{self.watermark_path}.tmp"
+        with open(temp_path, "wb") as watermark_file:
+            watermark_file.write(bson.encode({"ts": watermark}))
+        os.replace(temp_path, self.watermark_path)
+        self.watermark = watermark
+
+    def append(
+        self, keys: List[Tuple[str, Any]], watermark: Optional[bson.Timestamp] = None
+    ) -> int:
+        """Adds (collection, _id) keys to the end of the queue, returns the number added
+
+        Keys that are already in the queue are skipped. 'watermark' is the oplog timestamp of the
+        newest change in 'keys', it is saved after the keys so no change is skipped after a crash.
+        """
+        records = []
+        for collection, document_id in keys:
+            pending_key = (collection, self._hashable(document_id))
+            if pending_key in self._pending:
+                continue
+            self._pending.add(pending_key)
+            records.append(bson.encode({"c": collection, "i": document_id}))
+        if records:
+            self._file.write(b"".join(records))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        if watermark is not None:
+            self._write_watermark(watermark)
+        return len(records)
+
+    def read(self, offset: int, max_records: int = None) -> Tuple[List[Tuple[str, Any]], int]:
+        """Reads up to 'max_records' keys starting at 'offset', returns the keys and end offset"""
+        keys = []
+        with open(self.path, "rb") as queue_file:
+            queue_file.seek(offset)
+            while max_records is None or len(keys) < max_records:
+                length_bytes = queue_file.read(4)
+                if len(length_bytes) < 4:
+                    break
+                (length,) = struct.unpack("<i", length_bytes)
+                record_bytes = queue_file.read(length - 4)
+                # Stop at a partially written record
+                if len(record_bytes) < length - 4:
+                    break
+                record = bson.decode(length_bytes + record_bytes)
+                keys.append((record["c"], record["i"]))
+                offset += length
+        return keys, offset
+
+    def next_batch(self, max_records: int) -> Tuple[List[Tuple[str, Any]], int]:
+        """Returns the next 'max_records' keys and the offset to commit once they are sent
+
+        The keys stay in the queue until they are committed, but changes made to their documents
+        from now on are queued again, since the documents may be read before those changes.
+        """
+        keys, end_offset = self.read(self.offset, max_records)
+        for collection, document_id in keys:
+            self._pending.discard((collection, self._hashable(document_id)))
+        return keys, end_offset
+
+    def commit(self, offset: int) -> None:
+        """Marks every key before 'offset' as sent
+
+        Once the whole queue has been sent, the queue file is emptied so it does not keep growing.
+        """
+        if offset >= os.path.getsize(self.path):
+            self._file.truncate(0)
+            offset = 0
+        self.offset = offset
+        temp_path = f"{self.offset_path}.tmp"
+        with open(temp_path, "w") as offset_file:
+            offset_file.write(str(offset))
+        os.replace(temp_path, self.offset_path)
+
+    def is_empty(self) -> bool:
+        return self.offset >= os.path.getsize(self.path)
+
+    def clear(self) -> None:
+        """Removes every key from the queue"""
+        self._pending.clear()
+        self.commit(os.path.getsize(self.path))
@@ -6,27 +6,65 @@ Caches data to prevent duplicate data retrieval from the TBA API.
 API documentation: https://www.thebluealliance.com/apidocs/v3.
 """
 
+import concurrent.futures
+from typing import Any, Dict, Iterable, List, Optional
+
 import requests
 
 from data_transfer import database
+import metrics
 import utils
 import logging
 
 log = logging.getLogger(__name__)
 
+# Endpoints that calculations request every cycle, formatted with the event key
+CYCLE_ENDPOINTS = [
+    "event/{}/matches",
+    "event/{}/rankings",
+    "event/{}/teams/simple",
+    "event/{}/insights",
+    "event/{}/alliances",
+]
+
+# Responses to return instead of requesting TBA, by API url. Used to run the calculations on
+# synthetic events without internet.
+_local_payloads: Optional[Dict[str, Any]] = None
+# Responses fetched by `prefetch` at the start of a server cycle, by API url
+_snapshot: Dict[str, Any] = {}
+
+
+def use_local_payloads(payloads: Optional[Dict[str, Any]]) -> None:
+    """Makes `tba_request` return 'payloads' instead of requesting TBA, None to use TBA again"""
+    global _local_payloads
+    _local_payloads = payloads
+
 
+def cycle_endpoints(event_key: str) -> List[str]:
+    return [endpoint.format(event_key) for endpoint in CYCLE_ENDPOINTS]
+
+
+@metrics.timed("tba_request")
 def tba_request(api_url):
     """Sends a single web request to the TBA API v3 api_url is the suffix of the API request URL
 
     (the part after '/api/v3').
     """
     log.info(f"tba request from {api_url} started")
+    if _local_payloads is not None and api_url in _local_payloads:
+        return _local_payloads[api_url]
+    if api_url in _snapshot:
+        return _snapshot[api_url]
+    return _fetch(api_url, get_api_key(), database.Database())
+
+
+def _fetch(api_url: str, api_key: str, db: database.Database) -> Any:
+    """Requests 'api_url', only downloading the response if it changed since it was cached"""
     full_url = f"https://www.thebluealliance.com/api/v3/{api_url}"
-    request_headers = {"X-TBA-Auth-Key": get_api_key()}
-    db = database.Database()
+    request_headers = {"X-TBA-Auth-Key": api_key}
     cached = db.get_tba_cache(api_url)
-    # Check if cache exists
-    if cached:
+    # Check if cache exists, the cache has no ETag if it was written by `tba_webhook`
+    if cached and "etag" in cached:
         request_headers["If-None-Match"] = cached["etag"]
     print(f"Retrieving data from {full_url}")
     log.info(f"tba request from {api_url} finished")
@@ -35,17 +73,56 @@ def tba_request(api_url):
     except requests.exceptions.ConnectionError:
         log.warning("Error: No internet connection.")
         return None
+    metrics.RECORDER.record(bytes_received=len(request.content))
     # A 200 status code means the request was successful
     # 304 means that data was not modified since the last timestamp
     # specified in request_headers['If-Modified-Since']
     if request.status_code == 304:
         return cached["data"]
     if request.status_code == 200:
-        db.update_tba_cache(request.json(), api_url, request.headers["etag"])
+        # If `tba_webhook` wrote the cache since it was read, its scores are kept, and the next
+        # request downloads the response again because the ETag didn't change
+        db.update_tba_cache(request.json(), api_url, request.headers["etag"], cached)
         return request.json()
     raise Warning(f"Request failed with status code {request.status_code}")
 
 
+@metrics.timed("tba_prefetch")
+def prefetch(api_urls: Iterable[str]) -> Dict[str, Any]:
+    """Requests every url in 'api_urls' at the same time, and makes `tba_request` return the
+    responses until `clear_snapshot` is called
+
+    Urls that fail are left out, so `tba_request` requests them again. Returns the responses.
+    """
+    api_urls = [url for url in api_urls if _local_payloads is None or url not in _local_payloads]
+    if api_urls == []:
+        return {}
+    try:
+        api_key = get_api_key()
+    except FileNotFoundError:
+        log.warning("TBA API key not found, not prefetching TBA data")
+        return {}
+    db = database.Database()
+    responses = {}
+    with concurrent.futures.ThreadPoolExecutor(len(api_urls)) as executor:
+        futures = {executor.submit(_fetch, url, api_key, db): url for url in api_urls}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                response = future.result()
+            except Warning as e:
+                log.warning(f"Unable to prefetch {futures[future]}: {e}")
+                continue
+            if response is not None:
+                responses[futures[future]] = response
+    _snapshot.update(responses)
+    return responses
+
+
+def clear_snapshot() -> None:
+    """Makes `tba_request` request TBA again instead of returning prefetched responses"""
+    _snapshot.clear()
+
+
 def get_api_key() -> str:
     with open(utils.create_file_path("data/api_keys/tba_key.txt")) as file:
         api_key = file.read().rstrip("\n")
@@ -14,8 +14,8 @@ import os
 import re
 from typing import List, Dict, Tuple, Optional, Any
 import shutil
-import json
 
+import match_schedule
 import utils
 from server import Server
 import logging
@@ -23,7 +23,6 @@ import logging
 log = logging.getLogger(__name__)
 
 DATABASE = database.Database()
-SCHEMA = utils.read_schema("schema/collection_schema.yml")
 
 
 class BaseExport:
@@ -33,9 +32,10 @@ class BaseExport:
         The collections schenma, timestamp and teams_list will be used heavily
         in subclasses and to avoid repetition
         """
-        self.collections = list(SCHEMA["collections"].keys())
+        self.collections = list(database.get_collection_schema()["collections"].keys())
         self.timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         self.teams_list = self.get_teams_list()
+        self.team_set = frozenset(self.teams_list)
         self.name = None
 
     @staticmethod
@@ -60,11 +60,8 @@ class BaseExport:
 
     @staticmethod
     def get_teams_list() -> List[str]:
-        """Access all the team numbers via the team_list.csv"""
-        with open(
-            utils.create_file_path(f"data/{Server.TBA_EVENT_KEY}_team_list.json")
-        ) as team_list:
-            return list(json.load(team_list))
+        """Access all the team numbers via the team_list.json, see `match_schedule`"""
+        return list(match_schedule.get(Server.TBA_EVENT_KEY).teams)
 
     @staticmethod
     def order_headers(column_headers: List[str], ordered: List[str]) -> List[str]:
@@ -187,8 +184,6 @@ class ExportTIM(BaseExport):
         """
         super().__init__()
         self.name = self.create_name("tim_export")
-        self.teams_list = self.get_teams_list()
-
         self.column_headers, self.final_built_data = self.build_data()
 
     def build_data(self) -> Tuple[List[str], Dict[Tuple[str, int], List[Dict[str, Any]]]]:
@@ -211,7 +206,7 @@ class ExportTIM(BaseExport):
                 # Gets the team num from the document
                 team_num = str(document["team_number"])
                 # Ignore teams not in the teams list
-                if team_num not in self.teams_list:
+                if team_num not in self.team_set:
                     continue
 
                 match_num = document["match_number"]
@@ -258,8 +253,6 @@ class ExportTeam(BaseExport):
         """
         super().__init__()
         self.name = self.create_name("team_export")
-        self.teams_list = self.get_teams_list()
-
         self.column_headers, self.final_built_data = self.build_data()
 
     def build_data(self) -> Tuple[List[str], Dict[Tuple[str, int], List[Dict[str, Any]]]]:
@@ -284,7 +277,7 @@ class ExportTeam(BaseExport):
                 team_num = str(document["team_number"])
 
                 # Filter out teams not in teams list
-                if team_num not in self.teams_list:
+                if team_num not in self.team_set:
                     continue
 
                 # Check if data exists for team_num
@@ -409,7 +402,7 @@ class ExportImagePaths(BaseExport):
                 if result:
                     # Team number is the result of the first capture type
                     team_num = result.group(1)
-                    if team_num not in self.teams_list:
+                    if team_num not in self.team_set:
                         continue
                     # Photo type is the result of the second capture group
                     photo_type = result.group(2)
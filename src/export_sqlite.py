@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+"""Exports the calculated data of an event to a single SQLite file for analysts.
+
+Unlike the CSVs from `export_csvs`, the file can be filtered and joined without the server or
+MongoDB, e.g. with the sqlite3 command line or pandas. Each exported collection is a table with a
+column for each field and an index on the fields that identify its documents. The `tim` and `team`
+views join the same collections as the TIM and team CSV exports.
+
+Documents are streamed from the database, and an existing file is updated in place: each row
+stores the hash of its document, so only documents that changed since the last export are written,
+and the rows of deleted documents are removed. Lists and dictionaries are stored as JSON.
+
+A NumPy .npz snapshot with an array for each column of each table can be written next to the file.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from data_transfer import database
+from data_transfer.database import hash_document
+import utils
+
+log = logging.getLogger(__name__)
+
+# Exported collections, with the fields that identify their documents, which are indexed
+TABLES = {
+    "obj_tim": ["team_number", "match_number"],
+    "tba_tim": ["team_number", "match_number"],
+    "obj_team": ["team_number"],
+    "subj_team": ["team_number"],
+    "tba_team": ["team_number"],
+    "pickability": ["team_number"],
+    "raw_obj_pit": ["team_number"],
+    "sim_precision": ["scout_name", "match_number"],
+    "scout_precision": ["scout_name"],
+    "predicted_aim": ["match_number", "alliance_color_is_red"],
+    "auto_paths": ["team_number", "start_position", "path_number"],
+}
+# Views of the TIM and team exports, with the table every row comes from and the joined tables
+VIEWS = {
+    "tim": ("obj_tim", ["tba_tim"]),
+    "team": ("obj_team", ["subj_team", "tba_team", "pickability", "raw_obj_pit"]),
+}
+# Columns of every table with the `_id` of each document and the hash of its contents
+ID_COLUMN = "_id"
+HASH_COLUMN = "_hash"
+# Key and value of the time and event of the latest export
+INFO_TABLE = "export_info"
+# Number of documents read from the database and written to the file at a time
+BATCH_SIZE = 1000
+
+
+def quote(name: str) -> str:
+    """Quotes a table or column name"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def to_sql_value(value: Any) -> Any:
+    """Converts a field of a document to a value SQLite can store"""
+    if isinstance(value, bool):
+        return int(value)
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return json.dumps(value, default=str)
+
+
+def column_array(values: List[Any]) -> np.ndarray:
+    """Returns an array of a column, floats with NaN for missing numbers, strings otherwise"""
+    present = [value for value in values if value is not None]
+    if present != [] and all(isinstance(value, (int, float)) for value in present):
+        if len(present) == len(values) and all(isinstance(value, int) for value in present):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    return np.array(["" if value is None else str(value) for value in values], dtype=str)
+
+
+class SQLiteExport:
+    def __init__(self, path: str, db: Optional[database.Database] = None):
+        self.path = path
+        self.db = db if db is not None else database.Database()
+        self.connection = sqlite3.connect(path)
+        # Columns of each table, so new fields can be added as columns
+        self.columns: Dict[str, List[str]] = {}
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def create_table(self, table: str) -> None:
+        """Creates a table and the index of its key fields, if they don't exist"""
+        key_columns = TABLES[table]
+        columns = [f"{quote(ID_COLUMN)} TEXT PRIMARY KEY", f"{quote(HASH_COLUMN)} TEXT"]
+        columns.extend(quote(column) for column in key_columns)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {quote(table)} ({', '.join(columns)})")
+        self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote(table + '_keys')} ON {quote(table)} "
+            f"({', '.join(quote(column) for column in key_columns)})"
+        )
+        self.columns[table] = [
+            row[1] for row in self.connection.execute(f"PRAGMA table_info({quote(table)})")
+        ]
+
+    def add_columns(self, table: str, columns: List[str]) -> None:
+        for column in columns:
+            if column not in self.columns[table]:
+                self.connection.execute(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column)}")
+                self.columns[table].append(column)
+
+    def write_rows(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Replaces the rows with the same `_id`s as 'rows'"""
+        # Documents can have different fields, so rows with the same fields are written together
+        rows_by_columns: Dict[tuple, List[tuple]] = {}
+        for row in rows:
+            rows_by_columns.setdefault(tuple(row), []).append(tuple(row.values()))
+        for columns, values in rows_by_columns.items():
+            self.add_columns(table, list(columns))
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {quote(table)} ({', '.join(map(quote, columns))}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                values,
+            )
+
+    def export_collection(self, collection: str) -> Dict[str, int]:
+        """Writes the documents of 'collection' that changed since the last export to its table
+
+        Returns the number of rows written and deleted.
+        """
+        self.create_table(collection)
+        hashes = dict(
+            self.connection.execute(
+                f"SELECT {quote(ID_COLUMN)}, {quote(HASH_COLUMN)} FROM {quote(collection)}"
+            )
+        )
+        seen = set()
+        rows = []
+        written = 0
+        for document in self.db.db[collection].find({}, batch_size=BATCH_SIZE):
+            document_id = str(document["_id"])
+            seen.add(document_id)
+            document_hash = hash_document(document)
+            if hashes.get(document_id) == document_hash:
+                continue
+            row = {ID_COLUMN: document_id, HASH_COLUMN: document_hash}
+            row.update(
+                (field, to_sql_value(value)) for field, value in document.items() if field != "_id"
+            )
+            rows.append(row)
+            if len(rows) >= BATCH_SIZE:
+                self.write_rows(collection, rows)
+                written += len(rows)
+                rows = []
+        self.write_rows(collection, rows)
+        written += len(rows)
+        deleted = [(document_id,) for document_id in hashes if document_id not in seen]
+        self.connection.executemany(
+            f"DELETE FROM {quote(collection)} WHERE {quote(ID_COLUMN)} = ?", deleted
+        )
+        return {"written": written, "deleted": len(deleted)}
+
+    def create_views(self) -> None:
+        """Creates the views joining the TIM and team tables
+
+        Views list their columns, so they are created again after columns are added. Columns that
+        are in more than one table are taken from the first table.
+        """
+        for view, (base_table, joined_tables) in VIEWS.items():
+            key_columns = TABLES[base_table]
+            selected = []
+            columns = []
+            for table in [base_table] + joined_tables:
+                for column in self.columns[table]:
+                    if column not in [ID_COLUMN, HASH_COLUMN] and column not in selected:
+                        selected.append(column)
+                        columns.append(f"{quote(table)}.{quote(column)}")
+            joins = "".join(
+                f" LEFT JOIN {quote(table)} USING ({', '.join(map(quote, key_columns))})"
+                for table in joined_tables
+            )
+            self.connection.execute(f"DROP VIEW IF EXISTS {quote(view)}")
+            self.connection.execute(
+                f"CREATE VIEW {quote(view)} AS SELECT {', '.join(columns)} "
+                f"FROM {quote(base_table)}{joins}"
+            )
+
+    def export(self) -> Dict[str, Dict[str, int]]:
+        """Updates the file with the current data, returns the rows written and deleted by table"""
+        results = {}
+        with self.connection:
+            for collection in TABLES:
+                results[collection] = self.export_collection(collection)
+            self.create_views()
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {INFO_TABLE} (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {INFO_TABLE} VALUES (?, ?)",
+                [("event_key", utils.TBA_EVENT_KEY), ("exported", datetime.now().isoformat())],
+            )
+        return results
+
+    def write_npz(self, path: str) -> None:
+        """Writes an array for each column of each table, named '<table>/<column>'"""
+        arrays = {}
+        for table in TABLES:
+            cursor = self.connection.execute(f"SELECT * FROM {quote(table)}")
+            columns = [description[0] for description in cursor.description]
+            table_rows = cursor.fetchall()
+            for index, column in enumerate(columns):
+                if column != HASH_COLUMN:
+                    arrays[f"{table}/{column}"] = column_array([row[index] for row in table_rows])
+        np.savez_compressed(path, **arrays)
+
+
+def parser():
+    parse = argparse.ArgumentParser()
+    parse.add_argument(
+        "--path",
+        help="SQLite file to create or update, defaults to data/exports/<event key>.sqlite",
+        default=None,
+    )
+    parse.add_argument(
+        "--npz", help="Also write a NumPy .npz snapshot next to it", action="store_true"
+    )
+    parse.add_argument(
+        "--full", help="Replace the file instead of updating it", action="store_true"
+    )
+    return parse.parse_args()
+
+
+if __name__ == "__main__":
+    args = parser()
+    path = args.path
+    if path is None:
+        path = utils.create_file_path(f"data/exports/{utils.TBA_EVENT_KEY}.sqlite")
+    if args.full and os.path.exists(path):
+        os.remove(path)
+    exporter = SQLiteExport(path)
+    for table, counts in exporter.export().items():
+        log.info(f"{table}: {counts['written']} rows written, {counts['deleted']} rows deleted")
+    if args.npz:
+        exporter.write_npz(os.path.splitext(path)[0] + ".npz")
+    exporter.close()
+    print(f"Exported to {path}")
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+
+"""Generates a complete synthetic competition for benchmarking and load testing.
+
+Unlike generate_test_qrs, which creates one random QR at a time for unit tests, this creates a
+whole event at a configurable scale: a team list, a qualification match schedule, objective QRs
+from 1-3 scouts for every robot in every match, one subjective QR per alliance, and the TBA API
+payloads the calculations request, with 2023 score breakdowns. Scouts watching the same robot
+see mostly the same actions, with an occasional missed action, like real scouts.
+
+Everything is generated from a seed, so the same arguments always create the same event.
+"""
+
+import argparse
+import copy
+import json
+import random
+from typing import Any, Dict, List
+
+from calculations import compression
+import generate_test_qrs
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+# Event key used for synthetic events so they never overwrite files of a real event
+SYNTHETIC_EVENT_KEY = "2023synth"
+# Rows of a 2023 grid in a TBA score breakdown
+GRID_ROWS = ["B", "M", "T"]
+# Points for a game piece in the bottom, middle, and top rows, in autonomous and teleop
+GRID_POINTS = {"auto": {"B": 3, "M": 4, "T": 6}, "tele": {"B": 2, "M": 3, "T": 5}}
+# Probability that a scout misses any one action of the robot they are watching
+MISSED_ACTION_CHANCE = 0.05
+# Seconds between scheduled qualification matches
+MATCH_CYCLE_TIME = 7 * 60
+
+
+class SyntheticEvent:
+    """A generated competition with 'num_teams' teams and 'num_matches' qualification matches"""
+
+    def __init__(
+        self,
+        num_teams: int = 40,
+        num_matches: int = 80,
+        min_scouts: int = 1,
+        max_scouts: int = 3,
+        seed: int = 1678,
+        event_key: str = SYNTHETIC_EVENT_KEY,
+        start_time: int = 1680000000,
+    ):
+        if num_teams < 6:
+            raise ValueError("A synthetic event needs at least 6 teams to fill a match")
+        self.num_teams = num_teams
+        self.num_matches = num_matches
+        self.min_scouts = min_scouts
+        self.max_scouts = max_scouts
+        self.event_key = event_key
+        self.start_time = start_time
+        self.random = random.Random(seed)
+        self.teams = sorted(
+            str(number) for number in self.random.sample(range(1, 9999), self.num_teams)
+        )
+        self.schedule = self.generate_schedule()
+        # Underlying skill of each team, so TBA results for a team are consistent across matches
+        self.skill = {team: self.random.uniform(0.2, 1.0) for team in self.teams}
+        self.scouts = [f"SCOUT{number}" for number in range(1, 6 * self.max_scouts + 1)]
+        # TBA matches by match number, generated once so results don't change between requests
+        self.tba_matches: Dict[int, Dict[str, Any]] = {}
+
+    def generate_schedule(self) -> Dict[int, Dict[str, List[str]]]:
+        """Creates a schedule where every team plays about the same number of matches"""
+        schedule = {}
+        queue = []
+        for match_number in range(1, self.num_matches + 1):
+            teams = []
+            while len(teams) < 6:
+                if queue == []:
+                    queue = self.random.sample(self.teams, len(self.teams))
+                team = queue.pop()
+                # A team can't play twice in the same match
+                if team not in teams:
+                    teams.append(team)
+            schedule[match_number] = {"red": teams[:3], "blue": teams[3:]}
+        return schedule
+
+    def match_time(self, match_number: int) -> int:
+        return self.start_time + (match_number - 1) * MATCH_CYCLE_TIME
+
+    def match_schedule_json(self) -> Dict[str, dict]:
+        """Match schedule in the format written by send_device_jsons.create_match_schedule_json"""
+        return {
+            str(match_number): {
+                "teams": [
+                    {"number": team, "color": alliance}
+                    for alliance in ["blue", "red"]
+                    for team in alliances[alliance]
+                ]
+            }
+            for match_number, alliances in self.schedule.items()
+        }
+
+    def write_event_files(self) -> None:
+        """Writes the team list and match schedule files that the calculations read"""
+        with open(utils.create_file_path(f"data/{self.event_key}_team_list.json"), "w") as file:
+            json.dump(self.teams, file)
+        with open(
+            utils.create_file_path(f"data/{self.event_key}_match_schedule.json"), "w"
+        ) as file:
+            json.dump(self.match_schedule_json(), file)
+
+    def generate_obj_tims(self, match_number: int, alliance: str, team: str) -> List[str]:
+        """Generates objective QRs for 'team' from 1-3 scouts watching the same robot"""
+        # generate_test_qrs uses the global random module, so seed it from this event
+        random.seed(self.random.random())
+        timeline = generate_test_qrs.generate_timeline()
+        base_tim = {}
+        for data_field, info in generate_test_qrs.SCHEMA["objective_tim"].items():
+            if not data_field.startswith("_") and data_field != "timeline":
+                base_tim[data_field] = generate_test_qrs.generate_random_value(info[1], data_field)
+        base_tim["team_number"] = team
+        qrs = []
+        num_scouts = self.random.randint(self.min_scouts, self.max_scouts)
+        for scout_name in self.random.sample(self.scouts, num_scouts):
+            tim = copy.deepcopy(base_tim)
+            if "scout_id" in tim:
+                tim["scout_id"] = self.scouts.index(scout_name) % 18 + 1
+            tim.update(generate_test_qrs.generate_generic_data(match_number, scout_name))
+            if "alliance_color_is_red" in tim:
+                tim["alliance_color_is_red"] = alliance == "red"
+            tim["timeline"] = [
+                action
+                for action in timeline
+                if action["action_type"] == "to_teleop"
+                or self.random.random() > MISSED_ACTION_CHANCE
+            ]
+            qrs.append(compression.compress_obj_tim(tim))
+        return qrs
+
+    def generate_match_qrs(self, match_number: int) -> List[str]:
+        """Generates every objective and subjective QR for one match"""
+        qrs = []
+        for alliance, teams in self.schedule[match_number].items():
+            for team in teams:
+                qrs.extend(self.generate_obj_tims(match_number, alliance, team))
+            qrs.append(
+                generate_test_qrs.generate_subj_aim(
+                    teams, match_number, self.random.choice(self.scouts)
+                )
+            )
+        return qrs
+
+    def generate_qrs(self) -> Dict[int, List[str]]:
+        """Generates the QRs of every match, by match number"""
+        return {
+            match_number: self.generate_match_qrs(match_number) for match_number in self.schedule
+        }
+
+    def generate_grid(self, team_skills: List[float], period: str) -> Dict[str, List[str]]:
+        """Generates one alliance's grid, with more game pieces for more skilled alliances"""
+        fill_chance = sum(team_skills) / len(team_skills) * (0.25 if period == "auto" else 0.7)
+        return {
+            row: [
+                self.random.choice(["Cone", "Cube"])
+                if self.random.random() < fill_chance
+                else "None"
+                for _ in range(9)
+            ]
+            for row in GRID_ROWS
+        }
+
+    def generate_alliance_breakdown(self, teams: List[str]) -> Dict[str, Any]:
+        """Generates a 2023 TBA score breakdown for one alliance"""
+        skills = [self.skill[team] for team in teams]
+        breakdown: Dict[str, Any] = {}
+        auto_community = self.generate_grid(skills, "auto")
+        teleop_community = self.generate_grid(skills, "tele")
+        # Teleop grids include game pieces scored in autonomous
+        for row in GRID_ROWS:
+            teleop_community[row] = [
+                auto if auto != "None" else tele
+                for auto, tele in zip(auto_community[row], teleop_community[row])
+            ]
+        breakdown["autoCommunity"] = auto_community
+        breakdown["teleopCommunity"] = teleop_community
+        auto_pieces = sum(len([p for p in auto_community[r] if p != "None"]) for r in GRID_ROWS)
+        tele_pieces = sum(len([p for p in teleop_community[r] if p != "None"]) for r in GRID_ROWS)
+        breakdown["autoGamePieceCount"] = auto_pieces
+        breakdown["autoGamePiecePoints"] = sum(
+            GRID_POINTS["auto"][row] * len([p for p in auto_community[row] if p != "None"])
+            for row in GRID_ROWS
+        )
+        breakdown["teleopGamePieceCount"] = tele_pieces - auto_pieces
+        breakdown["teleopGamePiecePoints"] = sum(
+            GRID_POINTS["tele"][row]
+            * len(
+                [
+                    tele
+                    for auto, tele in zip(auto_community[row], teleop_community[row])
+                    if auto == "None" and tele != "None"
+                ]
+            )
+            for row in GRID_ROWS
+        )
+        # Links are three game pieces in a row
+        links = []
+        for row in GRID_ROWS:
+            column = 0
+            while column <= 6:
+                if all(piece != "None" for piece in teleop_community[row][column : column + 3]):
+                    links.append({"nodes": [column, column + 1, column + 2], "row": row})
+                    column += 3
+                else:
+                    column += 1
+        breakdown["links"] = links
+        breakdown["linkPoints"] = 5 * len(links)
+        breakdown["coopGamePieceCount"] = len(
+            [p for row in teleop_community.values() for p in row[3:6] if p != "None"]
+        )
+        breakdown["coopertitionCriteriaMet"] = breakdown["coopGamePieceCount"] >= 3
+        breakdown["extraGamePieceCount"] = 0
+
+        mobility_points = 0
+        docked_auto = False
+        charge_points = 0
+        park_points = 0
+        for robot, skill in enumerate(skills, start=1):
+            mobility = self.random.random() < 0.5 + skill / 2
+            breakdown[f"mobilityRobot{robot}"] = "Yes" if mobility else "No"
+            mobility_points += 3 if mobility else 0
+            # Only one robot can dock in autonomous
+            auto_dock = not docked_auto and self.random.random() < skill / 2
+            docked_auto = docked_auto or auto_dock
+            breakdown[f"autoChargeStationRobot{robot}"] = "Docked" if auto_dock else "None"
+            endgame = self.random.choices(["None", "Park", "Docked"], [1 - skill, 0.3, skill])[0]
+            breakdown[f"endGameChargeStationRobot{robot}"] = endgame
+            park_points += 2 if endgame == "Park" else 0
+        breakdown["autoMobilityPoints"] = mobility_points
+        breakdown["autoDocked"] = docked_auto
+        breakdown["autoBridgeState"] = self.random.choice(["Level", "NotLevel"])
+        if docked_auto:
+            charge_points = 12 if breakdown["autoBridgeState"] == "Level" else 8
+        breakdown["autoChargeStationPoints"] = charge_points
+        breakdown["endGameBridgeState"] = self.random.choice(["Level", "NotLevel"])
+        endgame_docked = [
+            breakdown[f"endGameChargeStationRobot{robot}"] for robot in range(1, 4)
+        ].count("Docked")
+        endgame_charge_points = endgame_docked * (
+            10 if breakdown["endGameBridgeState"] == "Level" else 6
+        )
+        breakdown["endGameChargeStationPoints"] = endgame_charge_points
+        breakdown["endGameParkPoints"] = park_points
+        breakdown["totalChargeStationPoints"] = charge_points + endgame_charge_points
+        breakdown["autoPoints"] = mobility_points + breakdown["autoGamePiecePoints"] + charge_points
+        breakdown["teleopPoints"] = (
+            breakdown["teleopGamePiecePoints"] + endgame_charge_points + park_points
+        )
+        breakdown["foulCount"] = self.random.choices([0, 1, 2], [0.7, 0.2, 0.1])[0]
+        breakdown["techFoulCount"] = self.random.choices([0, 1], [0.9, 0.1])[0]
+        # Foul points are awarded to this alliance for fouls by the other alliance, filled in later
+        breakdown["foulPoints"] = 0
+        breakdown["adjustPoints"] = 0
+        breakdown["g405Penalty"] = False
+        breakdown["h111Penalty"] = False
+        breakdown["sustainabilityBonusAchieved"] = len(links) >= 5
+        breakdown["activationBonusAchieved"] = breakdown["totalChargeStationPoints"] >= 26
+        return breakdown
+
+    def generate_tba_match(self, match_number: int) -> Dict[str, Any]:
+        """Generates the TBA API match for 'match_number', including its score breakdown"""
+        if match_number in self.tba_matches:
+            return copy.deepcopy(self.tba_matches[match_number])
+        alliances = self.schedule[match_number]
+        breakdowns = {
+            alliance: self.generate_alliance_breakdown(teams)
+            for alliance, teams in alliances.items()
+        }
+        for alliance, other in [("red", "blue"), ("blue", "red")]:
+            breakdowns[alliance]["foulPoints"] = (
+                5 * breakdowns[other]["foulCount"] + 12 * breakdowns[other]["techFoulCount"]
+            )
+        for breakdown in breakdowns.values():
+            breakdown["totalPoints"] = (
+                breakdown["autoPoints"]
+                + breakdown["teleopPoints"]
+                + breakdown["linkPoints"]
+                + breakdown["foulPoints"]
+            )
+        for alliance, other in [("red", "blue"), ("blue", "red")]:
+            breakdowns[alliance]["rp"] = (
+                int(breakdowns[alliance]["sustainabilityBonusAchieved"])
+                + int(breakdowns[alliance]["activationBonusAchieved"])
+                + 2 * int(breakdowns[alliance]["totalPoints"] > breakdowns[other]["totalPoints"])
+                + int(breakdowns[alliance]["totalPoints"] == breakdowns[other]["totalPoints"])
+            )
+        red_score, blue_score = breakdowns["red"]["totalPoints"], breakdowns["blue"]["totalPoints"]
+        match_time = self.match_time(match_number)
+        self.tba_matches[match_number] = {
+            "key": f"{self.event_key}_qm{match_number}",
+            "event_key": self.event_key,
+            "comp_level": "qm",
+            "set_number": 1,
+            "match_number": match_number,
+            "alliances": {
+                alliance: {
+                    "team_keys": [f"frc{team}" for team in teams],
+                    "score": breakdowns[alliance]["totalPoints"],
+                    "surrogate_team_keys": [],
+                    "dq_team_keys": [],
+                }
+                for alliance, teams in alliances.items()
+            },
+            "winning_alliance": (
+                "red" if red_score > blue_score else "blue" if blue_score > red_score else ""
+            ),
+            "time": match_time,
+            "predicted_time": match_time,
+            "actual_time": match_time,
+            "post_result_time": match_time + 180,
+            "score_breakdown": breakdowns,
+            "videos": [],
+        }
+        return copy.deepcopy(self.tba_matches[match_number])
+
+    def generate_tba_payloads(self, played_matches: int = None) -> Dict[str, Any]:
+        """Generates the TBA API responses the calculations request, by API url
+
+        Only the first 'played_matches' matches are included, defaults to every match. Matches
+        that have not been played are left out because several calculations expect every match
+        to have a score breakdown.
+        """
+        if played_matches is None:
+            played_matches = self.num_matches
+        matches = [self.generate_tba_match(number) for number in range(1, played_matches + 1)]
+        rankings = self.generate_rankings(matches)
+        coop_matches = len(
+            [
+                match
+                for match in matches
+                if all(
+                    breakdown["coopertitionCriteriaMet"]
+                    for breakdown in match["score_breakdown"].values()
+                )
+            ]
+        )
+        return {
+            f"event/{self.event_key}/matches": matches,
+            f"event/{self.event_key}/teams/simple": [
+                {
+                    "key": f"frc{team}",
+                    "team_number": int(team),
+                    "nickname": f"Synthetic Team {team}",
+                    "name": f"Synthetic Team {team}",
+                    "city": "Davis",
+                    "state_prov": "California",
+                    "country": "USA",
+                }
+                for team in self.teams
+            ],
+            f"event/{self.event_key}/rankings": {"rankings": rankings},
+            f"event/{self.event_key}/alliances": [],
+            f"event/{self.event_key}/insights": {
+                "qual": {
+                    "coopertition": [
+                        coop_matches,
+                        max(played_matches, 1),
+                        100 * coop_matches / max(played_matches, 1),
+                    ]
+                },
+                "playoff": None,
+            },
+        }
+
+    def generate_rankings(self, matches: List[dict]) -> List[dict]:
+        """Generates TBA rankings from the ranking points earned in 'matches'"""
+        ranking_points = {team: 0 for team in self.teams}
+        played = {team: 0 for team in self.teams}
+        for match in matches:
+            for alliance, data in match["alliances"].items():
+                for team_key in data["team_keys"]:
+                    ranking_points[team_key[3:]] += match["score_breakdown"][alliance]["rp"]
+                    played[team_key[3:]] += 1
+        ordered = sorted(self.teams, key=lambda team: ranking_points[team], reverse=True)
+        return [
+            {
+                "team_key": f"frc{team}",
+                "rank": rank,
+                "matches_played": played[team],
+                "extra_stats": [ranking_points[team]],
+                "sort_orders": [ranking_points[team] / max(played[team], 1)],
+            }
+            for rank, team in enumerate(ordered, start=1)
+        ]
+
+
+def parser():
+    parse = argparse.ArgumentParser()
+    parse.add_argument("--teams", help="Number of teams, 30-120", type=int, default=40)
+    parse.add_argument("--matches", help="Number of qualification matches", type=int, default=80)
+    parse.add_argument("--seed", help="Random seed", type=int, default=1678)
+    parse.add_argument(
+        "--output", help="File to write QRs to, one per line", default="data/synthetic_qrs.txt"
+    )
+    return parse.parse_args()
+
+
+if __name__ == "__main__":
+    args = parser()
+    event = SyntheticEvent(args.teams, args.matches, seed=args.seed)
+    event.write_event_files()
+    with open(utils.create_file_path(args.output), "w") as qr_file:
+        for qrs in event.generate_qrs().values():
+            qr_file.write("\n".join(qrs) + "\n")
+    print(f"Wrote {event.event_key} event files and QRs to {args.output}")
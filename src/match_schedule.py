@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+"""Loads the match schedule and team list of an event once and indexes them.
+
+Calculations and exporters used to open and parse data/<event>_match_schedule.json and
+data/<event>_team_list.json every time they needed them. A `MatchSchedule` is shared by every
+caller in the process, and is only loaded again when the modification time or size of one of the
+files changes, the same as the schema cache in `compiled_schema`. It indexes the schedule so
+lookups don't scan it:
+- The set of teams at the event
+- The alliances of each match
+- The matches of each team
+"""
+
+import json
+import os
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+TEAM_LIST_PATH = "data/{event_key}_team_list.json"
+MATCH_SCHEDULE_PATH = "data/{event_key}_match_schedule.json"
+ALLIANCES = ["blue", "red"]
+
+# Schedules that have been loaded by this process, with the state of their files when loaded
+_schedules: Dict[str, Tuple[tuple, "MatchSchedule"]] = {}
+
+
+class MatchSchedule:
+    """The team list and match schedule of an event, with indexes of the schedule"""
+
+    def __init__(self, teams: List[str], schedule: Dict[str, dict]):
+        self.teams = list(teams)
+        self.team_set: FrozenSet[str] = frozenset(self.teams)
+        # Team numbers of each alliance of each match, from the match number
+        self.matches: Dict[int, Dict[str, List[str]]] = {}
+        for match, match_info in schedule.items():
+            self.matches[int(match)] = {
+                alliance: [
+                    team["number"] for team in match_info["teams"] if team["color"] == alliance
+                ]
+                for alliance in ALLIANCES
+            }
+        self.team_matches: Dict[str, List[int]] = {}
+        for match_number, alliances in self.matches.items():
+            for alliance in ALLIANCES:
+                for team in alliances[alliance]:
+                    self.team_matches.setdefault(team, []).append(match_number)
+        # The schedule as a list of alliances in match (AIM) dictionaries, in schedule order
+        self.aim_list = [
+            {
+                "match_number": match_number,
+                "alliance_color": alliance[0].upper(),
+                "team_list": alliances[alliance],
+            }
+            for match_number, alliances in self.matches.items()
+            for alliance in ALLIANCES
+        ]
+
+    def has_team(self, team_number: str) -> bool:
+        return team_number in self.team_set
+
+    def get_matches(self, team_number: str) -> List[int]:
+        """Returns the match numbers of the scheduled matches of a team"""
+        return self.team_matches.get(team_number, [])
+
+
+def _file_state(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_json(path: str, default):
+    """Returns the parsed contents of a JSON file, 'default' if it doesn't exist"""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        log.error(f"match_schedule: {path} not found")
+        return default
+
+
+def get(event_key: Optional[str] = None) -> MatchSchedule:
+    """Returns the schedule of an event, loading it again if its files changed since it was loaded
+
+    'event_key' defaults to the event in data/competition.txt.
+    """
+    if event_key is None:
+        event_key = utils.TBA_EVENT_KEY
+    team_list_path = utils.create_file_path(TEAM_LIST_PATH.format(event_key=event_key), False)
+    schedule_path = utils.create_file_path(MATCH_SCHEDULE_PATH.format(event_key=event_key), False)
+    state = (_file_state(team_list_path), _file_state(schedule_path))
+    if event_key in _schedules and _schedules[event_key][0] == state:
+        return _schedules[event_key][1]
+    try:
+        schedule = MatchSchedule(_read_json(team_list_path, []), _read_json(schedule_path, {}))
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        # The files can be read while they are being written, so they are loaded again next time
+        log.error(f"match_schedule: unable to load the schedule of {event_key}: {e}")
+        if event_key in _schedules:
+            return _schedules[event_key][1]
+        return MatchSchedule([], {})
+    _schedules[event_key] = (state, schedule)
+    return schedule
+
+
+def clear_cache() -> None:
+    """Removes the schedules loaded by this process"""
+    _schedules.clear()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+"""Records performance metrics for each server cycle.
+
+Work is measured in named scopes, such as one calculation's `run` or one `Database` method. Each
+scope records its wall time along with the MongoDB commands issued while it was active, the
+documents read and written by those commands, and, if enabled, the bytes sent to and received from
+MongoDB.
+Scopes can be nested, and the counts of a nested scope are also included in every scope around
+it. At the end of each cycle, the metrics are written to the `server_metrics` collection, which
+keeps the most recent cycles and isn't synced to the cloud, and to a Prometheus-style text file.
+"""
+
+import dataclasses
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+import bson
+from pymongo import monitoring
+
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+# Collection that the metrics of each cycle are written to
+METRICS_COLLECTION = "server_metrics"
+# Number of the most recent cycles kept in the metrics collection, older cycles are deleted
+MAX_METRICS_CYCLES = 10000
+# Prometheus text file with the metrics of the most recent cycle
+METRICS_FILE = "data/metrics.prom"
+# Prefix of every metric name in the Prometheus file
+METRIC_PREFIX = "scouting_server"
+# MongoDB commands that return documents
+READ_COMMANDS = ["find", "getMore", "aggregate", "count", "distinct"]
+# Measuring the bytes of MongoDB commands encodes every command and reply again, so it is only
+# done when this environment variable is "1"
+COUNT_BYTES_VARIABLE = "SCOUTING_SERVER_METRICS_BYTES"
+
+
+@dataclasses.dataclass
+class Stats:
+    """Totals recorded for one scope during one cycle"""
+
+    calls: int = 0
+    wall_time: float = 0.0
+    queries: int = 0
+    documents_read: int = 0
+    documents_written: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    # Database updates that were skipped because they would not have changed anything
+    writes_skipped: int = 0
+
+    def add(self, other: "Stats") -> None:
+        for field in dataclasses.fields(self):
+            setattr(self, field.name, getattr(self, field.name) + getattr(other, field.name))
+
+
+class MetricsRecorder:
+    """Keeps the stats of every scope for the current cycle"""
+
+    def __init__(self):
+        self.stats: Dict[str, Stats] = {}
+        self.cycle = 0
+        self.cycle_start = time.time()
+        # Names of the scopes that are currently active, kept separately for each thread
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def active_scopes(self) -> List[str]:
+        if not hasattr(self._local, "scopes"):
+            self._local.scopes = []
+        return self._local.scopes
+
+    @contextmanager
+    def scope(self, name: str) -> Iterator[None]:
+        """Records the wall time of the code inside of the `with` block under 'name'"""
+        scopes = self.active_scopes()
+        scopes.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            scopes.pop()
+            self.record(name, calls=1, wall_time=time.perf_counter() - start, nested=False)
+
+    def record(self, name: str = None, nested: bool = True, **counts: Any) -> None:
+        """Adds 'counts' to the stats of 'name' and, if 'nested' is True, every active scope
+
+        If 'name' is None, only the active scopes are updated.
+        """
+        names = set(self.active_scopes()) if nested else set()
+        if name is not None:
+            names.add(name)
+        change = Stats(**counts)
+        with self._lock:
+            for scope_name in names:
+                self.stats.setdefault(scope_name, Stats()).add(change)
+
+    def reset(self) -> Dict[str, Stats]:
+        """Starts a new cycle and returns the stats of the cycle that ended"""
+        with self._lock:
+            stats, self.stats = self.stats, {}
+        self.cycle += 1
+        self.cycle_start = time.time()
+        return stats
+
+    def flush(self, db=None) -> Dict[str, Stats]:
+        """Ends the current cycle and writes its stats
+
+        The stats are written to the metrics file, and to the `server_metrics` collection of 'db'
+        if it is given. Returns the stats of the cycle.
+        """
+        cycle, cycle_start = self.cycle, self.cycle_start
+        stats = self.reset()
+        if stats == {}:
+            return stats
+        write_prometheus_file(stats)
+        if db is not None:
+            # Metrics are written after resetting so that the write is not counted in this cycle
+            db.insert_documents(
+                METRICS_COLLECTION,
+                {
+                    "cycle": cycle,
+                    "start_time": cycle_start,
+                    "end_time": time.time(),
+                    "scopes": {
+                        name: dataclasses.asdict(scope_stats) for name, scope_stats in stats.items()
+                    },
+                },
+            )
+            self.trim(db)
+        return stats
+
+    @staticmethod
+    def trim(db) -> None:
+        """Deletes all but the `MAX_METRICS_CYCLES` most recent cycles from the collection"""
+        oldest_kept = list(
+            db.db[METRICS_COLLECTION]
+            .find({}, {"end_time": 1})
+            .sort("end_time", -1)
+            .skip(MAX_METRICS_CYCLES - 1)
+            .limit(1)
+        )
+        if oldest_kept != []:
+            db.delete_data(METRICS_COLLECTION, {"end_time": {"$lt": oldest_kept[0]["end_time"]}})
+
+
+RECORDER = MetricsRecorder()
+
+
+def scope(name: str):
+    """Records the wall time of the code inside of the `with` block under 'name'"""
+    return RECORDER.scope(name)
+
+
+def timed(name: str) -> Callable:
+    """Decorator that records every call to the decorated function under 'name'"""
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with RECORDER.scope(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Counts the MongoDB commands run while scopes are active
+
+    Pass an instance to `pymongo.MongoClient` with the `event_listeners` argument. Bytes are only
+    counted if 'count_bytes' is True, see `COUNT_BYTES_VARIABLE`.
+    """
+
+    def __init__(self, recorder: MetricsRecorder = RECORDER, count_bytes: bool = None):
+        self.recorder = recorder
+        if count_bytes is None:
+            count_bytes = os.environ.get(COUNT_BYTES_VARIABLE) == "1"
+        self.count_bytes = count_bytes
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        documents_written = 0
+        if event.command_name in ["insert", "update", "delete"]:
+            # Batches of written documents are in a field with a different name for each command
+            field = {"insert": "documents", "update": "updates", "delete": "deletes"}
+            documents_written = len(event.command.get(field[event.command_name], []))
+        elif event.command_name == "findAndModify":
+            documents_written = 1
+        bytes_sent = len(bson.encode(event.command)) if self.count_bytes else 0
+        self.recorder.record(queries=1, documents_written=documents_written, bytes_sent=bytes_sent)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        documents_read = 0
+        if event.command_name in READ_COMMANDS:
+            cursor = event.reply.get("cursor", {})
+            documents_read = len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+            if event.command_name in ["count", "distinct"]:
+                documents_read = 1
+        bytes_received = len(bson.encode(event.reply)) if self.count_bytes else 0
+        self.recorder.record(documents_read=documents_read, bytes_received=bytes_received)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+
+LISTENER = CommandMetricsListener()
+
+
+def format_prometheus(stats: Dict[str, Stats]) -> str:
+    """Formats 'stats' as Prometheus text exposition, with one gauge per stat labeled by scope"""
+    lines = []
+    for field in dataclasses.fields(Stats):
+        # Prometheus names times in seconds
+        metric = f"{METRIC_PREFIX}_{'wall_seconds' if field.name == 'wall_time' else field.name}"
+        lines.append(f"# TYPE {metric} gauge")
+        for name in sorted(stats):
+            lines.append(f'{metric}{{scope="{name}"}} {getattr(stats[name], field.name)}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(stats: Dict[str, Stats], path: str = None) -> None:
+    """Replaces the metrics file with 'stats', so it always has the most recent cycle"""
+    if path is None:
+        path = utils.create_file_path(METRICS_FILE)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as metrics_file:
+        metrics_file.write(format_prometheus(stats))
+    os.replace(temp_path, path)
@@ -10,11 +10,10 @@ tablet serial number, and match number are added to the blocklist. If edit team
 specific match is selected, all QR codes from a specific TIM are overriden.
 """
 
-import re
 import sys
 
+from calculations import qr_state
 from data_transfer import database
-import utils
 
 db = database.Database()
 
@@ -46,27 +45,18 @@ if not INVALID_MATCH.isnumeric():
     print("Please enter a number")
     sys.exit()
 
-# Opens the schema document, to be used in regexes
-SCHEMA = utils.read_schema("schema/match_collection_qr_schema.yml")
-
-# Stores all of the elements of the regex to be joined to a string later
-PATTERN_ELEMENTS = [
-    ".*",  # Matches any character
-    SCHEMA["generic_data"]["match_number"][0] + INVALID_MATCH,  # Matches the match number
-    "\\" + SCHEMA["generic_data"]["_separator"],  # Matches the generic separator
-    ".*",  # Matches any character
-]
+# Raw QRs are indexed by the match number, scout name and team number from their QR, so the
+# matching QRs are queried instead of searching every QR for a pattern
+QUERY = {"match_number": int(INVALID_MATCH)}
 
 # If the user requests to blocklist a specific QR code
 if ROLLBACK_BLOCKLIST_OR_DATA == "1":
     # Takes user input for scout name
-    SCOUT_NAME = input("Enter the scout name of the QR code to blocklist: ")
-    # Modifies the regex pattern elements to include the scout name
-    PATTERN_ELEMENTS.insert(4, (SCHEMA["generic_data"]["scout_name"][0] + SCOUT_NAME + ".*"))
+    QUERY["scout_name"] = input("Enter the scout name of the QR code to blocklist: ")
 elif ROLLBACK_BLOCKLIST_OR_DATA == "2":
     # Takes user input for team name
     TEAM_NAME = input("Enter the team number of the TIM data to edit: ")
-    PATTERN_ELEMENTS.insert(4, (SCHEMA["objective_tim"]["team_number"][0] + TEAM_NAME + ".*"))
+    QUERY["team_number"] = TEAM_NAME
     # Takes user input for data point name
     DATA_NAME = input(f"Enter the name of the TIM data point to edit for {TEAM_NAME}: ")
     # Takes user input for the new value
@@ -82,38 +72,28 @@ elif ROLLBACK_BLOCKLIST_OR_DATA == "2":
     elif NEW_VALUE[0] == NEW_VALUE[-1] == '"':
         NEW_VALUE = NEW_VALUE[1:-1]
 
-# Stores all regex pattern objects
-PATTERNS = []
-
-# Compiles PATTERN_ELEMENTS into a regex pattern object
-PATTERNS.append(re.compile("".join(PATTERN_ELEMENTS)))
+# If the QR code is already blocklisted, it isn't changed
+if not UNDO:
+    QUERY["blocklisted"] = False
 
-# Stores the already blocklisted QR codes from the local database
-BLOCKLISTED_QRS = db.find("raw_qr", {"blocklisted": True})
+MATCHING_QRS = db.find("raw_qr", QUERY)
+# QRs uploaded before raw QRs were indexed don't have the fields, so they are read from the QR
+for qr_code in db.find("raw_qr", {"match_number": {"$exists": False}}):
+    qr_code.update(qr_state.qr_keys(qr_code["data"]))
+    if all(qr_code.get(field) == value for field, value in QUERY.items()):
+        MATCHING_QRS.append(qr_code)
 
 # Counts the numbers of QR codes newly blocklisted in this run
 num_blocklisted = 0
 
-for qr_code in db.find("raw_qr"):
-    # If the QR code is already blocklisted, go to the next QR code
-    if (not UNDO) and qr_code in BLOCKLISTED_QRS:
-        continue
-    # Iterates through all regex pattern objects
-    for PATTERN in PATTERNS:
-        if re.search(PATTERN, qr_code["data"]) is None:
-            # If the pattern doesn't match, go to the next QR code
-            break
-    # If none of the other statements are true, blocklist it
+for qr_code in MATCHING_QRS:
+    if ROLLBACK_BLOCKLIST_OR_DATA == "2":
+        # Uses the update_qr_data_override function to change the value of override[DATA_NAME] to NEW_VALUE
+        db.update_qr_data_override({"_id": qr_code["_id"]}, DATA_NAME, NEW_VALUE, clear=UNDO)
     else:
-        if ROLLBACK_BLOCKLIST_OR_DATA == "2":
-            # Uses the update_qr_data_override function to change the value of override[DATA_NAME] to NEW_VALUE
-            db.update_qr_data_override(
-                {"data": qr_code["data"]}, DATA_NAME, NEW_VALUE, clear=not UNDO
-            )
-        else:
-            # Uses the update_qr_blocklist_status function to change the value of blocklisted to True, or False if undoing
-            db.update_qr_blocklist_status({"data": qr_code["data"]}, blocklist=not UNDO)
-        num_blocklisted += 1
+        # Uses the update_qr_blocklist_status function to change the value of blocklisted to True, or False if undoing
+        db.update_qr_blocklist_status({"_id": qr_code["_id"]}, blocklist=not UNDO)
+    num_blocklisted += 1
 
 if num_blocklisted == 0:
     print(f"No QR codes were {'Overriden' if ROLLBACK_BLOCKLIST_OR_DATA == '2' else 'Blocklisted'}")
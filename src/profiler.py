@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""Low overhead sampling profiler for the server cycle.
+
+A background thread periodically records the call stack of the thread being profiled, and each
+sample is counted under the label that is active at the time, such as the name of the calculation
+that is running. The results are written in collapsed-stack format, one line per unique stack
+followed by its sample count, which can be turned into a flame graph with tools like
+flamegraph.pl or speedscope.
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+# Directory that profiles are written to, each profiled cycle gets its own folder
+PROFILE_DIRECTORY = "data/logs/profiles"
+
+
+class SamplingProfiler:
+    """Samples the stack of 'thread_id' every 'interval' seconds, defaults to the current thread"""
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        # Number of times each collapsed stack was seen, by label
+        self.samples: Dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+        self.current_label: Optional[str] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @contextmanager
+    def label(self, name: str) -> Iterator[None]:
+        """Counts the samples taken inside of the `with` block under 'name'"""
+        previous, self.current_label = self.current_label, name
+        try:
+            yield
+        finally:
+            self.current_label = previous
+
+    def _sample_loop(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            label = self.current_label
+            if label is None:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[label][self.collapse(frame)] += 1
+
+    @staticmethod
+    def collapse(frame) -> str:
+        """Returns the stack ending at 'frame' as 'file:function' names joined by semicolons"""
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def write(self, directory: Optional[str] = None) -> List[str]:
+        """Writes one collapsed-stack file per label, returns the paths of the written files"""
+        if directory is None:
+            directory = utils.create_file_path(f"{PROFILE_DIRECTORY}/{int(time.time())}")
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for label, stacks in self.samples.items():
+            path = os.path.join(directory, f"{label}.folded")
+            with open(path, "w") as profile_file:
+                for stack, count in stacks.most_common():
+                    profile_file.write(f"{stack} {count}\n")
+            paths.append(path)
+        return paths
@@ -7,6 +7,7 @@ Appends new QR codes to raw.qr.
 """
 
 
+from calculations import qr_state
 from data_transfer import database
 import utils
 
@@ -53,6 +54,8 @@ def upload_qr_codes(qr_codes):
         qr = [
             {
                 "data": qr_code,
+                # Indexed, so corrections in override_data.py don't decompress every QR
+                **qr_state.qr_keys(qr_code),
                 "blocklisted": False,
                 "override": {},
                 "epoch_time": curr_time.timestamp(),
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""Makes the cloud database match the local database, sending only the documents that differ.
+
+Use this after a long internet outage or when the cloud database is suspected to be out of sync,
+instead of deleting and re-inserting whole collections.
+"""
+
+import argparse
+
+from data_transfer import cloud_db_updater, database, db_reconciler
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def parser():
+    parse = argparse.ArgumentParser()
+    parse.add_argument(
+        "--full",
+        help="Hash every cloud document instead of using the stored bucket hashes",
+        default=False,
+        action="store_true",
+    )
+    parse.add_argument(
+        "--collections", help="Collections to reconcile, defaults to all", nargs="*", default=None
+    )
+    return parse.parse_args()
+
+
+if __name__ == "__main__":
+    args = parser()
+    reconciler = db_reconciler.Reconciler(
+        database.Database(), cloud_db_updater.cloud_db_connector()
+    )
+    for collection, result in reconciler.reconcile(args.collections, args.full).items():
+        print(
+            f"{collection}: {result.differing_buckets} differing buckets, "
+            f"{result.documents_sent} sent, {result.documents_deleted} deleted"
+        )
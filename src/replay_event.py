@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+
+"""Replays a recorded competition through the calculations and measures how fresh outputs are.
+
+The `raw_qr` documents and TBA cache of a past event are read from its database. The QRs are
+inserted into a fresh database in the order they were originally uploaded, using `epoch_time`,
+with time sped up by a multiplier, while server cycles run continuously. TBA match results only
+become available once the match was posted in the recording.
+
+For every replayed QR, the latency from when it was inserted to the first write of a document
+downstream of it in each collection is measured. A written document is downstream of a QR if the
+match number, team number and scout name they both have are the same, such as the `obj_tim` of the
+QR's team and match, or the `obj_team` of its team. Subjective QRs don't have a team number, so
+they get the team numbers of the documents written for their match and scout. Writes are found by
+checking the oplog after each calculation finishes.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import benchmark
+from calculations import qr_state
+from data_transfer import database, tba_communicator
+import server
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+# Directory that replay reports are written to
+REPORT_DIRECTORY = "data/replays"
+# Longest time to wait between cycles when no new QRs are due
+MAX_IDLE_SECONDS = 1.0
+
+
+# Match number, team number and scout name of a written document, None for the ones it doesn't have
+DocumentKeys = Tuple[Optional[int], Optional[str], Optional[str]]
+
+
+def document_keys(document: dict) -> DocumentKeys:
+    return (
+        document.get("match_number"),
+        document.get("team_number"),
+        document.get("scout_name"),
+    )
+
+
+class LatencyTracker:
+    """Latency from when each QR was inserted to the first write downstream of it in each collection"""
+
+    def __init__(self):
+        # Insert time, keys and latency by collection of each QR
+        self.pending: List[Dict[str, Any]] = []
+        self.latencies: Dict[str, List[float]] = {}
+        self.num_qrs = 0
+
+    def qr_inserted(self, insert_time: float, keys: Dict[str, Any]) -> None:
+        """Adds a QR with the match number, team number and scout name in 'keys'"""
+        teams: Set[str] = set()
+        if keys.get("team_number") is not None:
+            teams.add(keys["team_number"])
+        self.pending.append(
+            {
+                "inserted": insert_time,
+                "match_number": keys.get("match_number"),
+                "scout_name": keys.get("scout_name"),
+                "teams": teams,
+                "latencies": {},
+            }
+        )
+        self.num_qrs += 1
+
+    @staticmethod
+    def is_downstream(qr: Dict[str, Any], keys: DocumentKeys) -> bool:
+        """Returns if a document with 'keys' is downstream of 'qr'
+
+        Every key that both have must be the same, and they must have at least one.
+        """
+        match_number, team_number, scout_name = keys
+        shared = False
+        for qr_value, value in [(qr["match_number"], match_number), (qr["scout_name"], scout_name)]:
+            if qr_value is not None and value is not None:
+                if qr_value != value:
+                    return False
+                shared = True
+        if team_number is not None and qr["teams"] != set():
+            if team_number not in qr["teams"]:
+                return False
+            shared = True
+        return shared
+
+    def documents_written(self, written: Dict[str, Set[DocumentKeys]], write_time: float) -> None:
+        """Records writes of documents with the keys in 'written', by collection, at 'write_time'"""
+        for qr in self.pending:
+            if qr["inserted"] > write_time:
+                continue
+            for collection, collection_keys in written.items():
+                for keys in collection_keys:
+                    if not self.is_downstream(qr, keys):
+                        continue
+                    # Documents of the QR's match and scout give subjective QRs their teams
+                    match_number, team_number, scout_name = keys
+                    if (
+                        team_number is not None
+                        and match_number == qr["match_number"]
+                        and scout_name is not None
+                    ):
+                        qr["teams"].add(team_number)
+                    if collection not in qr["latencies"]:
+                        latency = write_time - qr["inserted"]
+                        qr["latencies"][collection] = latency
+                        self.latencies.setdefault(collection, []).append(latency)
+
+    def report(self) -> Dict[str, dict]:
+        """Latency statistics for each collection, in seconds of real time"""
+        report = {}
+        for collection, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            report[collection] = {
+                "qrs": len(latencies),
+                # QRs that were never followed by a write downstream of them in the collection
+                "missing": self.num_qrs - len(latencies),
+                "mean_seconds": statistics.mean(ordered),
+                "median_seconds": statistics.median(ordered),
+                "p95_seconds": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max_seconds": ordered[-1],
+            }
+        return report
+
+
+def filter_tba_payloads(payloads: Dict[str, Any], event_time: float) -> Dict[str, Any]:
+    """Returns the TBA payloads as they would have been at 'event_time'
+
+    Only matches that had been posted by 'event_time' are included. Other responses only have
+    their final version in the TBA cache, so they are returned unchanged.
+    """
+    filtered = {}
+    for api_url, data in payloads.items():
+        if api_url.endswith("/matches") and isinstance(data, list):
+            data = [
+                match
+                for match in data
+                if match.get("post_result_time") is not None
+                and match["post_result_time"] <= event_time
+            ]
+        filtered[api_url] = data
+    return filtered
+
+
+class EventReplay:
+    """Replays the QRs and TBA data of 'source_db' through the calculations in 'target_db'"""
+
+    def __init__(
+        self,
+        source_db: database.Database,
+        target_db: database.Database,
+        speed: float = 60.0,
+    ):
+        self.source_db = source_db
+        self.target_db = target_db
+        self.speed = speed
+        self.qrs = sorted(self.source_db.find("raw_qr"), key=lambda qr: qr.get("epoch_time", 0))
+        self.tba_payloads = {
+            cache["api_url"]: cache["data"]
+            for cache in self.source_db.db.tba_cache.find({}, {"_id": 0})
+        }
+        self.tracker = LatencyTracker()
+        self.num_cycles = 0
+
+    def insert_qrs(self, qrs: List[dict]) -> None:
+        """Inserts recorded QRs as they were, except for their `_id`"""
+        documents = [{key: value for key, value in qr.items() if key != "_id"} for qr in qrs]
+        self.target_db.insert_documents("raw_qr", documents)
+        insert_time = time.perf_counter()
+        for qr in documents:
+            keys = {
+                field: qr[field]
+                for field in ["match_number", "team_number", "scout_name"]
+                if field in qr
+            }
+            if "match_number" not in keys:
+                # Recorded before raw QRs had their keys
+                keys = qr_state.qr_keys(qr["data"])
+            self.tracker.qr_inserted(insert_time, keys)
+
+    def written_documents(self) -> Dict[str, Set[DocumentKeys]]:
+        """Returns the keys of the documents written since the last check by collection
+
+        Inserted documents are in the oplog, updated documents are read from the database by
+        `_id`. Deleted documents can't be read, so they are left out.
+        """
+        query = {"ns": {"$regex": f"^{self.target_db.name}\\."}, "op": {"$in": ["i", "u"]}}
+        if self.last_oplog_ts is not None:
+            query["ts"] = {"$gt": self.last_oplog_ts}
+        written: Dict[str, Set[DocumentKeys]] = {}
+        updated_ids: Dict[str, List[Any]] = {}
+        for entry in self.oplog.find(query):
+            self.last_oplog_ts = entry["ts"]
+            collection = entry["ns"].split(".", 1)[1]
+            if collection == "raw_qr":
+                continue
+            if entry["op"] == "i":
+                written.setdefault(collection, set()).add(document_keys(entry["o"]))
+            else:
+                updated_ids.setdefault(collection, []).append(entry["o2"]["_id"])
+        for collection, ids in updated_ids.items():
+            for document in self.target_db.db[collection].find({"_id": {"$in": ids}}):
+                written.setdefault(collection, set()).add(document_keys(document))
+        return written
+
+    def run_cycle(self, replay_server: "server.Server") -> None:
+        for calc in replay_server.calculations:
+            calc.run()
+            written = self.written_documents()
+            if written != {}:
+                self.tracker.documents_written(written, time.perf_counter())
+        self.num_cycles += 1
+
+    def run(self) -> Dict[str, Any]:
+        """Replays every QR, then runs one more cycle, returns the replay report"""
+        if self.qrs == []:
+            raise ValueError(f"No QRs to replay in {self.source_db.name}")
+        self.target_db.client.drop_database(self.target_db.name)
+        self.target_db.setup_db()
+        self.oplog = self.target_db.client.local.oplog.rs
+        self.last_oplog_ts: Optional[Any] = None
+        self.written_documents()
+
+        replay_server = server.Server(write_cloud=False, calc_all_data=False, db=self.target_db)
+        # QRs are inserted by the replay instead of being read from stdin
+        replay_server.calculations = [
+            calc for calc in replay_server.calculations if type(calc).__name__ != "QRInput"
+        ]
+        first_time = self.qrs[0].get("epoch_time", 0)
+        start = time.perf_counter()
+        next_qr = 0
+        # The current directory is used by the calculations to find the event files
+        previous_directory = os.getcwd()
+        os.chdir(utils.MAIN_DIRECTORY)
+        try:
+            while next_qr < len(self.qrs):
+                event_time = first_time + (time.perf_counter() - start) * self.speed
+                due = []
+                while (
+                    next_qr < len(self.qrs) and self.qrs[next_qr].get("epoch_time", 0) <= event_time
+                ):
+                    due.append(self.qrs[next_qr])
+                    next_qr += 1
+                if due == []:
+                    # Wait for the next QR instead of running cycles with no new data
+                    wait = (self.qrs[next_qr]["epoch_time"] - event_time) / self.speed
+                    time.sleep(min(max(wait, 0), MAX_IDLE_SECONDS))
+                    continue
+                self.insert_qrs(due)
+                tba_communicator.use_local_payloads(
+                    filter_tba_payloads(self.tba_payloads, event_time)
+                )
+                self.run_cycle(replay_server)
+                log.info(f"Replayed {next_qr}/{len(self.qrs)} QRs")
+            # Run a final cycle with every TBA result available
+            tba_communicator.use_local_payloads(self.tba_payloads)
+            self.run_cycle(replay_server)
+        finally:
+            tba_communicator.use_local_payloads(None)
+            os.chdir(previous_directory)
+        return {
+            "source": self.source_db.name,
+            "speed": self.speed,
+            "qrs": len(self.qrs),
+            "cycles": self.num_cycles,
+            "replay_seconds": time.perf_counter() - start,
+            "event_seconds": self.qrs[-1].get("epoch_time", 0) - first_time,
+            "latency": self.tracker.report(),
+        }
+
+
+def parser():
+    parse = argparse.ArgumentParser()
+    parse.add_argument(
+        "--event", help="Event key of the recorded event", default=utils.TBA_EVENT_KEY
+    )
+    parse.add_argument("--source-db", help="Name of the recorded database, if not the default")
+    parse.add_argument(
+        "--speed", help="How many times faster than real time to replay", type=float, default=60
+    )
+    parse.add_argument("--output", help="File to write the report to, defaults to a new file")
+    return parse.parse_args()
+
+
+if __name__ == "__main__":
+    args = parser()
+    source_db = database.Database(tba_event_key=args.event)
+    if args.source_db is not None:
+        source_db.name = args.source_db
+    # The replay database is separate from the recorded one, so the recording is never modified
+    target_db = database.Database(tba_event_key=f"{args.event}replay")
+    with benchmark.event_key(args.event):
+        report = EventReplay(source_db, target_db, args.speed).run()
+    output = args.output or f"{REPORT_DIRECTORY}/{args.event}_{int(time.time())}.json"
+    with open(utils.create_file_path(output), "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(
+        f"Replayed {report['qrs']} QRs in {report['replay_seconds']:.1f}s "
+        f"over {report['cycles']} cycles, report written to {output}"
+    )
+    for collection, latency in report["latency"].items():
+        print(
+            f"{collection}: median {latency['median_seconds']:.2f}s, "
+            f"p95 {latency['p95_seconds']:.2f}s, max {latency['max_seconds']:.2f}s"
+        )
@@ -2,13 +2,19 @@
 
 """Contains the server class."""
 import console  # DON'T DELETE THIS LINE. This initializes the logging system
+import argparse
+import concurrent.futures
 import importlib
-from typing import List, Type
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Type
 
+import pymongo
 import yaml
 
 from calculations import base_calculations
-from data_transfer import database, cloud_db_updater
+from data_transfer import database, cloud_db_updater, tba_communicator
+import metrics
+import profiler
 import utils
 import logging
 
@@ -26,14 +32,26 @@ class Server:
     CALCULATIONS_FILE = utils.create_file_path("src/calculations.yml")
     TBA_EVENT_KEY = utils.load_tba_event_key_file(utils._TBA_EVENT_KEY_FILE)
 
-    def __init__(self, write_cloud=False):
-        self.db = database.Database()
+    def __init__(self, write_cloud=False, calc_all_data=None, db=None):
+        self.db = database.Database() if db is None else db
         self.oplog = self.db.client.local.oplog.rs
         if write_cloud:
             self.cloud_db_updater = cloud_db_updater.CloudDBUpdater()
         else:
             self.cloud_db_updater = None
-        self.calc_all_data = self.ask_calc_all_data()
+        # Shared by calculations while they are created by `load_calculations`
+        self.initial_timestamp = None
+        self.checkpoints = None
+        # Number of upcoming cycles to run the sampling profiler for
+        self.profile_cycles = 0
+        # Number of calculations run at the same time when all data is recalculated
+        self.rebuild_workers = 1
+        # Names of the calculations each calculation depends on, from `calculations.yml`
+        self.dependencies: Dict[str, Optional[List[str]]] = {}
+        # Only ask if calc_all_data is not given, so the server can be created without input
+        if calc_all_data is None:
+            calc_all_data = self.ask_calc_all_data()
+        self.calc_all_data = calc_all_data
 
         self.calculations = self.load_calculations()
 
@@ -42,9 +60,14 @@ class Server:
         with open(self.CALCULATIONS_FILE) as f:
             calculation_load_list = yaml.load(f, Loader=yaml.Loader)
         loaded_calcs = []
+        # Every calculation starts from the same oplog timestamp, so it is only read once instead
+        # of once per calculation
+        self.initial_timestamp = self.get_latest_timestamp()
+        self.checkpoints = self.db.get_checkpoints()
         # `calculations.yml` is a list of dictionaries, each with an "import_path" and "class_name"
         # key. We need to import the module and then get the class from the imported module.
         for calc in calculation_load_list:
+            self.dependencies[calc["class_name"]] = calc.get("depends_on")
             # Import the module
             try:
                 module = importlib.import_module(calc["import_path"])
@@ -65,19 +88,129 @@ class Server:
                 log.error(
                     f'{e.__class__.__name__} instantiating {calc["import_path"]}.{calc["class_name"]}: {e}'
                 )
+        self.initial_timestamp = self.checkpoints = None
         return loaded_calcs
 
+    def get_latest_timestamp(self):
+        """Returns the timestamp of the most recent oplog entry"""
+        latest_op = self.oplog.find({}).sort("ts", pymongo.DESCENDING).limit(1)
+        return latest_op.next()["ts"]
+
     def run_calculations(self):
-        """Run each calculation in `self.calculations` in order"""
-        for calc in self.calculations:
+        """Run each calculation in `self.calculations` in order
+
+        If profiling is enabled, the cycle is profiled and a profile is written for each
+        calculation class. When all data is recalculated, it is rebuilt with `rebuild`.
+
+        After each calculation finishes, its checkpoint is saved, so after a restart it continues
+        from the changes written since the start of this cycle.
+
+        The TBA endpoints that calculations use are requested at the same time before the
+        calculations run, and the calculations use those responses for the rest of the cycle.
+        """
+        cycle_profiler = None
+        if self.profile_cycles > 0:
+            cycle_profiler = profiler.SamplingProfiler()
+            cycle_profiler.start()
+        cycle_start = self.db.changes.position
+        cycle_timestamp = self.get_latest_timestamp()
+        try:
+            tba_communicator.prefetch(tba_communicator.cycle_endpoints(self.TBA_EVENT_KEY))
+            if self.calc_all_data:
+                # The profiler only samples this thread, so profiled rebuilds are not parallel
+                self.rebuild(1 if cycle_profiler else self.rebuild_workers, cycle_profiler)
+                # Saved after the swap, since the rebuilt data isn't used until then
+                self.db.save_checkpoints(
+                    [calc.__class__.__name__ for calc in self.calculations], cycle_timestamp
+                )
+            else:
+                for calc in self.calculations:
+                    self.run_calculation(calc, cycle_profiler)
+                    self.db.save_checkpoints([calc.__class__.__name__], cycle_timestamp)
+            # Every calculation has read the changes from before this cycle, so they aren't needed
+            self.db.changes.discard_before(cycle_start)
+        finally:
+            tba_communicator.clear_snapshot()
+            if cycle_profiler is not None:
+                cycle_profiler.stop()
+                paths = cycle_profiler.write()
+                self.profile_cycles -= 1
+                log.info(f"Wrote {len(paths)} calculation profiles, {self.profile_cycles} left")
+
+    def run_calculation(self, calc, cycle_profiler=None) -> None:
+        calc_name = calc.__class__.__name__
+        with metrics.scope(f"calc.{calc_name}"), (
+            cycle_profiler.label(calc_name) if cycle_profiler else nullcontext()
+        ):
             calc.run()
 
+    def rebuild(self, workers: int = 1, cycle_profiler=None) -> None:
+        """Recalculates all data into shadow collections that are swapped in when it finishes
+
+        The live collections stay readable until the swap, see `database.Database.rebuild`. With
+        more than one worker, each calculation starts as soon as the calculations it depends on
+        have finished.
+        """
+        with self.db.rebuild() as rebuilt:
+            if workers <= 1:
+                for calc in self.calculations:
+                    self.run_calculation(calc, cycle_profiler)
+            else:
+                self.run_in_parallel(workers)
+        # Swapping collections isn't in the oplog, so the cloud copies are reconciled instead.
+        # The cloud copies were only written by the server, so their stored hashes are up to date
+        # and the cloud documents don't need to be downloaded.
+        if self.cloud_db_updater is not None and rebuilt:
+            with metrics.scope("cloud_reconcile"):
+                self.cloud_db_updater.reconcile(sorted(rebuilt), trust_hashes=True)
+
+    def run_in_parallel(self, workers: int) -> None:
+        """Runs the calculations in threads, in the order allowed by their dependencies
+
+        A calculation without `depends_on` in `calculations.yml` depends on every calculation
+        before it.
+        """
+        names = [calc.__class__.__name__ for calc in self.calculations]
+        waiting = list(self.calculations)
+        finished = set()
+        running: Dict[concurrent.futures.Future, str] = {}
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            while waiting or running:
+                for calc in list(waiting):
+                    name = calc.__class__.__name__
+                    dependencies = self.dependencies.get(name)
+                    if dependencies is None:
+                        dependencies = names[: names.index(name)]
+                    # Dependencies that weren't loaded will never run, so they aren't waited for
+                    if all(dep in finished or dep not in names for dep in dependencies):
+                        waiting.remove(calc)
+                        running[executor.submit(self.run_calculation, calc)] = name
+                if not running:
+                    raise ValueError(f"Calculations have circular dependencies: {waiting}")
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    # Raises the calculation's exception, which cancels the rebuild
+                    future.result()
+                    finished.add(running.pop(future))
+
+    def enable_profiling(self, cycles: int = 1) -> None:
+        """Profiles the next 'cycles' runs of `run_calculations`"""
+        self.profile_cycles = cycles
+        log.info(f"Profiling the next {cycles} cycles")
+
     def ask_calc_all_data(self):
         print(
             "Run calculations on all data?\n"
-            "WARNING: This will re-calculate, delete and re-insert all calculated documents, leading to a much longer runtime."
+            "WARNING: This will re-calculate all calculated documents, leading to a much longer runtime. The current documents are replaced when it finishes.\n"
+            "Type 'profile N' to profile the next N cycles instead."
         )
         calc_all_data = input("y/N").lower()
+        if calc_all_data.startswith("profile"):
+            words = calc_all_data.split()
+            self.enable_profiling(int(words[1]) if len(words) > 1 and words[1].isdigit() else 1)
+            return False
         if calc_all_data in ["y", "yes"]:
             return True
         else:
@@ -86,17 +219,43 @@ class Server:
     def run(self):
         """Starts server cycles, runs in infinite loop"""
         while True:
-            self.run_calculations()
-            if write_cloud:
-                self.cloud_db_updater.write_db_changes()
+            with metrics.scope("cycle"):
+                self.run_calculations()
+                if write_cloud:
+                    with metrics.scope("cloud_sync"):
+                        self.cloud_db_updater.write_db_changes()
+            metrics.RECORDER.flush(self.db)
             self.calc_all_data = self.ask_calc_all_data()
 
 
+def parser():
+    parse = argparse.ArgumentParser()
+    parse.add_argument(
+        "--profile",
+        help="Run the sampling profiler for the first N cycles, written to data/logs/profiles",
+        type=int,
+        default=0,
+        metavar="N",
+    )
+    parse.add_argument(
+        "--rebuild-workers",
+        help="Number of calculations to run at the same time when recalculating all data",
+        type=int,
+        default=1,
+        metavar="N",
+    )
+    return parse.parse_args()
+
+
 if __name__ == "__main__":
+    args = parser()
     write_cloud_question = input("Write changes to cloud db? y/N").lower()
     if write_cloud_question in ["y", "yes"]:
         write_cloud = True
     else:
         write_cloud = False
     server = Server(write_cloud)
+    server.rebuild_workers = args.rebuild_workers
+    if args.profile > 0:
+        server.enable_profiling(args.profile)
     server.run()
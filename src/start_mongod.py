@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
 """Starts the mongod instance used by database.py, including handling the replica set"""
+import socket
 import subprocess
+import threading
+
+import pymongo
+
 import utils
 import logging
 
@@ -12,6 +17,58 @@ PORT = 1678
 DB_PATH = utils.create_file_path("data/db")
 REPLICA_SET_NAME = "ScoutingReplica0"
 MONGOD_LOG_PATH = utils.create_file_path("data/mongodlogs/mongod.log")
+# How long to wait for a running mongod to accept a connection
+PROBE_TIMEOUT = 0.25
+# How long to wait for a running mongod to report the status of its replica set, in milliseconds
+STATUS_TIMEOUT_MS = 2000
+
+# Whether mongod has already been checked for or started by this process
+_started = False
+# Databases can be first used from several threads at once
+_started_lock = threading.Lock()
+
+
+def is_running(host: str = "localhost", port: int = PORT) -> bool:
+    """Returns whether something is accepting connections on 'port'"""
+    try:
+        with socket.create_connection((host, port), timeout=PROBE_TIMEOUT):
+            return True
+    except OSError:
+        return False
+
+
+def is_replica_set_initiated(host: str = "localhost", port: int = PORT) -> bool:
+    """Returns whether the mongod on 'port' has an initiated replica set, which the oplog needs"""
+    client = pymongo.MongoClient(
+        host, port, directConnection=True, serverSelectionTimeoutMS=STATUS_TIMEOUT_MS
+    )
+    try:
+        client.admin.command("replSetGetStatus")
+        return True
+    except pymongo.errors.PyMongoError as e:
+        log.info(f"Replica set on {host}:{port} is not ready: {e}")
+        return False
+    finally:
+        client.close()
+
+
+def ensure_started() -> None:
+    """Starts mongod the first time it is needed, unless it is already running
+
+    Starting mongod and initializing the replica set takes several seconds, even when mongod is
+    already running, so a running mongod is found with a connection attempt instead. The replica
+    set of a running mongod is initiated if it wasn't, such as after mongod was started by hand."""
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        if not is_running():
+            start_mongod()
+        elif is_replica_set_initiated():
+            log.info(f"mongod already running on localhost:{PORT}")
+        else:
+            initiate_replica_set()
+        _started = True
 
 
 def start_mongod():
@@ -42,7 +99,11 @@ def start_mongod():
         log.info("Custom mongod process already started")
     elif start_mongod_result.returncode > 0:
         log.error("Error starting mongod. Check data/mongod.log for more details")
+    initiate_replica_set()
+
 
+def initiate_replica_set():
+    """Initiates the replica set of the mongod on PORT, if it isn't already"""
     init_repl_set_result = subprocess.run(
         ["mongosh", "--eval", "rs.initiate()", "--port", str(PORT)],
         stdout=subprocess.PIPE,
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""Receives TBA webhook messages, so match scores are used without waiting for the next poll.
+
+TBA sends a message when a match score is posted, the schedule is updated or alliances are
+selected. Messages are verified with the webhook secret in data/api_keys/tba_webhook_secret.txt,
+using the HMAC in the X-TBA-HMAC header. Scores are written straight into the cached TBA matches,
+and the match is marked dirty for the calculations that use its score, so only that match is
+recalculated on the next cycle. The server still polls TBA every cycle, in case messages are
+missed.
+
+Run with --send to send a message from a JSON file to a receiver, for testing without TBA.
+"""
+
+import argparse
+import hashlib
+import hmac
+import http.server
+import json
+from typing import Optional
+
+import requests
+
+from data_transfer import database, tba_communicator
+import utils
+import logging
+
+log = logging.getLogger(__name__)
+
+WEBHOOK_SECRET_FILE = "data/api_keys/tba_webhook_secret.txt"
+# Calculations that recalculate matches when their scores are pushed
+DIRTY_MATCH_CALCULATIONS = ["TBATIMCalc", "SimPrecisionCalc", "PredictedAimCalc"]
+DEFAULT_PORT = 8679
+# Times a score is applied again if the cached matches are written by another process meanwhile
+MAX_CACHE_ATTEMPTS = 5
+
+
+def get_webhook_secret() -> str:
+    with open(utils.create_file_path(WEBHOOK_SECRET_FILE)) as file:
+        return file.read().rstrip("\n")
+
+
+def sign(body: bytes, secret: str) -> str:
+    """Returns the HMAC that TBA sends with 'body'"""
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify(body: bytes, signature: Optional[str], secret: str) -> bool:
+    return signature is not None and hmac.compare_digest(sign(body, secret), signature)
+
+
+class WebhookReceiver:
+    """Applies TBA webhook messages for one event to the database"""
+
+    def __init__(self, db: database.Database, event_key: str = utils.TBA_EVENT_KEY):
+        self.db = db
+        self.event_key = event_key
+        self.matches_url = f"event/{event_key}/matches"
+        self.alliances_url = f"event/{event_key}/alliances"
+
+    def handle(self, message: dict) -> None:
+        message_type = message.get("message_type")
+        data = message.get("message_data", {})
+        if message_type == "verification":
+            log.warning(f"TBA webhook verification key: {data.get('verification_key')}")
+            return
+        if data.get("event_key", self.event_key) != self.event_key:
+            log.debug(f"Ignored {message_type} message for event {data['event_key']}")
+            return
+        if message_type == "match_score":
+            self.apply_match(data["match"])
+        elif message_type == "schedule_updated":
+            # The message doesn't include the schedule
+            tba_communicator.tba_request(self.matches_url)
+        elif message_type == "alliance_selection":
+            tba_communicator.tba_request(self.alliances_url)
+            self.db.mark_matches_dirty([None], ["PredictedAimCalc"])
+        else:
+            log.debug(f"Ignored {message_type} message")
+
+    def apply_match(self, match: dict) -> None:
+        """Replaces the match in the cached TBA matches, and marks it dirty if it is a qual"""
+        for _ in range(MAX_CACHE_ATTEMPTS):
+            cached = self.db.get_tba_cache(self.matches_url)
+            matches = cached["data"] if cached and cached.get("data") else []
+            matches = [
+                cached_match for cached_match in matches if cached_match["key"] != match["key"]
+            ]
+            matches.append(match)
+            # The ETag is kept, so the next poll still downloads the matches once TBA has them
+            if self.db.update_tba_cache(matches, self.matches_url, cached=cached):
+                break
+            log.debug(f"TBA matches changed while applying match {match['key']}, retrying")
+        else:
+            log.error(f"Couldn't apply match {match['key']}, the TBA matches kept changing")
+            return
+        if match["comp_level"] == "qm":
+            self.db.mark_matches_dirty([match["match_number"]], DIRTY_MATCH_CALCULATIONS)
+        log.info(f"Applied score of match {match['key']} from TBA")
+
+
+class WebhookRequestHandler(http.server.BaseHTTPRequestHandler):
+    receiver: WebhookReceiver = None
+    secret: str = None
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not verify(body, self.headers.get("X-TBA-HMAC"), self.secret):
+            log.warning(f"Rejected TBA webhook message from {self.address_string()}")
+            self.send_error(401, "Invalid HMAC")
+            return
+        try:
+            message = json.loads(body)
+        except ValueError:
+            self.send_error(400, "Invalid JSON")
+            return
+        self.receiver.handle(message)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:
+        log.debug(f"{self.address_string()} {format % args}")
+
+
+def make_server(
+    receiver: WebhookReceiver, secret: str, host: str = "", port: int = DEFAULT_PORT
+) -> http.server.ThreadingHTTPServer:
+    handler = type("Handler", (WebhookRequestHandler,), {"receiver": receiver, "secret": secret})
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+
+def send_webhook(url: str, message: dict, secret: str) -> requests.Response:
+    """Sends 'message' to the receiver at 'url' the same way TBA does"""
+    body = json.dumps(message).encode()
+    return requests.post(
+        url,
+        data=body,
+        headers={"Content-Type": "application/json", "X-TBA-HMAC": sign(body, secret)},
+    )
+
+
+def parser():
+    parse = argparse.ArgumentParser()
+    parse.add_argument("--host", help="Address to listen on, defaults to all", default="")
+    parse.add_argument("--port", help="Port to listen on", type=int, default=DEFAULT_PORT)
+    parse.add_argument(
+        "--send",
+        help="Send the message in this JSON file to a running receiver instead",
+        metavar="FILE",
+    )
+    return parse.parse_args()
+
+
+if __name__ == "__main__":
+    args = parser()
+    secret = get_webhook_secret()
+    if args.send is not None:
+        with open(args.send) as message_file:
+            response = send_webhook(
+                f"http://localhost:{args.port}/", json.load(message_file), secret
+            )
+        print(f"Receiver responded with status code {response.status_code}")
+    else:
+        server = make_server(WebhookReceiver(database.Database()), secret, args.host, args.port)
+        log.info(f"Receiving TBA webhook messages on port {args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
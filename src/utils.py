@@ -104,33 +104,18 @@ def run_command(command, return_output=False):
         raise Exception(f"utils.run_command: unknown command {command[0]}")
 
 
-def _inner_read_schema(schema_file_path: str) -> dict:
+def read_schema(schema_file_path: str) -> dict:
     """Reads schema files and returns them as a dictionary.
 
-    schema_filepath is the relative file path compared to where the script is executed
-    returns a dictionary generated by opening the schema document with yaml.
+    schema_file_path is the file path relative to the main directory. Schemas are parsed once and
+    cached by compiled_schema, so this returns the same dictionary every time for a file.
+    Returns None if the file doesn't exist.
     """
+    # Imported here since compiled_schema uses this module
+    import compiled_schema
 
-    # Opens the schema file and returns it as a dictionary
-    try:
-        with open(create_file_path(schema_file_path, False), "r") as schema_file:
-            # Specify loader to avoid warnings about default loader
-            return yaml.load(schema_file, yaml.Loader)
-    except FileNotFoundError as e:
-        # TODO - use logger (waiting on #544 for better logging)
-        print('server: Error: file "{schema_file_path}" not found.')
-        print("server: full info: {e}")
-        # Please check for None
-        return None
-
-
-_internal_schemas = {}
-
-
-def read_schema(schema_file_path: str) -> dict:
-    if schema_file_path not in _internal_schemas.keys():
-        _internal_schemas[schema_file_path] = _inner_read_schema(schema_file_path)
-    return _internal_schemas[schema_file_path]
+    compiled = compiled_schema.load(schema_file_path)
+    return compiled.schema if compiled is not None else None
 
 
 def get_schema_filenames() -> list:
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+"""Read-only HTTP API that serves calculated data to viewer clients on the local network.
+
+Documents are served as JSON from an in-memory cache, so requests don't query the database:
+- `/<collection>` returns every document of the collection
+- `/<collection>/team/<team_number>` returns the documents of one team
+- `/<collection>/match/<match_number>` returns the documents of one match
+
+Every response is serialized and compressed when its collection is loaded. A collection is only
+loaded again when the oplog shows it changed. Responses have an ETag, so clients that send it back
+in If-None-Match get an empty 304 response until the data changes, and clients that accept gzip
+get the compressed body. Responses vary by Accept-Encoding, so caches keep both bodies apart.
+"""
+
+import argparse
+import gzip
+import hashlib
+import http.server
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+import pymongo
+
+from data_transfer import database
+import logging
+
+log = logging.getLogger(__name__)
+
+COLLECTIONS = [
+    "obj_team",
+    "tba_team",
+    "subj_team",
+    "pickability",
+    "predicted_aim",
+    "predicted_team",
+    "auto_paths",
+    database.TEAM_CARD_COLLECTION,
+]
+# Fields that responses for one team or match are indexed by, with the name used in the path
+KEY_FIELDS = {"team": "team_number", "match": "match_number"}
+DEFAULT_PORT = 8678
+
+
+class Response(NamedTuple):
+    body: bytes
+    gzip_body: bytes
+    etag: str
+
+
+def make_response(documents: List[dict]) -> Response:
+    """Serializes and compresses 'documents'"""
+    body = json.dumps(documents, default=str, separators=(",", ":")).encode()
+    return Response(body, gzip.compress(body), f'"{hashlib.sha1(body).hexdigest()}"')
+
+
+EMPTY_RESPONSE = make_response([])
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Returns if an If-None-Match header matches 'etag'
+
+    The header is a list of ETags or `*`, and weak ETags (`W/"..."`) match the same strong ETag.
+    """
+    if if_none_match is None:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Returns if an Accept-Encoding header accepts gzip, which `gzip;q=0` refuses"""
+    if accept_encoding is None:
+        return False
+    for coding in accept_encoding.split(","):
+        name, *parameters = [part.strip() for part in coding.split(";")]
+        if name.lower() not in ["gzip", "*"]:
+            continue
+        for parameter in parameters:
+            key, _, value = parameter.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+class ResponseCache:
+    """Serialized responses for each path, loaded again when their collection changes"""
+
+    def __init__(self, db: database.Database, collections: Iterable[str] = COLLECTIONS):
+        self.db = db
+        self.collections = list(collections)
+        self.oplog = self.db.client.local.oplog.rs
+        # Responses by path, replaced all at once for each collection so readers never see a
+        # partially loaded collection
+        self.responses: Dict[str, Dict[str, Response]] = {}
+        self.timestamp = None
+
+    def load(self, collection: str) -> None:
+        """Serializes the responses for every path of 'collection'"""
+        documents = [
+            {field: value for field, value in document.items() if field != "_id"}
+            for document in self.db.find(collection)
+        ]
+        groups: Dict[str, List[dict]] = {f"/{collection}": documents}
+        for path_name, field in KEY_FIELDS.items():
+            for document in documents:
+                if field in document:
+                    path = f"/{collection}/{path_name}/{document[field]}"
+                    groups.setdefault(path, []).append(document)
+        self.responses[collection] = {path: make_response(docs) for path, docs in groups.items()}
+
+    def load_all(self) -> None:
+        latest_op = self.oplog.find({}).sort("ts", pymongo.DESCENDING).limit(1)
+        self.timestamp = latest_op.next()["ts"]
+        for collection in self.collections:
+            self.load(collection)
+
+    def changed_collections(self) -> Set[str]:
+        """Returns the served collections written since the last call, from the oplog"""
+        namespaces = {f"{self.db.name}.{collection}": collection for collection in self.collections}
+        changed = set()
+        for entry in self.oplog.find(
+            {
+                "ts": {"$gt": self.timestamp},
+                "ns": {"$in": list(namespaces) + [f"{self.db.name}.$cmd"]},
+            }
+        ):
+            self.timestamp = max(self.timestamp, entry["ts"])
+            if entry["ns"] in namespaces:
+                changed.add(namespaces[entry["ns"]])
+            # Commands such as swapping in a rebuilt collection replace the whole collection
+            elif entry["op"] == "c" and entry["o"].get("to") in namespaces:
+                changed.add(namespaces[entry["o"]["to"]])
+            elif entry["op"] == "c" and entry["o"].get("drop") in self.collections:
+                changed.add(entry["o"]["drop"])
+        return changed
+
+    def refresh(self) -> Set[str]:
+        """Loads the collections that changed, returns their names"""
+        changed = self.changed_collections()
+        for collection in changed:
+            self.load(collection)
+        return changed
+
+    def get(self, path: str) -> Optional[Response]:
+        """Returns the response for 'path', None if it is not a valid path"""
+        parts = path.strip("/").split("/")
+        responses = self.responses.get(parts[0])
+        if responses is None or len(parts) not in [1, 3]:
+            return None
+        if len(parts) == 3 and parts[1] not in KEY_FIELDS:
+            return None
+        # Teams and matches without documents have an empty list
+        return responses.get("/" + "/".join(parts), EMPTY_RESPONSE)
+
+
+class ViewerRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Keeps connections open between requests, since clients poll often
+    protocol_version = "HTTP/1.1"
+    # Otherwise the body waits for the client to acknowledge the headers
+    disable_nagle_algorithm = True
+    cache: ResponseCache = None
+
+    def do_GET(self) -> None:
+        response = self.cache.get(self.path.split("?")[0])
+        if response is None:
+            self.send_error(404, f"Unknown path {self.path}")
+            return
+        if etag_matches(self.headers.get("If-None-Match"), response.etag):
+            self.send_response(304)
+            self.send_header("ETag", response.etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        use_gzip = accepts_gzip(self.headers.get("Accept-Encoding"))
+        body = response.gzip_body if use_gzip else response.body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", response.etag)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Cache-Control", "no-cache")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        log.debug(f"{self.address_string()} {format % args}")
+
+
+def refresh_loop(cache: ResponseCache, poll_interval: float, stop: threading.Event) -> None:
+    """Loads changed collections every 'poll_interval' seconds until 'stop' is set"""
+    while not stop.wait(poll_interval):
+        try:
+            if changed := cache.refresh():
+                log.info(f"Reloaded {', '.join(sorted(changed))}")
+        except pymongo.errors.PyMongoError as e:
+            log.error(f"Unable to refresh viewer data: {e}")
+
+
+def make_server(
+    cache: ResponseCache, host: str = "", port: int = DEFAULT_PORT
+) -> http.server.ThreadingHTTPServer:
+    handler = type("Handler", (ViewerRequestHandler,), {"cache": cache})
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+
+def parser():
+    parse = argparse.ArgumentParser()
+    parse.add_argument("--host", help="Address to listen on, defaults to all", default="")
+    parse.add_argument("--port", help="Port to listen on", type=int, default=DEFAULT_PORT)
+    parse.add_argument(
+        "--poll-interval",
+        help="Seconds between checks of the oplog for changed data",
+        type=float,
+        default=1.0,
+    )
+    return parse.parse_args()
+
+
+if __name__ == "__main__":
+    args = parser()
+    cache = ResponseCache(database.Database())
+    start = time.perf_counter()
+    cache.load_all()
+    log.info(f"Loaded {len(cache.collections)} collections in {time.perf_counter() - start:.2f}s")
+    stop = threading.Event()
+    threading.Thread(
+        target=refresh_loop, args=(cache, args.poll_interval, stop), daemon=True
+    ).start()
+    server = make_server(cache, args.host, args.port)
+    log.info(f"Serving viewer data on port {args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
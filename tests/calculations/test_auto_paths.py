@@ -2,9 +2,9 @@
 
 from unittest import mock
 
-from calculations import base_calculations
 from calculations import obj_tims
 from calculations import auto_paths
+import match_schedule
 from server import Server
 import pytest
 
@@ -613,10 +613,14 @@ class TestAutoPathCalc:
         },
     ]
 
-    @mock.patch.object(
-        base_calculations.BaseCalculations, "get_teams_list", return_value=["3", "254"]
-    )
-    def setup_method(self, method, get_teams_list_dummy):
+    @pytest.fixture(autouse=True)
+    def teams(self):
+        with mock.patch(
+            "match_schedule.get", return_value=match_schedule.MatchSchedule(["3", "254"], {})
+        ):
+            yield
+
+    def setup_method(self, method):
         with mock.patch("server.Server.ask_calc_all_data", return_value=False):
             self.test_server = Server()
         self.test_calculator = auto_paths.AutoPathCalc(self.test_server)
@@ -1,11 +1,32 @@
+import os
+
 import pytest
 
-from unittest.mock import Mock, mock_open, patch
+from unittest.mock import patch
 
 from calculations.base_calculations import BaseCalculations
+import match_schedule
+import utils
+from data_transfer import database
 from server import Server
 
 
+TEST_EVENT_KEY = "2023schedtest"
+
+
+@pytest.fixture
+def schedule_files():
+    """Removes the schedule files of the test event after a test"""
+    match_schedule.clear_cache()
+    with patch("utils.TBA_EVENT_KEY", TEST_EVENT_KEY):
+        yield
+    for name in ["team_list", "match_schedule"]:
+        path = utils.create_file_path(f"data/{TEST_EVENT_KEY}_{name}.json")
+        if os.path.exists(path):
+            os.remove(path)
+    match_schedule.clear_cache()
+
+
 @pytest.mark.clouddb
 class TestBaseCalculations:
     def setup_method(self, method):
@@ -81,6 +102,53 @@ class TestBaseCalculations:
         # Cast to set to disregard order of items
         assert set(self.base_calc_all_data.get_updated_teams()) == set(["8", "6"])
 
+    def test_changed_keys(self):
+        self.base_calc.watched_collections = ["test2"]
+        self.base_calc.changed_keys()
+        self.test_server.db.insert_documents("test2", {"team_number": "3", "match_number": 4})
+        self.test_server.db.insert_documents("other", {"team_number": "5"})
+        changed = self.base_calc.changed_keys()
+        assert changed.tims() == {("3", 4)}
+        # Each change is only returned once
+        assert not self.base_calc.changed_keys()
+        self.test_server.db.delete_data("test2")
+        assert self.base_calc.changed_keys().unkeyed_collections == {"test2"}
+        # Deletes made by this process have known keys
+        self.test_server.db.insert_documents("test2", {"team_number": "6", "match_number": 1})
+        self.base_calc.changed_keys()
+        self.test_server.db.delete_data("test2", {"team_number": "6"})
+        changed = self.base_calc.changed_keys()
+        assert changed.teams() == {"6"}
+        assert changed.unkeyed_collections == set()
+        assert changed.deleted_collections == {"test2"}
+        # Writes made by other processes are read from the oplog
+        self.test_server.db.db["test2"].insert_one({"team_number": "7", "match_number": 2})
+        self.test_server.db.db["test2"].update_one({"team_number": "7"}, {"$set": {"a": 1}})
+        assert self.base_calc.changed_keys().tims() == {("7", 2)}
+        self.test_server.db.db["test2"].delete_one({"team_number": "7"})
+        assert self.base_calc.changed_keys().unkeyed_collections == {"test2"}
+
+    def test_resume_from_checkpoint(self):
+        class Resumed(BaseCalculations):
+            def __init__(self, server):
+                super().__init__(server)
+                self.watched_collections = ["test3"]
+
+        self.test_server.db.insert_documents("test3", {"team_number": "1"})
+        checkpoint = self.test_server.get_latest_timestamp()
+        self.test_server.db.save_checkpoints(["Resumed"], checkpoint)
+        # Written while the server was stopped
+        self.test_server.db.insert_documents("test3", {"team_number": "2"})
+        self.test_server.db.update_document("test3", {"useless": 1}, {"team_number": "1"})
+        calc = Resumed(self.test_server)
+        assert calc.timestamp == checkpoint
+        assert sorted(calc.get_updated_teams()) == ["1", "2"]
+        # The oplog is only read for the first run
+        assert calc.get_updated_teams() == []
+        # Calculations without a checkpoint start from the latest change
+        self.test_server.db.db[database.CHECKPOINT_COLLECTION].delete_many({})
+        assert Resumed(self.test_server).timestamp > checkpoint
+
     def test_avg(self):
         # Test if there is no input
         assert 0 == BaseCalculations.avg("")
@@ -93,7 +161,7 @@ class TestBaseCalculations:
         # Test average with weights
         assert 1 == BaseCalculations.avg([1, 3], [2.0, 0.0])
 
-    def test_get_aim_list(self):
+    def test_get_aim_list(self, schedule_files):
         test_json = """
         {
             "1": 
@@ -121,17 +189,20 @@ class TestBaseCalculations:
                 "team_list": ["4041", "1153", "2370"],
             },
         ]
-        with patch("calculations.base_calculations.open", mock_open(read_data=test_json)):
-            assert BaseCalculations.get_aim_list() == expected_aim_list
-
-    def test_get_teams_list(self, caplog):
-        with patch("calculations.base_calculations.open", mock_open(read_data="[1,2,3]")) as _:
-            assert BaseCalculations.get_teams_list() == [1, 2, 3]
+        with open(
+            utils.create_file_path(f"data/{TEST_EVENT_KEY}_match_schedule.json"), "w"
+        ) as file:
+            file.write(test_json)
+        assert BaseCalculations.get_aim_list() == expected_aim_list
 
-        def f(*args):
-            raise FileNotFoundError
+    def test_get_teams_list(self, schedule_files, caplog):
+        with open(utils.create_file_path(f"data/{TEST_EVENT_KEY}_team_list.json"), "w") as file:
+            file.write("[1,2,3]")
+        assert BaseCalculations.get_teams_list() == [1, 2, 3]
 
-        with patch("calculations.base_calculations.open", Mock(side_effect=f)):
-            assert BaseCalculations.get_teams_list() == []
-            # Assert that the FileNotFoundError was logged
-            assert len([rec.message for rec in caplog.records if rec.levelname == "ERROR"]) == 1
+        os.remove(utils.create_file_path(f"data/{TEST_EVENT_KEY}_team_list.json"))
+        caplog.clear()
+        assert BaseCalculations.get_teams_list() == []
+        # Assert that the FileNotFoundError was logged
+        errors = [rec.message for rec in caplog.records if rec.levelname == "ERROR"]
+        assert len([message for message in errors if "team_list.json" in message]) == 1
@@ -0,0 +1,93 @@
+import random
+import statistics
+
+from calculations import consolidation
+
+
+def consolidate_num(nums):
+    """Consolidates the numbers of one field of one TIM, the way ObjTIMCalcs did before batching"""
+    mean = sum(nums) / len(nums) if nums else 0
+    if len(nums) == 0 or mean in nums:
+        return round(mean)
+    if len(nums) > len(set(nums)):
+        frequencies = {num: nums.count(num) for num in nums}
+        return consolidate_num(
+            [num for num in frequencies if frequencies[num] == max(frequencies.values())]
+        )
+    std_dev = statistics.pstdev(nums)
+    weights = [1 / ((num - mean) / std_dev) ** 2 for num in nums]
+    return round(sum([num * weight for num, weight in zip(nums, weights)]) / sum(weights))
+
+
+class TestConsolidation:
+    def test_stack_reports(self):
+        values, mask = consolidation.stack_reports([[[1, 2], [3, 4]], [], [[5, 6]]], 2)
+        assert values.shape == (3, 2, 2)
+        assert mask.tolist() == [[True, True], [False, False], [True, False]]
+        assert values[2, 0].tolist() == [5, 6]
+
+    def test_consolidate_nums(self):
+        reports = [
+            [[3], [3], [3]],
+            [[4], [4], [4], [4], [1]],
+            [[2], [2], [1]],
+            [],
+            # Evenly split modes are consolidated again
+            [[1], [1], [4], [4], [9]],
+            # Weighted average of the reports that don't agree
+            [[1], [2], [10]],
+        ]
+        values, mask = consolidation.stack_reports(reports, 1)
+        assert consolidation.consolidate_nums(values, mask)[:, 0].tolist() == [
+            3,
+            4,
+            2,
+            0,
+            consolidate_num([1, 1, 4, 4, 9]),
+            consolidate_num([1, 2, 10]),
+        ]
+
+    def test_consolidate_nums_matches_single_tims(self):
+        random.seed(1678)
+        reports = [
+            [[random.randint(0, 12) for _ in range(3)] for _ in range(random.randint(0, 5))]
+            for _ in range(2000)
+        ]
+        values, mask = consolidation.stack_reports(reports, 3)
+        consolidated = consolidation.consolidate_nums(values, mask).tolist()
+        for tim_reports, tim_consolidated in zip(reports, consolidated):
+            for field in range(3):
+                nums = [report[field] for report in tim_reports]
+                assert tim_consolidated[field] == consolidate_num(nums)
+
+    def test_consolidate_bools(self):
+        reports = [[[True], [True], [False]], [[True], [False]], [[False]], []]
+        values, mask = consolidation.stack_reports(reports, 1, bool)
+        assert consolidation.consolidate_bools(values, mask)[:, 0].tolist() == [
+            True,
+            False,
+            False,
+            False,
+        ]
+
+    def test_consolidate_categories(self):
+        categories = {"charge_level": ["N", "P", "D", "E"]}
+        reports = [
+            [{"charge_level": "D"}, {"charge_level": "D"}, {"charge_level": "N"}],
+            # No mode, so the mean index of N and E is rounded half to even
+            [{"charge_level": "N"}, {"charge_level": "E"}],
+            [{"charge_level": "N"}, {"charge_level": "P"}, {"charge_level": "E"}],
+            # Reports that aren't in the list are ignored
+            [{"charge_level": "X"}, {"charge_level": "X"}, {"charge_level": "E"}],
+            [],
+        ]
+        indices, mask = consolidation.category_indices(reports, categories)
+        assert indices[3, :, 0].tolist() == [-1, -1, 3]
+        consolidated = consolidation.consolidate_categories(indices, mask)
+        assert [categories["charge_level"][index] for index in consolidated[:, 0]] == [
+            "D",
+            "D",
+            "P",
+            "E",
+            "N",
+        ]
@@ -4,7 +4,7 @@ import pytest
 from unittest.mock import patch
 
 import server
-from calculations import decompressor
+from calculations import decompressor, timeline_features
 
 
 @pytest.mark.clouddb
@@ -298,6 +298,20 @@ class TestDecompressor:
                     "auto_charge_level": "N",
                     "tele_charge_level": "N",
                     "preloaded_gamepiece": "N",
+                    "timeline_features": {
+                        "version": timeline_features.FEATURES_VERSION,
+                        "action_counts": {"score_cube_high": 1, "score_cube_mid": 1},
+                        "phase_action_counts": {
+                            "auto": {"score_cube_high": 1, "score_cube_mid": 1},
+                            "teleop": {},
+                        },
+                        "score_times": [60, 61],
+                        "incap_intervals": [],
+                        "auto_timeline": [
+                            {"time": 60, "action_type": "score_cube_high", "in_teleop": False},
+                            {"time": 61, "action_type": "score_cube_mid", "in_teleop": False},
+                        ],
+                    },
                 }
             ],
             "subj_tim": [
@@ -364,6 +378,16 @@ class TestDecompressor:
             ]
         )
 
+    def test_decompress_qrs_packed(self):
+        qr = {
+            "data": f"+A{decompressor.Decompressor.SCHEMA['schema_file']['version']}$Bs1234$C34$D1230$Ev1.3$FName$GTRUE%Z1678$Y14$X4$W060AD061AE$VN$UN$TN",
+            "override": {},
+        }
+        with patch.object(decompressor.Decompressor, "PACK_TIMELINES", True):
+            decompressed = self.test_decompressor.decompress_qrs([qr])["unconsolidated_obj_tim"]
+        assert "timeline" not in decompressed[0]
+        assert decompressed[0]["packed_timeline"] == "060AD061AE"
+
     def test_decompress_pit_data(self):
         raw_obj_pit = {
             "team_number": "3448",
@@ -612,6 +636,36 @@ class TestDecompressor:
             result.pop("_id")
             assert result in expected_sbj
 
+    def test_run_corrected_qr(self):
+        qr = f"+A{decompressor.Decompressor.SCHEMA['schema_file']['version']}$BgCbtwqZ$C51$D9321$Ev1.3$FXvfaPcSrgJw25VKrcsphdbyEVjmHrH1V$GFALSE%Z3603$Y13$X2$W000AA001AB002AC005AO006AB007AD008AE$VN$UN$TN"
+        self.test_server.db.insert_documents(
+            "raw_qr",
+            [
+                {
+                    "data": qr,
+                    "match_number": 51,
+                    "scout_name": "XvfaPcSrgJw25VKrcsphdbyEVjmHrH1V",
+                    "team_number": "3603",
+                    "blocklisted": False,
+                    "override": {},
+                }
+            ],
+        )
+        self.test_decompressor.run()
+        assert len(self.test_server.db.find("unconsolidated_obj_tim")) == 1
+        qr_id = self.test_server.db.find("raw_qr")[0]["_id"]
+        # Blocklisting the QR removes its TIM
+        self.test_server.db.update_qr_blocklist_status({"_id": qr_id})
+        self.test_decompressor.run()
+        assert self.test_server.db.find("unconsolidated_obj_tim") == []
+        # Overriding a datapoint replaces the TIM with the overridden data
+        self.test_server.db.update_qr_blocklist_status({"_id": qr_id}, blocklist=False)
+        self.test_server.db.update_qr_data_override({"_id": qr_id}, "start_position", "4")
+        self.test_decompressor.run()
+        result_obj = self.test_server.db.find("unconsolidated_obj_tim")
+        assert len(result_obj) == 1
+        assert result_obj[0]["start_position"] == "4"
+
     def test_get_qr_type(self):
         # Test when QRType.OBJECTIVE returns when first character is '+'
         assert decompressor.QRType.OBJECTIVE == self.test_decompressor.get_qr_type("+")
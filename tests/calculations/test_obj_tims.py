@@ -2,8 +2,8 @@
 
 from unittest import mock
 
-from calculations import base_calculations
 from calculations import obj_tims
+import match_schedule
 from server import Server
 import pytest
 from unittest.mock import patch
@@ -293,10 +293,14 @@ class TestObjTIMCalcs:
         },
     ]
 
-    @mock.patch.object(
-        base_calculations.BaseCalculations, "get_teams_list", return_value=["3", "254", "1"]
-    )
-    def setup_method(self, method, get_teams_list_dummy):
+    @pytest.fixture(autouse=True)
+    def teams(self):
+        with mock.patch(
+            "match_schedule.get", return_value=match_schedule.MatchSchedule(["3", "254", "1"], {})
+        ):
+            yield
+
+    def setup_method(self, method):
         with mock.patch("server.Server.ask_calc_all_data", return_value=False):
             self.test_server = Server()
         self.test_calculator = obj_tims.ObjTIMCalcs(self.test_server)
@@ -381,6 +385,33 @@ class TestObjTIMCalcs:
         assert calculated_tim["preloaded_gamepiece"] == "U"
         assert calculated_tim["failed_scores"] == 0
 
+    def test_run_removed_reports(self):
+        self.test_server.db.insert_documents("unconsolidated_obj_tim", self.unconsolidated_tims)
+        with patch("data_transfer.tba_communicator.tba_request", return_value=self.tba_test_data):
+            self.test_calculator.run()
+        assert len(self.test_server.db.find("obj_tim")) == 1
+        # The reports of a TIM are removed when its QRs are blocklisted
+        self.test_server.db.delete_data(
+            "unconsolidated_obj_tim", {"team_number": "254", "match_number": 42}
+        )
+        with patch("data_transfer.tba_communicator.tba_request", return_value=self.tba_test_data):
+            self.test_calculator.run()
+        assert self.test_server.db.find("obj_tim") == []
+
+    def test_calculate_tims(self):
+        self.test_calculator.grid_status = self.test_calculator.get_grid_status(self.tba_test_data)
+        calculated_tims = self.test_calculator.calculate_tims(
+            [self.unconsolidated_tims, self.unconsolidated_tims[:1], []]
+        )
+        # Consolidating TIMs together gives the same results as consolidating them one at a time
+        assert calculated_tims == [
+            self.test_calculator.calculate_tim(self.unconsolidated_tims),
+            self.test_calculator.calculate_tim(self.unconsolidated_tims[:1]),
+            {},
+        ]
+        assert calculated_tims[0]["confidence_ranking"] == 3
+        assert calculated_tims[1]["confidence_ranking"] == 1
+
     @mock.patch.object(
         obj_tims.ObjTIMCalcs,
         "entries_since_last",
@@ -812,3 +812,32 @@ class TestPredictedAimCalc:
             del document["_id"]
             assert document in self.expected_playoffs_updates
             self.expected_playoffs_updates.remove(document)
+
+    def test_run_alliances_changed(self):
+        self.test_server.db.delete_data("predicted_aim")
+        self.test_server.db.delete_data("predicted_alliances")
+        with patch.object(self.test_calc, "get_updated_teams", return_value=[]), patch.object(
+            self.test_calc, "take_dirty_matches", return_value=set()
+        ):
+            # No alliances before alliance selection
+            with patch("data_transfer.tba_communicator.tba_request", return_value=None):
+                self.test_calc.run()
+            assert self.test_server.db.find("predicted_alliances") == []
+            # Only the polled alliances changed, so only the alliances are predicted
+            with patch(
+                "data_transfer.tba_communicator.tba_request", return_value=self.tba_playoffs_data
+            ):
+                self.test_calc.run()
+            assert self.test_server.db.find("predicted_aim") == []
+            result = self.test_server.db.find("predicted_alliances")
+            for document in result:
+                del document["_id"]
+            assert sorted(result, key=lambda alliance: alliance["alliance_num"]) == sorted(
+                self.expected_playoffs_updates, key=lambda alliance: alliance["alliance_num"]
+            )
+            # Alliances that match the stored ones aren't predicted again
+            with patch(
+                "data_transfer.tba_communicator.tba_request", return_value=self.tba_playoffs_data
+            ), patch.object(self.test_calc, "update_playoffs_alliances") as update_mock:
+                self.test_calc.run()
+            update_mock.assert_not_called()
@@ -415,3 +415,38 @@ class TestPredictedTeamCalc:
             assert document in self.expected_results
             # Removes the matching expected result to protect against duplicates from the calculation
             self.expected_results.remove(document)
+
+    def test_run_in_place(self):
+        self.test_server.db.insert_documents("predicted_aim", self.predicted_aim)
+        with mock.patch(
+            "data_transfer.tba_communicator.tba_request", return_value=self.ranking_data
+        ), mock.patch(
+            "calculations.predicted_team.PredictedTeamCalc.get_aim_list",
+            return_value=self.aim_list,
+        ), mock.patch(
+            "calculations.predicted_team.PredictedTeamCalc.entries_since_last", return_value=[{}]
+        ):
+            with mock.patch(
+                "calculations.predicted_team.PredictedTeamCalc.get_teams_list",
+                return_value=self.teams,
+            ):
+                self.test_calc.run()
+            writes_skipped = self.test_server.db.writes_skipped
+            # Predictions that didn't change aren't written again
+            with mock.patch(
+                "calculations.predicted_team.PredictedTeamCalc.get_teams_list",
+                return_value=self.teams,
+            ):
+                self.test_calc.run()
+            assert self.test_server.db.writes_skipped == writes_skipped + len(self.teams)
+            # Teams that left the team list are deleted, without emptying the collection
+            with mock.patch(
+                "calculations.predicted_team.PredictedTeamCalc.get_teams_list",
+                return_value=self.teams[:-1],
+            ), mock.patch.object(
+                self.test_server.db, "delete_data", wraps=self.test_server.db.delete_data
+            ) as delete_data:
+                self.test_calc.run()
+        assert delete_data.call_args.args[1] == {"team_number": {"$nin": self.teams[:-1]}}
+        teams = {document["team_number"] for document in self.test_server.db.find("predicted_team")}
+        assert teams == set(self.teams[:-1])
@@ -1,3 +1,4 @@
+from calculations import qr_state
 from calculations.qr_state import QRState
 
 
@@ -28,3 +29,21 @@ class TestQRState:
             {"name": "action_type", "length": 2, "type": "Enum[str]", "position": 1},
         ]
         assert expected_timeline_info == QRState.get_timeline_info()
+
+
+def test_qr_keys():
+    version = qr_state.SCHEMA["schema_file"]["version"]
+    objective_qr = f"+A{version}$BgCbtwqZ$C51$D9321$Ev1.3$FXvfaPcSrgJw25VKrcsphdbyEVjmHrH1V$GFALSE%Z3603$Y13$X2$W000AA$VN$UN$TN"
+    assert qr_state.qr_keys(objective_qr) == {
+        "match_number": 51,
+        "scout_name": "XvfaPcSrgJw25VKrcsphdbyEVjmHrH1V",
+        "team_number": "3603",
+    }
+    # Subjective QRs have a team number for each team in the alliance, so it isn't a key
+    subjective_qr = f"*A{version}$Bs1234$C34$D1230$Ev1.3$FName$GFALSE%A1678$B1$C2$DFALSE$FFALSE$G277#A254$B2$C2$DFALSE$FFALSE$G219^E1010"
+    assert qr_state.qr_keys(subjective_qr) == {"match_number": 34, "scout_name": "Name"}
+    # Fields that can't be converted are left out
+    assert qr_state.qr_keys(f"+A{version}$CQ5$FName%Z254") == {
+        "scout_name": "Name",
+        "team_number": "254",
+    }
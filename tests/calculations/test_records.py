@@ -0,0 +1,132 @@
+import threading
+
+import numpy as np
+import pytest
+
+from calculations import records
+
+TIMELINE = [
+    {"in_teleop": False, "time": 148, "action_type": "score_cone_high"},
+    {"in_teleop": False, "time": 140, "action_type": "intake_ground"},
+    {"in_teleop": True, "time": 120, "action_type": "supercharge"},
+    {"in_teleop": True, "time": 100, "action_type": "score_cube_mid"},
+]
+
+
+class TestRecord:
+    def setup_method(self, method):
+        self.record_type = records.record_type("TestRecord", ("team_number", "match_number"))
+
+    def test_slots(self):
+        record = self.record_type.from_document({"team_number": "1678", "_id": 5})
+        assert record.team_number == "1678"
+        assert record.extra == {"_id": 5}
+        assert not hasattr(record, "__dict__")
+        # The same record type is reused
+        assert (
+            records.record_type("TestRecord", ("team_number", "match_number")) is self.record_type
+        )
+
+    def test_dictionary_access(self):
+        record = self.record_type(team_number="1678", override={"a": 1})
+        assert record["team_number"] == "1678"
+        assert "match_number" not in record
+        assert record.get("match_number", 3) == 3
+        with pytest.raises(KeyError):
+            record["match_number"]
+        record["match_number"] = 42
+        assert record.pop("override") == {"a": 1}
+        assert record == {"team_number": "1678", "match_number": 42}
+        assert sorted(record.keys()) == ["match_number", "team_number"]
+
+
+class TestTimeline:
+    def setup_method(self, method):
+        self.timeline = records.Timeline.from_documents(TIMELINE)
+
+    def test_columns(self):
+        assert self.timeline.columns["time"].dtype == np.int64
+        assert self.timeline.columns["in_teleop"].dtype == np.bool_
+        assert "action_type" in self.timeline.text_columns
+        assert len(self.timeline) == 4
+        assert self.timeline.to_documents() == TIMELINE
+        assert self.timeline[1] == TIMELINE[1]
+        assert self.timeline[1]["time"] == 140
+
+    def test_filters(self):
+        assert self.timeline.count({"in_teleop": False}) == 2
+        assert self.timeline.count({"time": [0, 130]}) == 2
+        assert self.timeline.count({"action_type": "score"}) == 0
+        assert self.timeline.count({"action_type": "score"}, partial=["score"]) == 2
+        assert self.timeline.count({"action_type": "score", "in_teleop": True}, ["score"]) == 1
+        assert self.timeline.count({"action_type": "unknown_action"}) == 0
+        assert self.timeline.filter({"in_teleop": True}) == TIMELINE[2:]
+        assert self.timeline.values("time", {"action_type": "score"}, ["score"]) == [148, 100]
+
+    def test_set_value(self):
+        assert self.timeline.count({"action_type": "score_fail"}) == 0
+        self.timeline.set_value(3, "action_type", "score_fail")
+        assert self.timeline.count({"action_type": "score_fail"}) == 1
+        self.timeline.set_value(0, "time", None)
+        assert self.timeline.value(0, "time") is None
+        assert self.timeline.count({"time": [0, 150]}) == 3
+
+    def test_missing_fields(self):
+        timeline = records.Timeline.from_documents([{"time": 5}, {"time": 3, "action_type": "x"}])
+        assert timeline.to_documents() == [{"time": 5}, {"time": 3, "action_type": "x"}]
+        assert timeline.count({"action_type": "x"}) == 1
+
+
+class TestPackedTimeline:
+    PACKED = "059AD060AO061AE"
+    DECODED = [
+        {"time": 59, "action_type": "score_cube_high", "in_teleop": False},
+        {"time": 60, "action_type": "to_teleop", "in_teleop": True},
+        {"time": 61, "action_type": "score_cube_mid", "in_teleop": True},
+    ]
+
+    def test_from_packed(self):
+        timeline = records.Timeline.from_packed(self.PACKED)
+        assert timeline.columns["time"].dtype == np.int64
+        assert timeline.to_documents() == self.DECODED
+        assert timeline.count({"in_teleop": True, "action_type": "score"}, ["score"]) == 1
+        assert records.as_timeline(self.PACKED) == self.DECODED
+        assert len(records.Timeline.from_packed("")) == 0
+        with pytest.raises(ValueError):
+            records.Timeline.from_packed("059AD06")
+        with pytest.raises(ValueError):
+            records.Timeline.from_packed("059ZZ")
+
+    def test_pack_timeline(self):
+        assert records.pack_timeline(self.DECODED) == self.PACKED
+        assert records.pack_timeline([]) == ""
+
+    def test_unconsolidated_tim(self):
+        tim = records.unconsolidated_tim({"team_number": "1678", "packed_timeline": self.PACKED})
+        assert "packed_timeline" not in tim
+        assert tim["timeline"] == self.DECODED
+
+
+def test_unconsolidated_tim():
+    tim = records.unconsolidated_tim({"team_number": "1678", "timeline": TIMELINE})
+    assert isinstance(tim["timeline"], records.Timeline)
+    assert records.unconsolidated_tim(tim) is tim
+    assert tim.to_document() == {"team_number": "1678", "timeline": TIMELINE}
+
+
+def test_code_threads():
+    values = [f"thread_test_{index}" for index in range(200)]
+
+    def add_codes(offset):
+        for index in range(len(values)):
+            records._code("thread_test", values[(index + offset) % len(values)])
+
+    threads = [threading.Thread(target=add_codes, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Every value has one code that decodes back to it
+    codes = [records._code("thread_test", value) for value in values]
+    assert sorted(codes) == list(range(len(values)))
+    assert [records._code_values["thread_test"][code] for code in codes] == values
@@ -0,0 +1,84 @@
+from unittest import mock
+
+from calculations import team_cards
+from data_transfer import database
+import server
+
+
+class TestTeamCardCalc:
+    def setup_method(self, method):
+        with mock.patch("server.Server.ask_calc_all_data", return_value=False):
+            self.test_server = server.Server()
+        self.db = self.test_server.db
+        for collection in team_cards.SOURCE_COLLECTIONS + [database.TEAM_CARD_COLLECTION]:
+            self.db.db[collection].delete_many({})
+        self.db.insert_documents("obj_team", [{"team_number": "1678", "a": 1}])
+        self.db.insert_documents("tba_team", [{"team_number": "1678", "b": 2}])
+        self.db.insert_documents("obj_team", [{"team_number": "254", "a": 3}])
+        self.test_calc = team_cards.TeamCardCalc(self.test_server)
+
+    def teardown_method(self, method):
+        for collection in team_cards.SOURCE_COLLECTIONS + [database.TEAM_CARD_COLLECTION]:
+            self.db.db[collection].delete_many({})
+
+    def cards(self):
+        return {
+            card["team_number"]: {field: value for field, value in card.items() if field != "_id"}
+            for card in self.db.find(database.TEAM_CARD_COLLECTION)
+        }
+
+    def test_build_cards(self):
+        self.db.insert_documents("pickability", [{"team_number": "1678", "a": 5}])
+        # Later collections overwrite the fields of earlier ones
+        assert self.test_calc.build_cards(["1678"]) == [{"team_number": "1678", "a": 5, "b": 2}]
+        assert self.test_calc.build_cards(["1"]) == []
+
+    def test_run(self):
+        self.test_calc.server.calc_all_data = True
+        self.test_calc.run()
+        assert self.cards() == {
+            "1678": {"team_number": "1678", "a": 1, "b": 2},
+            "254": {"team_number": "254", "a": 3},
+        }
+        self.test_calc.server.calc_all_data = False
+        self.test_calc.update_timestamp()
+        self.db.update_document("subj_team", {"c": 4}, {"team_number": "254"})
+        with mock.patch.object(
+            self.test_calc, "build_cards", wraps=self.test_calc.build_cards
+        ) as build_cards:
+            self.test_calc.run()
+        # Only the team that changed is rebuilt
+        build_cards.assert_called_once_with({"254"})
+        assert self.cards()["254"] == {"team_number": "254", "a": 3, "c": 4}
+        # Deleted data is removed from the cards
+        self.db.delete_data("tba_team", {"team_number": "1678"})
+        self.test_calc.run()
+        assert self.cards()["1678"] == {"team_number": "1678", "a": 1}
+        self.test_calc.run()
+        assert len(self.cards()) == 2
+
+    def test_run_in_place(self):
+        self.test_server.calc_all_data = True
+        self.test_calc.run()
+        self.test_server.calc_all_data = False
+        # Deletes by another process can't be traced to teams, so every card is rebuilt
+        self.db.db.obj_team.delete_many({"team_number": "254"})
+        self.db.update_document("predicted_team", {"predicted_rps": 2}, {"team_number": "1678"})
+        with mock.patch.object(
+            self.db, "delete_data", wraps=self.db.delete_data
+        ) as delete_data, mock.patch.object(
+            self.test_calc, "build_cards", wraps=self.test_calc.build_cards
+        ) as build_cards:
+            self.test_calc.run()
+        build_cards.assert_called_once_with({"1678"})
+        # Only the card of the team without documents is deleted
+        for call in delete_data.call_args_list:
+            assert call.args[1] != {}
+        assert self.cards() == {"1678": {"team_number": "1678", "a": 1, "b": 2, "predicted_rps": 2}}
+        # Predictions that didn't change don't rebuild the card
+        self.db.replace_document(
+            "predicted_team", {"team_number": "1678", "predicted_rps": 2}, {"team_number": "1678"}
+        )
+        with mock.patch.object(self.test_calc, "build_cards") as build_cards:
+            self.test_calc.run()
+        build_cards.assert_not_called()
@@ -0,0 +1,68 @@
+import random
+
+from calculations import records, timeline_features
+
+TIMELINE = [
+    {"time": 148, "action_type": "score_cone_high", "in_teleop": False},
+    {"time": 140, "action_type": "auto_intake_one", "in_teleop": False},
+    {"time": 135, "action_type": "to_teleop", "in_teleop": True},
+    {"time": 120, "action_type": "start_incap", "in_teleop": True},
+    {"time": 100, "action_type": "end_incap", "in_teleop": True},
+    {"time": 90, "action_type": "score_cube_mid", "in_teleop": True},
+    {"time": 70, "action_type": "score_cube_mid", "in_teleop": True},
+]
+
+
+class TestTimelineFeatures:
+    def setup_method(self, method):
+        self.features = timeline_features.extract_features(TIMELINE)
+
+    def test_extract_features(self):
+        assert self.features["action_counts"]["score_cube_mid"] == 2
+        assert self.features["phase_action_counts"]["auto"] == {
+            "score_cone_high": 1,
+            "auto_intake_one": 1,
+        }
+        assert self.features["score_times"] == [148, 90, 70]
+        assert self.features["incap_intervals"] == [[120, 100]]
+        assert self.features["auto_timeline"] == TIMELINE[:2]
+        # Timelines with missing fields are left to the timeline calculations
+        assert timeline_features.extract_features([{"time": 5}]) is None
+        assert timeline_features.extract_features([])["action_counts"] == {}
+
+    def test_get_features(self):
+        assert timeline_features.get_features({"timeline_features": self.features}) is not None
+        assert timeline_features.get_features({"timeline_features": {"version": 0}}) is None
+        assert timeline_features.get_features({}) is None
+
+    def test_count_actions(self):
+        count = timeline_features.count_actions
+        assert count(self.features, {"action_type": "score"}) == 0
+        assert count(self.features, {"action_type": "score"}, ["score"]) == 3
+        assert count(self.features, {"action_type": "score", "in_teleop": True}, ["score"]) == 2
+        assert count(self.features, {"in_teleop": False}) == 2
+        assert count(self.features, {"time": [0, 100]}) is None
+
+    def test_counts_match_timeline(self):
+        action_types = ["score_cone_high", "score_cube_low", "intake_ground", "supercharge"]
+        filters = [
+            {"action_type": action_type, "in_teleop": in_teleop}
+            for action_type in action_types + ["score"]
+            for in_teleop in [False, True]
+        ]
+        for _ in range(20):
+            length = random.randint(0, 30)
+            teleop_start = random.randint(0, length)
+            timeline = [
+                {
+                    "time": 150 - index,
+                    "action_type": random.choice(action_types),
+                    "in_teleop": index >= teleop_start,
+                }
+                for index in range(length)
+            ]
+            features = timeline_features.extract_features(timeline)
+            for filter_ in filters:
+                assert timeline_features.count_actions(
+                    features, filter_, ["score"]
+                ) == records.as_timeline(timeline).count(filter_, ["score"])
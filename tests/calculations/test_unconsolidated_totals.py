@@ -2,8 +2,9 @@
 
 from unittest import mock
 
-from calculations import base_calculations
 from calculations import unconsolidated_totals
+from data_transfer import change_tracker
+import match_schedule
 from server import Server
 import pytest
 from unittest.mock import patch
@@ -287,10 +288,14 @@ class TestUnconsolidatedTotals:
         },
     ]
 
-    @mock.patch.object(
-        base_calculations.BaseCalculations, "get_teams_list", return_value=["3", "254", "1"]
-    )
-    def setup_method(self, method, get_teams_list_dummy):
+    @pytest.fixture(autouse=True)
+    def teams(self):
+        with mock.patch(
+            "match_schedule.get", return_value=match_schedule.MatchSchedule(["3", "254", "1"], {})
+        ):
+            yield
+
+    def setup_method(self, method):
         with mock.patch("server.Server.ask_calc_all_data", return_value=False):
             self.test_server = Server()
         self.test_calculator = unconsolidated_totals.UnconsolidatedTotals(self.test_server)
@@ -397,3 +402,22 @@ class TestUnconsolidatedTotals:
         with patch("data_transfer.tba_communicator.tba_request", return_value=self.tba_test_data):
             self.test_calculator.run()
         assert len([rec.message for rec in caplog.records if rec.levelname == "WARNING"]) == 0
+
+    def test_remove_deleted_reports(self):
+        db = self.test_server.db
+        reports = [
+            {"team_number": "3", "match_number": 1, "scout_name": "A"},
+            {"team_number": "254", "match_number": 1, "scout_name": "B"},
+        ]
+        db.insert_documents("unconsolidated_obj_tim", [dict(reports[0])])
+        db.insert_documents("unconsolidated_totals", [dict(report) for report in reports])
+        changed = change_tracker.ChangedKeys()
+        for report in reports:
+            changed.add("unconsolidated_obj_tim", report)
+        changed.add("unconsolidated_obj_tim", {"team_number": "3"})
+        with mock.patch.object(db, "find", wraps=db.find) as find:
+            self.test_calculator.remove_deleted_reports(changed)
+        # The existing reports are found with one query
+        find.assert_called_once()
+        totals = db.find("unconsolidated_totals")
+        assert [total["team_number"] for total in totals] == ["3"]
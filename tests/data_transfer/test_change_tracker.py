@@ -0,0 +1,81 @@
+import threading
+
+from data_transfer import change_tracker
+
+
+class TestChangeTracker:
+    def setup_method(self, method):
+        self.tracker = change_tracker.ChangeTracker()
+
+    def test_record(self):
+        self.tracker.record(
+            "obj_tim",
+            [{"team_number": "1678", "match_number": 1, "a": 5}, {"a": 6}],
+        )
+        self.tracker.record_update(
+            "predicted_aim", {"match_number": 2}, {"alliance_color_is_red": True}
+        )
+        self.tracker.record_update("obj_team", {"a": 1}, {"b": 2})
+        assert self.tracker.position == 4
+        changed = self.tracker.changes_since(0, ["obj_tim", "predicted_aim"])
+        assert changed.teams() == {"1678"}
+        assert changed.tims() == {("1678", 1)}
+        assert changed.aims() == {(2, True)}
+        assert changed.unkeyed_collections == set()
+        assert self.tracker.changes_since(0, ["obj_team"]).unkeyed_collections == {"obj_team"}
+        assert not self.tracker.changes_since(4, ["obj_tim", "obj_team"])
+        assert changed.position == 4
+
+    def test_record_delete(self):
+        self.tracker.record_delete("obj_tim", {"team_number": "1678", "match_number": 1}, 2)
+        self.tracker.record_delete("obj_team", {}, 3)
+        changed = self.tracker.changes_since(0, ["obj_tim", "obj_team"])
+        assert changed.tims() == {("1678", 1)}
+        assert changed.deleted_collections == {"obj_tim", "obj_team"}
+        assert changed.keyed_deletes == {"obj_tim": 2}
+        assert changed.unkeyed_collections == {"obj_team"}
+        # Deleting nothing changes nothing, and queries with operators have no keys
+        self.tracker.record_delete("obj_tim", {"team_number": "1678"}, 0)
+        self.tracker.record_delete("obj_tim", {"team_number": {"$nin": ["1678"]}}, 1)
+        changed = self.tracker.changes_since(2, ["obj_tim"])
+        assert changed.teams() == set()
+        assert changed.unkeyed_collections == {"obj_tim"}
+        assert changed.position == 3
+
+    def test_discard_before(self):
+        self.tracker.record("obj_team", [{"team_number": "1678"}, {"team_number": "254"}])
+        self.tracker.discard_before(1)
+        assert self.tracker.changes_since(1, ["obj_team"]).teams() == {"254"}
+        # Changes that were discarded can't be listed, so the whole collection changed
+        assert self.tracker.changes_since(0, ["obj_team"]).unkeyed_collections == {"obj_team"}
+        self.tracker.discard_before(10)
+        assert self.tracker.position == 2
+        assert self.tracker.changes == []
+
+    def test_threads(self):
+        def record(team_number):
+            for match_number in range(100):
+                self.tracker.record(
+                    "obj_tim", [{"team_number": team_number, "match_number": match_number}]
+                )
+
+        threads = [threading.Thread(target=record, args=(str(team),)) for team in range(4)]
+        position = 0
+        tims = set()
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            changed = self.tracker.changes_since(position, ["obj_tim"])
+            tims.update(changed.tims())
+            self.tracker.discard_before(position)
+            position = changed.position
+        for thread in threads:
+            thread.join()
+        tims.update(self.tracker.changes_since(position, ["obj_tim"]).tims())
+        # No change is lost while changes are read and discarded at the same time
+        assert len(tims) == 400
+
+
+def test_get_tracker():
+    assert change_tracker.get_tracker("test1") is change_tracker.get_tracker("test1")
+    assert change_tracker.get_tracker("test1") is not change_tracker.get_tracker("test2")
@@ -1,4 +1,3 @@
-import collections
 import os
 import shutil
 import subprocess
@@ -19,50 +18,18 @@ class TestCloudDBUpdater:
     def setup_method(self, method):
         self.start_timestamp = bson.Timestamp(int(time.time()) - 1, 1)
         self.CloudDBUpdater = cloud_db_updater.CloudDBUpdater()
+        self.CloudDBUpdater.queue.clear()
+        # Don't resume from the changes of earlier tests
+        self.CloudDBUpdater.update_timestamp()
 
+    # The oplog of the memory backend isn't a pymongo collection
+    @pytest.mark.mongod
     def test_init(self):
         assert isinstance(self.CloudDBUpdater.cloud_db, database.Database)
         assert isinstance(self.CloudDBUpdater.oplog, pymongo.collection.Collection)
         assert self.CloudDBUpdater.oplog.name == "oplog.rs"
         assert isinstance(self.CloudDBUpdater.last_timestamp, bson.Timestamp)
 
-    def test_create_bulk_operation_delete(self):
-        entry = {
-            "ts": 12345,
-            "h": -1232132123123,
-            "v": 2,
-            "op": "d",
-            "ns": "test.testing",
-            "o": {"_id": "1234512345134556"},
-        }
-        expected = pymongo.DeleteOne({"_id": "1234512345134556"})
-        assert self.CloudDBUpdater.create_bulk_operation(entry) == expected
-
-    def test_create_bulk_operation_insert(self):
-        entry = {
-            "ts": 12345,
-            "h": -1232132123123,
-            "v": 2,
-            "op": "i",
-            "ns": "test.testing",
-            "o": {"_id": "1234512345134556", "t": 42},
-        }
-        expected = pymongo.InsertOne({"_id": "1234512345134556", "t": 42})
-        assert self.CloudDBUpdater.create_bulk_operation(entry) == expected
-
-    def test_create_bulk_operation_update(self):
-        entry = {
-            "ts": 12345,
-            "h": -1232132123123,
-            "v": 2,
-            "op": "u",
-            "ns": "test.testing",
-            "o": {"$set": {"test": 42}},
-            "o2": {"_id": "1234512345134556"},
-        }
-        expected = pymongo.UpdateOne({"_id": "1234512345134556"}, {"$set": {"test": 42}})
-        assert self.CloudDBUpdater.create_bulk_operation(entry) == expected
-
     def test_entries_since_last(self):
         self.CloudDBUpdater.db.insert_documents("test.testing", ({"a": 1}, {"a": 2}, {"a": 3}))
         self.CloudDBUpdater.db.delete_data("test.testing", {"a": 1})
@@ -71,26 +38,6 @@ class TestCloudDBUpdater:
             assert entry["ts"] > self.start_timestamp
             assert entry["op"] in ["d", "i", "u"]
 
-    def test_create_db_changes(self):
-        current_db = self.CloudDBUpdater.db.db.name
-        fake_oplog = [
-            {"ns": f"{current_db}.test", "op": "u", "o": {"$set": {"v": 1}}, "o2": {"_id": "1234"}},
-            {"ns": f"{current_db}test.test", "op": "d", "o": {"_id": "1234567"}},
-            {"ns": f"{current_db}.test", "op": "d", "o": {"_id": "4321"}},
-            {"ns": f"{current_db}.test2", "op": "i", "o": {"_id": "43210", "b": 1}},
-        ]
-        expected = collections.defaultdict()
-        expected["test"] = [
-            pymongo.UpdateOne({"_id": "1234"}, {"$set": {"v": 1}}),
-            pymongo.DeleteOne({"_id": "4321"}),
-        ]
-        expected["test2"] = [pymongo.InsertOne({"_id": "43210", "b": 1})]
-        with mock.patch.object(
-            self.CloudDBUpdater, "entries_since_last", return_value=fake_oplog
-        ) as _:
-            changes = self.CloudDBUpdater.create_db_changes()
-        assert changes == expected
-
     def test_get_connection_string(self):
         with mock.patch(
             "data_transfer.cloud_db_updater.open",
@@ -102,26 +49,77 @@ class TestCloudDBUpdater:
             assert "very_secure_password" in result
             assert mock_open.call_args.args[0].endswith("data/api_keys/cloud_password.txt")
 
-    @mock.patch("data_transfer.cloud_db_updater.CloudDBUpdater.update_timestamp")
-    def test_write_db_changes(self, mock1):
-        changes = collections.defaultdict()
-        changes["obj_team"] = [
-            pymongo.InsertOne({"_id": "1234", "v": 2}),
-            pymongo.InsertOne({"_id": "4321", "v": 1}),
-            pymongo.UpdateOne({"_id": "1234"}, {"$set": {"v": 1, "c": 2}}),
-        ]
-        changes["subj_team"] = [pymongo.InsertOne({"_id": "43210", "b": 1})]
-        with mock.patch.object(self.CloudDBUpdater, "create_db_changes", return_value=changes) as _:
-            result = self.CloudDBUpdater.write_db_changes()
-        assert result["obj_team"].inserted_count == 2
-        assert result["obj_team"].modified_count == 1
-        assert result["subj_team"].inserted_count == 1
-        assert result["subj_team"].modified_count == 0
-        assert self.CloudDBUpdater.cloud_db.find("obj_team") == [
+    def test_queue_db_changes(self):
+        self.CloudDBUpdater.db.insert_documents("obj_team", {"_id": "1234", "v": 1})
+        self.CloudDBUpdater.db.update_document("obj_team", {"v": 2}, {"_id": "1234"})
+        # Both changes are to the same document, so it is only queued once
+        assert self.CloudDBUpdater.queue_db_changes() == 1
+        assert self.CloudDBUpdater.queue_db_changes() == 0
+        assert self.CloudDBUpdater.queue.next_batch(10)[0] == [("obj_team", "1234")]
+
+    def test_restart(self):
+        self.CloudDBUpdater.db.insert_documents("obj_team", {"_id": "1234", "v": 1})
+        self.CloudDBUpdater.queue_db_changes()
+        # Changes made while the server is stopped are queued once it restarts
+        self.CloudDBUpdater.db.insert_documents("obj_team", {"_id": "4321", "v": 1})
+        restarted = cloud_db_updater.CloudDBUpdater()
+        assert restarted.last_timestamp == self.CloudDBUpdater.last_timestamp
+        assert restarted.queue_db_changes() == 1
+        assert restarted.queue.next_batch(10)[0] == [("obj_team", "1234"), ("obj_team", "4321")]
+
+    def test_write_db_changes(self):
+        self.CloudDBUpdater.db.insert_documents(
+            "obj_team", [{"_id": "1234", "v": 2}, {"_id": "4321", "v": 1}, {"_id": "0", "v": 0}]
+        )
+        self.CloudDBUpdater.db.update_document("obj_team", {"v": 1, "c": 2}, {"_id": "1234"})
+        self.CloudDBUpdater.db.delete_data("obj_team", {"_id": "0"})
+        self.CloudDBUpdater.db.insert_documents("subj_team", {"_id": "43210", "b": 1})
+        result = self.CloudDBUpdater.write_db_changes()
+        assert result["obj_team"].upserted_count == 2
+        assert result["obj_team"].deleted_count == 0
+        assert result["subj_team"].upserted_count == 1
+        assert sorted(self.CloudDBUpdater.cloud_db.find("obj_team"), key=lambda d: d["_id"]) == [
             {"_id": "1234", "v": 1, "c": 2},
             {"_id": "4321", "v": 1},
         ]
-        assert mock1.called
+        assert self.CloudDBUpdater.queue.is_empty()
+        # Stored hashes are updated with the changes, so reconciling finds nothing to send
+        self.CloudDBUpdater.reconcile(["obj_team"])
+        self.CloudDBUpdater.db.update_document("obj_team", {"v": 3}, {"_id": "4321"})
+        self.CloudDBUpdater.db.delete_data("obj_team", {"_id": "1234"})
+        self.CloudDBUpdater.write_db_changes()
+        assert self.CloudDBUpdater.reconcile(["obj_team"])["obj_team"].differing_buckets == 0
+
+    def test_write_db_changes_offline(self):
+        self.CloudDBUpdater.cloud_db = None
+        self.CloudDBUpdater.db.insert_documents("obj_team", {"_id": "1234", "v": 1})
+        with mock.patch.object(cloud_db_updater.CloudDBUpdater, "get_cloud_db", return_value=None):
+            assert self.CloudDBUpdater.write_db_changes() == {}
+        # The change stays queued and later attempts wait for the backoff
+        assert not self.CloudDBUpdater.queue.is_empty()
+        assert self.CloudDBUpdater.backoff == cloud_db_updater.CloudDBUpdater.INITIAL_BACKOFF
+        assert self.CloudDBUpdater.write_db_changes() == {}
+        self.CloudDBUpdater.next_attempt = 0
+        result = self.CloudDBUpdater.write_db_changes()
+        assert result["obj_team"].upserted_count == 1
+        assert self.CloudDBUpdater.backoff == 0
+
+    def test_send_queued_changes_batches(self):
+        self.CloudDBUpdater.db.insert_documents(
+            "obj_team", [{"_id": str(i), "v": i} for i in range(10)]
+        )
+        self.CloudDBUpdater.queue_db_changes()
+        with mock.patch.object(self.CloudDBUpdater, "BATCH_SIZE", 3), mock.patch.object(
+            self.CloudDBUpdater, "MAX_BATCHES_PER_CYCLE", 2
+        ):
+            result = self.CloudDBUpdater.send_queued_changes()
+            # Only two batches of three are sent per call
+            assert result["obj_team"].upserted_count == 6
+            assert len(self.CloudDBUpdater.cloud_db.find("obj_team")) == 6
+            assert not self.CloudDBUpdater.queue.is_empty()
+            self.CloudDBUpdater.send_queued_changes()
+        assert len(self.CloudDBUpdater.cloud_db.find("obj_team")) == 10
+        assert self.CloudDBUpdater.queue.is_empty()
 
     def test_update_timestamp(self):
         self.CloudDBUpdater.db.insert_documents("test", {"a": 1})
@@ -1,5 +1,7 @@
 """Tests database.py"""
+import bson
 import pymongo
+import pytest
 import yaml
 
 from data_transfer import database
@@ -12,6 +14,8 @@ TEST_DB_HELPER = CLIENT[TEST_DATABASE_NAME]
 # The actual class to be tested
 TEST_DB_ACTUAL = database.Database()
 
+# The tests check the database through a pymongo client
+pytestmark = pytest.mark.mongod
 
 with open("schema/collection_schema.yml", "r") as collection_schema:
     collections = yaml.load(collection_schema, yaml.Loader)
@@ -42,6 +46,14 @@ class TestDatabase:
         assert test_db.db.name == TEST_DATABASE_NAME
         assert test_db.name == TEST_DATABASE_NAME
 
+    def test_lazy_client(self):
+        """The client is only created when the database is first used"""
+        test_db = database.Database()
+        assert test_db._client is None
+        test_db.find("obj_team")
+        assert test_db._client is not None
+        assert test_db.client is test_db._client
+
     def test_indexes(self):
         """Checks if all indexes are added properly"""
         TEST_DB_ACTUAL.set_indexes()
@@ -55,6 +67,14 @@ class TestDatabase:
                             for field in index:
                                 assert field in db_index_fields
 
+    def test_raw_qr_indexes(self):
+        TEST_DB_ACTUAL.set_indexes()
+        index_keys = [
+            list(index["key"].keys()) for index in TEST_DB_HELPER["raw_qr"].list_indexes()
+        ]
+        for fields in database.RAW_QR_INDEXES:
+            assert fields in index_keys
+
     def test_find(self):
         """Tests database find"""
         TEST_DB_HELPER.test.insert_one({"test": "test"})
@@ -80,8 +100,20 @@ class TestDatabase:
         TEST_DB_ACTUAL.update_tba_cache({"a": "b"}, "test2", "ETAG")
         test_cache = TEST_DB_HELPER.tba_cache.find_one({"api_url": "test2"})
         del test_cache["_id"]
+        del test_cache["last_modified"]
         assert test_cache == {"data": {"a": "b"}, "etag": "ETAG", "api_url": "test2"}
 
+    def test_update_tba_cache_concurrent(self):
+        """Tests that a cache is only updated if it wasn't written since it was read"""
+        TEST_DB_ACTUAL.update_tba_cache("a", "test", "ETAG")
+        cached = TEST_DB_ACTUAL.get_tba_cache("test")
+        assert TEST_DB_ACTUAL.update_tba_cache("b", "test", cached=cached)
+        # 'cached' is out of date
+        assert not TEST_DB_ACTUAL.update_tba_cache("c", "test", cached=cached)
+        test_cache = TEST_DB_HELPER.tba_cache.find_one({"api_url": "test"})
+        assert test_cache["data"] == "b"
+        assert test_cache["etag"] == "ETAG"
+
     def test_delete_data(self):
         """Tests deletion of data"""
         TEST_DB_HELPER.test.insert_many([{"test": "test"}, {"test1": "test1"}])
@@ -105,6 +137,86 @@ class TestDatabase:
         TEST_DB_ACTUAL.update_document("test", {"test_2": "c"}, {"test_2": "a"})
         assert TEST_DB_HELPER.test.find_one({"test_2": "c"})["test_2"] == "c"
 
+    def test_update_document_unchanged(self):
+        """Tests that updates that would not change anything are skipped"""
+        db = database.Database()
+        db.update_document("obj_team", {"a": 1}, {"team_number": "1"})
+        db.update_document("obj_team", {"a": 1}, {"team_number": "1"})
+        assert db.writes_skipped == 1
+        db.update_document("obj_team", {"a": 2}, {"team_number": "1"})
+        assert TEST_DB_HELPER.obj_team.find_one({"team_number": "1"})["a"] == 2
+        # A query that could match the same document might have overwritten the field
+        db.update_document("obj_team", {"a": 3}, {"team_number": "1", "b": None})
+        db.update_document("obj_team", {"a": 2}, {"team_number": "1"})
+        assert TEST_DB_HELPER.obj_team.find_one({"team_number": "1"})["a"] == 2
+        # Deleted documents are written again
+        db.delete_data("obj_team")
+        db.update_document("obj_team", {"a": 2}, {"team_number": "1"})
+        assert TEST_DB_HELPER.obj_team.find_one({"team_number": "1"})["a"] == 2
+        assert db.writes_skipped == 1
+        # Documents changed by another process or Database are written again
+        TEST_DB_HELPER.obj_team.update_one({"team_number": "1"}, {"$set": {"a": 5}})
+        db.update_document("obj_team", {"a": 2}, {"team_number": "1"})
+        assert TEST_DB_HELPER.obj_team.find_one({"team_number": "1"})["a"] == 2
+        database.Database().update_document("obj_team", {"a": 6}, {"team_number": "1"})
+        db.update_document("obj_team", {"a": 2}, {"team_number": "1"})
+        assert TEST_DB_HELPER.obj_team.find_one({"team_number": "1"})["a"] == 2
+        assert db.writes_skipped == 1
+
+    def test_replace_document(self):
+        """Tests that replaced documents lose the fields they no longer have"""
+        db = database.Database()
+        db.replace_document("obj_team", {"team_number": "1", "a": 1, "b": 2}, {"team_number": "1"})
+        db.replace_document("obj_team", {"team_number": "1", "a": 1}, {"team_number": "1"})
+        test_cache = TEST_DB_HELPER.obj_team.find_one({"team_number": "1"})
+        del test_cache["_id"]
+        assert test_cache == {"team_number": "1", "a": 1}
+        db.replace_document("obj_team", {"team_number": "1", "a": 1}, {"team_number": "1"})
+        assert db.writes_skipped == 1
+
+    def test_rebuild(self):
+        """Tests that rebuilt collections stay readable until they are swapped in"""
+        db = database.Database()
+        db.delete_data("obj_team")
+        db.update_document("obj_team", {"a": 1}, {"team_number": "1"})
+        with db.rebuild() as rebuilt:
+            db.delete_data("obj_team")
+            db.update_document("obj_team", {"a": 2}, {"team_number": "2"})
+            assert list(TEST_DB_HELPER.obj_team.find({}, {"_id": 0})) == [
+                {"team_number": "1", "a": 1}
+            ]
+            assert db.find("obj_team") == list(TEST_DB_HELPER.obj_team_rebuild.find())
+        assert rebuilt == {"obj_team"}
+        assert list(TEST_DB_HELPER.obj_team.find({}, {"_id": 0})) == [{"team_number": "2", "a": 2}]
+        assert "obj_team_rebuild" not in TEST_DB_HELPER.list_collection_names()
+        # A failed rebuild leaves the collections unchanged
+        try:
+            with db.rebuild():
+                db.delete_data("obj_team")
+                raise ValueError
+        except ValueError:
+            pass
+        assert len(db.find("obj_team")) == 1
+        assert "obj_team_rebuild" not in TEST_DB_HELPER.list_collection_names()
+
+    def test_checkpoints(self):
+        """Tests saving and reading calculation checkpoints"""
+        db = database.Database()
+        db.save_checkpoints(["A", "B"], bson.Timestamp(1, 1))
+        db.save_checkpoints(["B"], bson.Timestamp(2, 1))
+        checkpoints = db.get_checkpoints()
+        assert checkpoints["A"] == bson.Timestamp(1, 1)
+        assert checkpoints["B"] == bson.Timestamp(2, 1)
+
+    def test_dirty_matches(self):
+        """Tests marking matches dirty and taking them once per calculation"""
+        db = database.Database()
+        db.mark_matches_dirty([1, 2], ["A", "B"])
+        db.mark_matches_dirty([2, None], ["A"])
+        assert db.take_dirty_matches("A") == {1, 2, None}
+        assert db.take_dirty_matches("A") == set()
+        assert db.take_dirty_matches("B") == {1, 2}
+
     def test_update_qr_blocklist_status(self):
         """Tests blocklisting of qrs"""
         TEST_DB_HELPER.raw_qr.insert_one(
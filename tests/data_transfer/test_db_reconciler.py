@@ -0,0 +1,149 @@
+from unittest import mock
+
+import pytest
+
+from data_transfer import database, db_reconciler
+
+
+def test_hash_document():
+    # Field order should not change the hash
+    assert db_reconciler.hash_document({"a": 1, "b": {"c": 2, "d": 3}}) == (
+        db_reconciler.hash_document({"b": {"d": 3, "c": 2}, "a": 1})
+    )
+    assert db_reconciler.hash_document({"a": 1}) != db_reconciler.hash_document({"a": 2})
+
+
+def test_bucket_of():
+    for document_id in ["1", "abc", 1678]:
+        bucket = db_reconciler.bucket_of(document_id)
+        assert 0 <= bucket < db_reconciler.NUM_BUCKETS
+        assert bucket == db_reconciler.bucket_of(document_id)
+
+
+def test_collection_digest():
+    documents = [{"_id": str(i), "v": i} for i in range(20)]
+    digest = db_reconciler.CollectionDigest.from_documents(documents)
+    reversed_digest = db_reconciler.CollectionDigest.from_documents(reversed(documents))
+    assert digest.root_hash() == reversed_digest.root_hash()
+    documents[3]["v"] = 100
+    changed_digest = db_reconciler.CollectionDigest.from_documents(documents)
+    changed_buckets = [
+        bucket
+        for bucket in range(db_reconciler.NUM_BUCKETS)
+        if digest.bucket_hash(bucket) != changed_digest.bucket_hash(bucket)
+    ]
+    assert changed_buckets == [db_reconciler.bucket_of("3")]
+    assert digest.root_hash() != changed_digest.root_hash()
+
+
+@pytest.mark.clouddb
+class TestReconciler:
+    def setup_method(self, method):
+        self.local_db = database.Database()
+        self.reconciler = db_reconciler.Reconciler(self.local_db, database.Database(port=9678))
+        self.cloud_db = self.reconciler.cloud_db
+
+    def test_reconcile_collection_full(self):
+        self.local_db.insert_documents(
+            "obj_team", [{"_id": str(i), "team_number": str(i), "v": i} for i in range(10)]
+        )
+        # Cloud has one outdated document, one extra document, and is missing the rest
+        self.cloud_db.insert_documents(
+            "obj_team",
+            [
+                {"_id": "0", "team_number": "0", "v": 0},
+                {"_id": "1", "team_number": "1", "v": 5},
+                {"_id": "extra", "team_number": "9999", "v": 0},
+            ],
+        )
+        result = self.reconciler.reconcile_collection("obj_team")
+        assert result.documents_sent == 9
+        assert result.documents_deleted == 1
+        assert sorted(self.cloud_db.find("obj_team"), key=lambda d: d["_id"]) == sorted(
+            self.local_db.find("obj_team"), key=lambda d: d["_id"]
+        )
+
+    def test_reconcile_collection_uses_stored_hashes(self):
+        self.local_db.insert_documents(
+            "obj_team", [{"_id": str(i), "team_number": str(i), "v": i} for i in range(50)]
+        )
+        self.reconciler.reconcile_collection("obj_team")
+        # Nothing changed, so nothing should be sent
+        result = self.reconciler.reconcile_collection("obj_team")
+        assert result.differing_buckets == 0
+        assert result.documents_sent == 0
+        self.local_db.update_document("obj_team", {"v": 100}, {"_id": "7"})
+        result = self.reconciler.reconcile_collection("obj_team")
+        assert result.differing_buckets == 1
+        assert result.documents_sent == 1
+        assert self.cloud_db.find("obj_team", {"_id": "7"})[0]["v"] == 100
+
+    def test_reconcile_collection_stale_hashes(self):
+        self.local_db.insert_documents(
+            "obj_team", [{"_id": str(i), "team_number": str(i)} for i in range(5)]
+        )
+        self.reconciler.reconcile_collection("obj_team")
+        # Changes written to the cloud outside of the server don't update the stored hashes
+        self.local_db.update_document("obj_team", {"v": 1}, {"_id": "2"})
+        self.cloud_db.db["obj_team"].update_one({"_id": "2"}, {"$set": {"v": 1}})
+        result = self.reconciler.reconcile_collection("obj_team")
+        assert result.differing_buckets == 1
+        assert result.documents_sent == 0
+        # Stored hashes are up to date after reconciling
+        assert self.reconciler.reconcile_collection("obj_team").differing_buckets == 0
+
+    def test_reconcile_collection_trust_hashes(self):
+        self.local_db.insert_documents(
+            "obj_team", [{"_id": str(i), "team_number": str(i)} for i in range(5)]
+        )
+        self.reconciler.reconcile_collection("obj_team")
+        # Replaced documents have new `_id`s, like the documents of a rebuilt collection
+        self.local_db.delete_data("obj_team", {"_id": "2"})
+        self.local_db.insert_documents("obj_team", {"_id": "new 2", "team_number": "2"})
+        with mock.patch.object(self.reconciler, "get_cloud_digest") as get_cloud_digest:
+            result = self.reconciler.reconcile_collection("obj_team", trust_hashes=True)
+        # The cloud documents are found from the stored hashes instead of being downloaded
+        get_cloud_digest.assert_not_called()
+        assert result.documents_sent == 1
+        assert result.documents_deleted == 1
+        assert sorted(self.cloud_db.find("obj_team"), key=lambda d: d["_id"]) == sorted(
+            self.local_db.find("obj_team"), key=lambda d: d["_id"]
+        )
+
+    def test_reconcile_collection_empty(self):
+        assert self.reconciler.reconcile_collection("obj_team").differing_buckets == 0
+        # Empty collections have stored hashes, so the cloud isn't hashed again
+        assert len(self.reconciler.get_cloud_bucket_hashes("obj_team")) == db_reconciler.NUM_BUCKETS
+        self.local_db.insert_documents("obj_team", {"_id": "1", "team_number": "1"})
+        result = self.reconciler.reconcile_collection("obj_team")
+        assert result.differing_buckets == 1
+        assert result.documents_sent == 1
+
+    def test_update_hashes(self):
+        self.local_db.insert_documents(
+            "obj_team", [{"_id": str(i), "team_number": str(i)} for i in range(5)]
+        )
+        self.reconciler.reconcile_collection("obj_team")
+        # Changes sent to the cloud along with their hashes
+        self.local_db.update_document("obj_team", {"v": 1}, {"_id": "2"})
+        self.local_db.insert_documents("obj_team", {"_id": "5", "team_number": "5"})
+        self.local_db.delete_data("obj_team", {"_id": "0"})
+        changed = self.local_db.find("obj_team", {"_id": {"$in": ["2", "5"]}})
+        for document in changed:
+            self.cloud_db.db["obj_team"].replace_one(
+                {"_id": document["_id"]}, document, upsert=True
+            )
+        self.cloud_db.db["obj_team"].delete_one({"_id": "0"})
+        self.reconciler.update_hashes("obj_team", changed, ["0"])
+        result = self.reconciler.reconcile_collection("obj_team")
+        assert result.differing_buckets == 0
+        # Collections that were never reconciled don't get partial hashes
+        self.reconciler.update_hashes("tba_team", [{"_id": "1", "team_number": "1"}], [])
+        assert self.reconciler.get_cloud_bucket_hashes("tba_team") == {}
+
+    def test_reconcile(self):
+        self.local_db.insert_documents("obj_team", {"team_number": "1678"})
+        self.local_db.insert_documents("tba_team", {"team_number": "1678"})
+        results = self.reconciler.reconcile(["obj_team", "tba_team"])
+        assert set(results.keys()) == {"obj_team", "tba_team"}
+        assert self.cloud_db.find("tba_team") == self.local_db.find("tba_team")
@@ -0,0 +1,132 @@
+import bson
+import pymongo
+import pytest
+
+from data_transfer import memory_database
+
+# Separate from the port used by the other tests, so their data is not reset
+PORT = 11678
+
+
+def test_matches():
+    document = {"a": 1, "b": {"c": "x"}, "l": [1, 2, 3]}
+    assert memory_database.matches(document, {"a": 1, "b.c": "x"})
+    assert memory_database.matches(document, {"l": 2})
+    assert memory_database.matches(document, {"a": {"$in": [1, 5]}, "l": {"$gt": 2}})
+    assert memory_database.matches(document, {"$or": [{"a": 2}, {"b.c": "x"}]})
+    assert memory_database.matches(document, {"missing": None})
+    assert memory_database.matches(document, {"missing": {"$exists": False}})
+    assert not memory_database.matches(document, {"a": {"$ne": 1}})
+    assert not memory_database.matches(document, {"a": {"$nin": [1]}})
+    assert not memory_database.matches(document, {"a": {"$lt": "string"}})
+
+
+def test_apply_update():
+    document = {"a": 1, "b": {"c": 1}}
+    memory_database.apply_update(
+        document, {"$set": {"b.d": 2}, "$inc": {"a": 2}, "$unset": {"b.c": ""}}
+    )
+    assert document == {"a": 3, "b": {"d": 2}}
+
+
+def test_project():
+    document = {"_id": 1, "a": 1, "b": {"c": 1, "d": 2}}
+    assert memory_database.project(document, {"b.c": 1}) == {"_id": 1, "b": {"c": 1}}
+    assert memory_database.project(document, {"_id": 0, "a": 1}) == {"a": 1}
+    assert memory_database.project(document, {"b": 0}) == {"_id": 1, "a": 1}
+
+
+class TestMemoryClient:
+    def setup_method(self, method):
+        memory_database.reset("localhost", PORT)
+        self.client = memory_database.MemoryClient("localhost", PORT)
+        self.db = self.client["test"]
+        self.oplog = self.client.local.oplog.rs
+
+    def test_shared_data(self):
+        self.db.obj_team.insert_one({"team_number": "1678"})
+        other = memory_database.MemoryClient("localhost", PORT)
+        assert other["test"]["obj_team"].find_one({}, {"_id": 0}) == {"team_number": "1678"}
+        # A different port is a different server
+        assert memory_database.MemoryClient("localhost", 9678)["test"].obj_team.find_one() is None
+
+    def test_find(self):
+        self.db.obj_tim.insert_many(
+            [{"team_number": str(n), "match_number": n % 3} for n in range(10)]
+        )
+        assert len(list(self.db.obj_tim.find({"match_number": 1}))) == 3
+        ordered = self.db.obj_tim.find({}, {"_id": 0, "team_number": 1}).sort(
+            "team_number", pymongo.DESCENDING
+        )
+        assert [document["team_number"] for document in ordered.limit(2)] == ["9", "8"]
+        # Returned documents are copies
+        self.db.obj_tim.find_one({"team_number": "1"})["team_number"] = "changed"
+        assert self.db.obj_tim.find_one({"team_number": "1"}) is not None
+
+    def test_indexes(self):
+        collection = self.db.obj_tim
+        collection.create_index(
+            [("team_number", pymongo.ASCENDING), ("match_number", pymongo.ASCENDING)], unique=True
+        )
+        collection.insert_one({"team_number": "1678", "match_number": 1})
+        collection.update_one(
+            {"team_number": "1678", "match_number": 2}, {"$set": {"v": 1}}, upsert=True
+        )
+        assert collection.find_one({"team_number": "1678", "match_number": 2})["v"] == 1
+        with pytest.raises(pymongo.errors.DuplicateKeyError):
+            collection.insert_one({"team_number": "1678", "match_number": 1})
+        collection.delete_one({"team_number": "1678", "match_number": 1})
+        collection.insert_one({"team_number": "1678", "match_number": 1})
+        assert collection.count_documents({"team_number": "1678"}) == 2
+
+    def test_oplog(self):
+        start = self.oplog.find({}).sort("ts", pymongo.DESCENDING).limit(1).next()["ts"]
+        self.db.obj_team.insert_one({"_id": 1, "team_number": "1678"})
+        self.db.obj_team.update_one({"_id": 1}, {"$set": {"v": 2}})
+        # Updates that don't change the document are not logged
+        self.db.obj_team.update_one({"_id": 1}, {"$set": {"v": 2}})
+        self.db.obj_team.delete_many({})
+        entries = list(self.oplog.find({"ts": {"$gt": start}, "ns": {"$in": ["test.obj_team"]}}))
+        assert [entry["op"] for entry in entries] == ["i", "u", "d"]
+        assert entries[0]["o"] == {"_id": 1, "team_number": "1678"}
+        assert entries[1]["o"] == {"$set": {"v": 2}}
+        assert entries[1]["o2"] == {"_id": 1}
+        assert entries[2]["o"] == {"_id": 1}
+        assert all(isinstance(entry["ts"], bson.Timestamp) for entry in entries)
+        assert entries[0]["ts"] < entries[1]["ts"] < entries[2]["ts"]
+
+    def test_bulk_write(self):
+        collection = self.db.obj_team
+        result = collection.bulk_write(
+            [
+                pymongo.InsertOne({"_id": 1, "v": 1}),
+                pymongo.UpdateOne({"_id": 1}, {"$set": {"v": 2}}),
+                pymongo.ReplaceOne({"_id": 2}, {"v": 3}, upsert=True),
+                pymongo.DeleteOne({"_id": 1}),
+            ]
+        )
+        assert result.inserted_count == 1
+        assert result.modified_count == 1
+        assert result.upserted_ids == {2: 2}
+        assert result.deleted_count == 1
+        assert list(collection.find()) == [{"_id": 2, "v": 3}]
+        with pytest.raises(pymongo.errors.BulkWriteError):
+            collection.bulk_write([pymongo.InsertOne({"_id": 2})])
+
+    def test_rename(self):
+        self.db.obj_team.insert_one({"v": 1})
+        self.db.create_collection("obj_team_rebuild").insert_one({"v": 2})
+        self.db.obj_team_rebuild.create_index("v", unique=True)
+        with pytest.raises(pymongo.errors.OperationFailure):
+            self.db.obj_team_rebuild.rename("obj_team")
+        self.db.obj_team_rebuild.rename("obj_team", dropTarget=True)
+        assert self.db.list_collection_names() == ["obj_team"]
+        assert list(self.db.obj_team.find({}, {"_id": 0})) == [{"v": 2}]
+        with pytest.raises(pymongo.errors.DuplicateKeyError):
+            self.db.obj_team.insert_one({"v": 2})
+
+    def test_drop_database(self):
+        self.db.obj_team.insert_one({"v": 1})
+        assert self.db.list_collection_names() == ["obj_team"]
+        self.client.drop_database("test")
+        assert self.client["test"].list_collection_names() == []
@@ -0,0 +1,71 @@
+import os
+
+import bson
+
+from data_transfer import outbound_queue
+
+
+class TestOutboundQueue:
+    def test_append(self, tmp_path):
+        queue = outbound_queue.OutboundQueue("test", tmp_path)
+        assert queue.is_empty()
+        assert queue.append([("obj_team", "1678"), ("obj_tim", {"team_number": "1678"})]) == 2
+        # Documents that are already queued are not queued again
+        assert queue.append([("obj_team", "1678"), ("obj_tim", {"team_number": "1678"})]) == 0
+        assert queue.append([("obj_team", "254")]) == 1
+        assert not queue.is_empty()
+        assert queue.read(0)[0] == [
+            ("obj_team", "1678"),
+            ("obj_tim", {"team_number": "1678"}),
+            ("obj_team", "254"),
+        ]
+
+    def test_next_batch_commit(self, tmp_path):
+        queue = outbound_queue.OutboundQueue("test", tmp_path)
+        queue.append([("obj_team", str(i)) for i in range(5)])
+        keys, offset = queue.next_batch(3)
+        assert keys == [("obj_team", "0"), ("obj_team", "1"), ("obj_team", "2")]
+        # Documents changed after their batch was read are queued again
+        assert queue.append([("obj_team", "0")]) == 1
+        queue.commit(offset)
+        keys, offset = queue.next_batch(10)
+        assert keys == [("obj_team", "3"), ("obj_team", "4"), ("obj_team", "0")]
+        queue.commit(offset)
+        assert queue.is_empty()
+        # The file is emptied once everything has been sent
+        assert os.path.getsize(queue.path) == 0
+
+    def test_restart(self, tmp_path):
+        queue = outbound_queue.OutboundQueue("test", tmp_path)
+        queue.append([("obj_team", str(i)) for i in range(4)])
+        queue.commit(queue.next_batch(2)[1])
+        restarted = outbound_queue.OutboundQueue("test", tmp_path)
+        assert restarted.append([("obj_team", "3")]) == 0
+        assert restarted.next_batch(10)[0] == [("obj_team", "2"), ("obj_team", "3")]
+
+    def test_watermark(self, tmp_path):
+        queue = outbound_queue.OutboundQueue("test", tmp_path)
+        assert queue.watermark is None
+        queue.append([("obj_team", "1678")], bson.Timestamp(100, 1))
+        queue.append([], bson.Timestamp(100, 2))
+        assert queue.watermark == bson.Timestamp(100, 2)
+        # The watermark is kept after the queue is sent and the server restarts
+        queue.commit(queue.next_batch(10)[1])
+        assert outbound_queue.OutboundQueue("test", tmp_path).watermark == bson.Timestamp(100, 2)
+
+    def test_partial_record(self, tmp_path):
+        queue = outbound_queue.OutboundQueue("test", tmp_path)
+        queue.append([("obj_team", "1678")])
+        # Simulate a crash partway through writing a record
+        with open(queue.path, "ab") as queue_file:
+            queue_file.write(b"\x20\x00\x00\x00\x02c")
+        restarted = outbound_queue.OutboundQueue("test", tmp_path)
+        restarted.append([("obj_team", "254")])
+        assert restarted.read(0)[0] == [("obj_team", "1678"), ("obj_team", "254")]
+
+    def test_clear(self, tmp_path):
+        queue = outbound_queue.OutboundQueue("test", tmp_path)
+        queue.append([("obj_team", "1678")])
+        queue.clear()
+        assert queue.is_empty()
+        assert queue.append([("obj_team", "1678")]) == 1
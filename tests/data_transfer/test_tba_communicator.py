@@ -1,7 +1,7 @@
 from data_transfer import tba_communicator
 import pytest
 import requests
-from unittest.mock import patch, mock_open
+from unittest.mock import Mock, patch, mock_open
 
 test_cache = {
     "api_url": "event/2020caln/teams",
@@ -37,9 +37,9 @@ def test_status_code_200(get_mock):
     get_mock.return_value.json.return_value = test_json
     get_mock.return_value.headers = {"etag": 'W/"fb0425e78890c8df10daa66401177a80c154eeb2"'}
 
-    with patch("data_transfer.database.Database.update_tba_cache") as update_mock, patch(
-        "data_transfer.tba_communicator.get_api_key", return_value="api_key"
-    ):
+    with patch("data_transfer.database.Database.get_tba_cache", return_value=test_cache), patch(
+        "data_transfer.database.Database.update_tba_cache"
+    ) as update_mock, patch("data_transfer.tba_communicator.get_api_key", return_value="api_key"):
         assert tba_communicator.tba_request("events/2020caln/teams") == {
             "teams": ["frc1678", "frc4414", "frc1671"]
         }
@@ -47,6 +47,8 @@ def test_status_code_200(get_mock):
             {"teams": ["frc1678", "frc4414", "frc1671"]},
             "events/2020caln/teams",
             'W/"fb0425e78890c8df10daa66401177a80c154eeb2"',
+            # Only written if the cache wasn't changed since it was read
+            test_cache,
         )
 
 
@@ -62,3 +64,46 @@ def test_error_code(get_mock):
 def test_get_api_key():
     with patch("builtins.open", mock_open(read_data="api_key")):
         assert tba_communicator.get_api_key() == "api_key"
+
+
+@patch("requests.get")
+def test_local_payloads(get_mock):
+    tba_communicator.use_local_payloads({"events/2020caln/teams": test_json})
+    try:
+        assert tba_communicator.tba_request("events/2020caln/teams") == test_json
+        get_mock.assert_not_called()
+    finally:
+        tba_communicator.use_local_payloads(None)
+
+
+@patch("requests.get")
+def test_prefetch(get_mock):
+    def get(url, headers):
+        response = Mock()
+        if url.endswith("alliances"):
+            response.status_code = 500
+        else:
+            response.status_code = 200
+            response.json.return_value = url.split("/")[-1]
+            response.headers = {"etag": "etag"}
+        response.content = b""
+        return response
+
+    get_mock.side_effect = get
+    with patch("data_transfer.database.Database.get_tba_cache", return_value=None), patch(
+        "data_transfer.database.Database.update_tba_cache"
+    ), patch("data_transfer.tba_communicator.get_api_key", return_value="api_key"):
+        responses = tba_communicator.prefetch(tba_communicator.cycle_endpoints("2020caln"))
+        # Failed requests are left out
+        assert responses == {
+            "event/2020caln/matches": "matches",
+            "event/2020caln/rankings": "rankings",
+            "event/2020caln/teams/simple": "simple",
+            "event/2020caln/insights": "insights",
+        }
+        assert get_mock.call_count == 5
+        assert tba_communicator.tba_request("event/2020caln/matches") == "matches"
+        assert get_mock.call_count == 5
+        tba_communicator.clear_snapshot()
+        assert tba_communicator.tba_request("event/2020caln/matches") == "matches"
+        assert get_mock.call_count == 6
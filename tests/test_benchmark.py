@@ -0,0 +1,54 @@
+import benchmark
+import metrics
+import server
+import utils
+
+
+def test_event_key():
+    key = utils.TBA_EVENT_KEY
+    with benchmark.event_key("2023synth"):
+        assert utils.TBA_EVENT_KEY == "2023synth"
+        assert server.Server.TBA_EVENT_KEY == "2023synth"
+    assert utils.TBA_EVENT_KEY == key
+    assert server.Server.TBA_EVENT_KEY == key
+
+
+def test_summarize():
+    rounds = [
+        {"calc.ObjTIMCalcs": metrics.Stats(calls=1, wall_time=1.0, documents_written=10)},
+        {
+            "calc.ObjTIMCalcs": metrics.Stats(calls=1, wall_time=3.0, documents_written=30),
+            "db.find": metrics.Stats(calls=4, wall_time=0.5),
+        },
+    ]
+    summary = benchmark.summarize(rounds, "calc.")
+    assert list(summary.keys()) == ["ObjTIMCalcs"]
+    assert summary["ObjTIMCalcs"]["rounds"] == 2
+    assert summary["ObjTIMCalcs"]["total_seconds"] == 4.0
+    assert summary["ObjTIMCalcs"]["latency_mean_seconds"] == 2.0
+    assert summary["ObjTIMCalcs"]["latency_max_seconds"] == 3.0
+    assert summary["ObjTIMCalcs"]["documents_per_second"] == 10.0
+
+
+def test_compare_to_baseline():
+    config = {"teams": 40}
+    baseline = {
+        "config": config,
+        "stages": {
+            "ObjTIMCalcs": {"total_seconds": 1.0},
+            "OBJTeamCalc": {"total_seconds": 1.0},
+            "PickabilityCalc": {"total_seconds": 0.001},
+        },
+    }
+    results = {
+        "config": config,
+        "stages": {
+            "ObjTIMCalcs": {"total_seconds": 1.1},
+            "OBJTeamCalc": {"total_seconds": 2.0},
+            # Too fast in the baseline to compare
+            "PickabilityCalc": {"total_seconds": 0.01},
+        },
+    }
+    regressions = benchmark.compare_to_baseline(results, baseline, tolerance=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("OBJTeamCalc")
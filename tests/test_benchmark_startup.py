@@ -0,0 +1,18 @@
+import benchmark_startup
+
+
+def test_time_import():
+    assert benchmark_startup.time_import("utils") > 0
+
+
+def test_slowest_imports():
+    imports = benchmark_startup.slowest_imports("utils", count=3)
+    assert len(imports) == 3
+    assert imports[0][1] >= imports[1][1] >= imports[2][1]
+    assert "utils" in [name for name, _ in benchmark_startup.slowest_imports("utils", count=50)]
+
+
+def test_benchmark_startup():
+    results = benchmark_startup.benchmark_startup(["utils"], repeats=2)
+    assert results["utils"]["min_seconds"] <= results["utils"]["median_seconds"]
+    assert results["utils"]["median_seconds"] <= results["utils"]["max_seconds"]
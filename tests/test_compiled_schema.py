@@ -0,0 +1,63 @@
+import os
+import time
+
+import compiled_schema
+import utils
+
+SCHEMA_PATH = "data/test_compiled_schema.yml"
+SCHEMA_TEXT = """schema_file:
+  version: 1
+generic_data:
+  _separator: '$'
+  match_number: [B, int]
+timeline:
+  time: [3, int, 0]
+  action_type: [2, Enum, 1]
+"""
+
+
+class TestCompiledSchema:
+    def setup_method(self, method):
+        with open(utils.create_file_path(SCHEMA_PATH), "w") as schema_file:
+            schema_file.write(SCHEMA_TEXT)
+        compiled_schema.clear_cache()
+
+    def teardown_method(self, method):
+        os.remove(utils.create_file_path(SCHEMA_PATH))
+        compiled_schema.clear_cache()
+
+    def test_compile(self):
+        compiled = compiled_schema.load(SCHEMA_PATH)
+        assert compiled.schema["generic_data"]["match_number"] == ["B", "int"]
+        assert compiled.data_fields["generic_data"] == frozenset(["match_number"])
+        assert [field["name"] for field in compiled.timeline_info] == ["time", "action_type"]
+        # Not a collection schema
+        assert compiled.mongo is None
+        assert utils.read_schema(SCHEMA_PATH) is compiled.schema
+
+    def test_cache_file(self):
+        compiled_schema.load(SCHEMA_PATH)
+        assert os.path.exists(compiled_schema._cache_path(SCHEMA_PATH))
+        # Loaded from the cache file when the schema file has not changed
+        assert compiled_schema.compile_schema(SCHEMA_PATH).schema["schema_file"]["version"] == 1
+
+    def test_invalidation(self):
+        compiled_schema.load(SCHEMA_PATH)
+        with open(utils.create_file_path(SCHEMA_PATH), "w") as schema_file:
+            schema_file.write(SCHEMA_TEXT.replace("version: 1", "version: 2"))
+        # Makes sure the modification time is different on file systems with coarse timestamps
+        os.utime(utils.create_file_path(SCHEMA_PATH), (time.time() + 10, time.time() + 10))
+        assert compiled_schema.compile_schema(SCHEMA_PATH).schema["schema_file"]["version"] == 2
+
+    def test_mongo(self):
+        compiled = compiled_schema.CompiledSchema(
+            "schema", {"data": {"team_number": {"type": "str"}, "score": {"type": "Enum[int]"}}}
+        )
+        assert compiled.mongo == {
+            "bsonType": "object",
+            "required": ["team_number"],
+            "properties": {"team_number": {"bsonType": "string"}, "score": {"bsonType": "int"}},
+        }
+
+    def test_missing_file(self):
+        assert compiled_schema.load("data/missing_schema.yml") is None
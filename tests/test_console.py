@@ -0,0 +1,45 @@
+import logging
+from unittest import mock
+
+import console
+
+
+def make_record(level, msg, *args):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+def test_load_config(tmp_path):
+    path = tmp_path / "logging_config.yml"
+    path.write_text("console_rate_limit: 5\nmodules:\n  calculations.decompressor: WARNING\n")
+    config = console.load_config(str(path))
+    assert config["console_rate_limit"] == 5
+    assert config["modules"] == {"calculations.decompressor": "WARNING"}
+    assert config["level"] == console.DEFAULT_CONFIG["level"]
+    assert console.load_config(str(tmp_path / "missing.yml")) == console.DEFAULT_CONFIG
+
+
+def test_rate_limit_filter():
+    with mock.patch("console.time.monotonic", return_value=0.0) as monotonic:
+        rate_filter = console.RateLimitFilter(2)
+        assert [rate_filter.filter(make_record(logging.INFO, "a")) for _ in range(3)] == [
+            True,
+            True,
+            False,
+        ]
+        # Warnings are always shown, with the number of messages that weren't
+        record = make_record(logging.WARNING, "b")
+        assert rate_filter.filter(record)
+        assert record.msg == "(1 messages only in the log file) b"
+        assert not rate_filter.filter(make_record(logging.INFO, "c"))
+        monotonic.return_value = 1.0
+        record = make_record(logging.INFO, "d")
+        assert rate_filter.filter(record)
+        assert record.msg == "(1 messages only in the log file) d"
+
+
+def test_local_queue_handler():
+    handler = console.LocalQueueHandler(mock.Mock())
+    original = make_record(logging.INFO, "Team: %s", "1678")
+    prepared = handler.prepare(original)
+    assert (prepared.msg, prepared.args) == ("Team: 1678", None)
+    assert original.args == ("1678",)
@@ -0,0 +1,69 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from data_transfer import database
+import export_sqlite
+
+TEST_OBJ_TIM = [
+    {"team_number": "1678", "match_number": 1, "auto_total_cones": 3, "timeline": [1, 2]},
+    {"team_number": "254", "match_number": 1, "auto_total_cones": 2.5},
+]
+TEST_TBA_TIM = [{"team_number": "1678", "match_number": 1, "mobility": True}]
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    test_db = database.Database()
+    test_db.insert_documents("obj_tim", [dict(tim) for tim in TEST_OBJ_TIM])
+    test_db.insert_documents("tba_tim", [dict(tim) for tim in TEST_TBA_TIM])
+    exporter = export_sqlite.SQLiteExport(str(tmp_path / "export.sqlite"), test_db)
+    yield exporter
+    exporter.close()
+
+
+def test_to_sql_value():
+    assert export_sqlite.to_sql_value(True) == 1
+    assert export_sqlite.to_sql_value("1678") == "1678"
+    assert export_sqlite.to_sql_value(2.5) == 2.5
+    assert export_sqlite.to_sql_value([1, {"a": 2}]) == '[1, {"a": 2}]'
+
+
+def test_export(exporter):
+    exporter.export()
+    connection = sqlite3.connect(exporter.path)
+    assert connection.execute(
+        "SELECT team_number, match_number, auto_total_cones, timeline, mobility FROM tim "
+        "ORDER BY team_number"
+    ).fetchall() == [("1678", 1, 3, "[1, 2]", 1), ("254", 1, 2.5, None, None)]
+    # Key fields are indexed
+    plan = connection.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM obj_tim WHERE team_number = '254' AND match_number = 1"
+    ).fetchall()
+    assert "obj_tim_keys" in plan[0][-1]
+    connection.close()
+
+
+def test_export_incremental(exporter):
+    assert exporter.export()["obj_tim"] == {"written": 2, "deleted": 0}
+    # Only changed documents are written again
+    assert exporter.export()["obj_tim"] == {"written": 0, "deleted": 0}
+    exporter.db.update_document(
+        "obj_tim", {"auto_total_cones": 4, "tele_total_cones": 1}, {"team_number": "254"}
+    )
+    exporter.db.delete_data("obj_tim", {"team_number": "1678"})
+    assert exporter.export()["obj_tim"] == {"written": 1, "deleted": 1}
+    assert exporter.connection.execute(
+        "SELECT team_number, auto_total_cones, tele_total_cones FROM obj_tim"
+    ).fetchall() == [("254", 4, 1)]
+
+
+def test_write_npz(exporter, tmp_path):
+    exporter.export()
+    exporter.write_npz(str(tmp_path / "export.npz"))
+    arrays = np.load(tmp_path / "export.npz")
+    assert list(arrays["obj_tim/team_number"]) == ["1678", "254"]
+    assert list(arrays["obj_tim/auto_total_cones"]) == [3.0, 2.5]
+    assert list(arrays["tba_tim/mobility"]) == [1]
+    assert "obj_tim/_hash" not in arrays.files
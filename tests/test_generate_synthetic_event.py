@@ -0,0 +1,66 @@
+import collections
+from unittest.mock import patch
+
+import pytest
+
+from calculations import decompressor
+import generate_synthetic_event
+import server
+
+with patch("server.Server.ask_calc_all_data", return_value=False):
+    DECOMPRESSOR = decompressor.Decompressor(server.Server())
+
+
+class TestSyntheticEvent:
+    def setup_method(self, method):
+        self.event = generate_synthetic_event.SyntheticEvent(num_teams=36, num_matches=60, seed=1)
+
+    def test_too_few_teams(self):
+        with pytest.raises(ValueError):
+            generate_synthetic_event.SyntheticEvent(num_teams=5)
+
+    def test_schedule(self):
+        assert len(self.event.teams) == 36
+        assert list(self.event.schedule.keys()) == list(range(1, 61))
+        matches_played = collections.Counter()
+        for alliances in self.event.schedule.values():
+            teams = alliances["red"] + alliances["blue"]
+            # No team plays twice in one match
+            assert len(set(teams)) == 6
+            matches_played.update(teams)
+        # Every team plays the same number of matches
+        assert set(matches_played.values()) == {10}
+
+    def test_match_schedule_json(self):
+        schedule = self.event.match_schedule_json()
+        assert len(schedule["1"]["teams"]) == 6
+        assert {team["color"] for team in schedule["1"]["teams"]} == {"red", "blue"}
+
+    def test_generate_match_qrs(self):
+        qrs = self.event.generate_match_qrs(1)
+        # 1-3 objective QRs per robot and one subjective QR per alliance
+        assert 8 <= len(qrs) <= 20
+        decompressed = DECOMPRESSOR.decompress_qrs([{"data": qr, "override": {}} for qr in qrs])
+        assert {tim["team_number"] for tim in decompressed["unconsolidated_obj_tim"]} == set(
+            self.event.schedule[1]["red"] + self.event.schedule[1]["blue"]
+        )
+
+    def test_generate_tba_payloads(self):
+        payloads = self.event.generate_tba_payloads(played_matches=20)
+        matches = payloads[f"event/{self.event.event_key}/matches"]
+        assert [match["match_number"] for match in matches] == list(range(1, 21))
+        for match in matches:
+            for alliance in ["red", "blue"]:
+                breakdown = match["score_breakdown"][alliance]
+                assert breakdown["totalPoints"] == match["alliances"][alliance]["score"]
+                assert len(breakdown["teleopCommunity"]["T"]) == 9
+        rankings = payloads[f"event/{self.event.event_key}/rankings"]["rankings"]
+        assert [ranking["rank"] for ranking in rankings] == list(range(1, 37))
+        # Results of a match don't change once they have been generated
+        later = self.event.generate_tba_payloads(played_matches=40)
+        assert later[f"event/{self.event.event_key}/matches"][:20] == matches
+
+    def test_seed(self):
+        other = generate_synthetic_event.SyntheticEvent(num_teams=36, num_matches=60, seed=1)
+        assert other.schedule == self.event.schedule
+        assert other.generate_tba_payloads() == self.event.generate_tba_payloads()
@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+import match_schedule
+import utils
+
+EVENT_KEY = "2023schedtest"
+TEAMS = ["1678", "254", "971", "118", "4414", "1323", "3"]
+SCHEDULE = {
+    "1": {
+        "teams": [
+            {"number": "1678", "color": "blue"},
+            {"number": "254", "color": "blue"},
+            {"number": "971", "color": "blue"},
+            {"number": "118", "color": "red"},
+            {"number": "4414", "color": "red"},
+            {"number": "1323", "color": "red"},
+        ]
+    },
+    "2": {
+        "teams": [
+            {"number": "1678", "color": "red"},
+            {"number": "118", "color": "red"},
+            {"number": "3", "color": "red"},
+            {"number": "254", "color": "blue"},
+            {"number": "4414", "color": "blue"},
+            {"number": "971", "color": "blue"},
+        ]
+    },
+}
+
+
+def write_file(name: str, data) -> None:
+    with open(utils.create_file_path(f"data/{EVENT_KEY}_{name}.json"), "w") as file:
+        json.dump(data, file)
+
+
+class TestMatchSchedule:
+    def setup_method(self, method):
+        match_schedule.clear_cache()
+        write_file("team_list", TEAMS)
+        write_file("match_schedule", SCHEDULE)
+
+    def teardown_method(self, method):
+        for name in ["team_list", "match_schedule"]:
+            os.remove(utils.create_file_path(f"data/{EVENT_KEY}_{name}.json"))
+        match_schedule.clear_cache()
+
+    def test_indexes(self):
+        schedule = match_schedule.get(EVENT_KEY)
+        assert schedule.teams == TEAMS
+        assert schedule.has_team("1678")
+        assert not schedule.has_team("9999")
+        assert schedule.matches[2] == {"blue": ["254", "4414", "971"], "red": ["1678", "118", "3"]}
+        assert schedule.get_matches("1678") == [1, 2]
+        assert schedule.get_matches("3") == [2]
+        assert schedule.get_matches("9999") == []
+        assert schedule.aim_list[0] == {
+            "match_number": 1,
+            "alliance_color": "B",
+            "team_list": ["1678", "254", "971"],
+        }
+        assert len(schedule.aim_list) == 4
+
+    def test_reload(self):
+        schedule = match_schedule.get(EVENT_KEY)
+        # The files are only read again once they change
+        assert match_schedule.get(EVENT_KEY) is schedule
+        write_file("team_list", TEAMS + ["5940"])
+        reloaded = match_schedule.get(EVENT_KEY)
+        assert reloaded is not schedule
+        assert reloaded.has_team("5940")
+        # A file that can't be parsed, such as one being written, keeps the last schedule
+        with open(utils.create_file_path(f"data/{EVENT_KEY}_match_schedule.json"), "w") as file:
+            file.write('{"1": {"teams": [')
+        assert match_schedule.get(EVENT_KEY) is reloaded
+
+    def test_missing_files(self):
+        os.remove(utils.create_file_path(f"data/{EVENT_KEY}_match_schedule.json"))
+        schedule = match_schedule.get(EVENT_KEY)
+        assert schedule.aim_list == []
+        assert schedule.has_team("254")
+        write_file("match_schedule", SCHEDULE)
+        assert len(match_schedule.get(EVENT_KEY).aim_list) == 4
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from data_transfer import database
+import metrics
+
+
+class TestMetricsRecorder:
+    def setup_method(self, method):
+        self.recorder = metrics.MetricsRecorder()
+
+    def test_scope(self):
+        with self.recorder.scope("outer"):
+            with self.recorder.scope("inner"):
+                self.recorder.record(queries=2, documents_read=5)
+            self.recorder.record(queries=1)
+        assert self.recorder.stats["inner"].calls == 1
+        assert self.recorder.stats["inner"].queries == 2
+        assert self.recorder.stats["inner"].documents_read == 5
+        # Counts from nested scopes are included in the scopes around them
+        assert self.recorder.stats["outer"].queries == 3
+        assert self.recorder.stats["outer"].wall_time >= self.recorder.stats["inner"].wall_time
+        assert self.recorder.active_scopes() == []
+
+    def test_record_without_scope(self):
+        self.recorder.record(queries=1)
+        assert self.recorder.stats == {}
+        self.recorder.record("tba_request", bytes_received=10)
+        assert self.recorder.stats["tba_request"].bytes_received == 10
+
+    def test_flush(self):
+        with self.recorder.scope("calc.ObjTIMCalcs"):
+            pass
+        db = mock.MagicMock()
+        with mock.patch("metrics.write_prometheus_file") as write_mock:
+            stats = self.recorder.flush(db)
+        assert list(stats.keys()) == ["calc.ObjTIMCalcs"]
+        write_mock.assert_called_once_with(stats)
+        collection, document = db.insert_documents.call_args.args
+        assert collection == "server_metrics"
+        assert document["cycle"] == 0
+        assert document["scopes"]["calc.ObjTIMCalcs"]["calls"] == 1
+        # The next cycle starts empty
+        assert self.recorder.stats == {}
+        assert self.recorder.cycle == 1
+
+    def test_flush_trim(self):
+        db = database.Database()
+        with mock.patch("metrics.write_prometheus_file"), mock.patch(
+            "metrics.MAX_METRICS_CYCLES", 2
+        ):
+            for _ in range(3):
+                self.recorder.record("tba_request", calls=1)
+                self.recorder.flush(db)
+        # Only the most recent cycles are kept
+        assert [document["cycle"] for document in db.find(metrics.METRICS_COLLECTION)] == [1, 2]
+        # Metrics aren't synced to the cloud
+        assert database.is_local_collection(metrics.METRICS_COLLECTION)
+
+
+def test_timed():
+    @metrics.timed("test.function")
+    def function(value):
+        return value * 2
+
+    assert function(3) == 6
+    assert metrics.RECORDER.reset()["test.function"].calls == 1
+
+
+@pytest.mark.parametrize("count_bytes", [True, False])
+def test_command_listener(count_bytes):
+    recorder = metrics.MetricsRecorder()
+    listener = metrics.CommandMetricsListener(recorder, count_bytes)
+    with recorder.scope("test"):
+        listener.started(
+            SimpleNamespace(
+                command_name="insert", command={"insert": "obj_team", "documents": [{}, {}]}
+            )
+        )
+        listener.succeeded(SimpleNamespace(command_name="insert", reply={"n": 2, "ok": 1}))
+        listener.started(SimpleNamespace(command_name="find", command={"find": "obj_team"}))
+        listener.succeeded(
+            SimpleNamespace(
+                command_name="find", reply={"cursor": {"firstBatch": [{}, {}, {}]}, "ok": 1}
+            )
+        )
+    stats = recorder.stats["test"]
+    assert stats.queries == 2
+    assert stats.documents_written == 2
+    assert stats.documents_read == 3
+    # Commands are only encoded again to count their bytes when it is enabled
+    assert (stats.bytes_sent > 0) == count_bytes
+    assert (stats.bytes_received > 0) == count_bytes
+
+
+def test_write_prometheus_file(tmp_path):
+    path = str(tmp_path / "metrics.prom")
+    metrics.write_prometheus_file({"calc.OBJTeamCalc": metrics.Stats(calls=1, queries=4)}, path)
+    with open(path) as metrics_file:
+        lines = metrics_file.read().splitlines()
+    assert "# TYPE scouting_server_queries gauge" in lines
+    assert 'scouting_server_queries{scope="calc.OBJTeamCalc"} 4' in lines
+    assert 'scouting_server_calls{scope="calc.OBJTeamCalc"} 1' in lines
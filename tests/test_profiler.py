@@ -0,0 +1,43 @@
+import os
+import time
+
+import profiler
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestSamplingProfiler:
+    def test_label(self):
+        sampler = profiler.SamplingProfiler(interval=0.001)
+        sampler.start()
+        with sampler.label("ObjTIMCalcs"):
+            busy_wait(0.1)
+        # Samples taken outside of a label are not counted
+        busy_wait(0.05)
+        sampler.stop()
+        assert list(sampler.samples.keys()) == ["ObjTIMCalcs"]
+        stacks = sampler.samples["ObjTIMCalcs"]
+        assert sum(stacks.values()) > 0
+        assert all(stack.endswith("test_profiler.py:busy_wait") for stack in stacks)
+
+    def test_collapse(self):
+        def inner():
+            import sys
+
+            return profiler.SamplingProfiler.collapse(sys._getframe())
+
+        stack = inner()
+        assert stack.endswith("test_profiler.py:test_collapse;test_profiler.py:inner")
+
+    def test_write(self, tmp_path):
+        sampler = profiler.SamplingProfiler()
+        sampler.samples["OBJTeamCalc"]["a.py:f;b.py:g"] = 3
+        sampler.samples["OBJTeamCalc"]["a.py:f"] = 5
+        paths = sampler.write(str(tmp_path))
+        assert paths == [os.path.join(str(tmp_path), "OBJTeamCalc.folded")]
+        with open(paths[0]) as profile_file:
+            assert profile_file.read() == "a.py:f 5\na.py:f;b.py:g 3\n"
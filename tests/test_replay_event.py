@@ -0,0 +1,58 @@
+import replay_event
+
+
+class TestLatencyTracker:
+    def setup_method(self, method):
+        self.tracker = replay_event.LatencyTracker()
+
+    def test_first_write_after_insert(self):
+        self.tracker.qr_inserted(0.0, {"match_number": 1, "team_number": "1678", "scout_name": "A"})
+        self.tracker.qr_inserted(1.0, {"match_number": 2, "team_number": "1678", "scout_name": "A"})
+        self.tracker.documents_written({"unconsolidated_obj_tim": {(1, "1678", "A")}}, 0.5)
+        self.tracker.documents_written(
+            {"unconsolidated_obj_tim": {(2, "1678", "A")}, "obj_tim": {(1, "1678", None)}}, 2.0
+        )
+        # Later writes don't change the latency of QRs that were already written
+        self.tracker.documents_written({"obj_tim": {(1, "1678", None), (2, "1678", None)}}, 5.0)
+        assert self.tracker.latencies == {
+            "unconsolidated_obj_tim": [0.5, 1.0],
+            "obj_tim": [2.0, 4.0],
+        }
+
+    def test_downstream_documents(self):
+        self.tracker.qr_inserted(0.0, {"match_number": 1, "team_number": "1678", "scout_name": "A"})
+        # Writes for other teams and matches are not downstream of the QR
+        self.tracker.documents_written(
+            {"obj_tim": {(1, "254", None), (2, "1678", None)}, "obj_team": {(None, "254", None)}},
+            1.0,
+        )
+        assert self.tracker.latencies == {}
+        self.tracker.documents_written({"obj_team": {(None, "1678", None)}}, 2.0)
+        assert self.tracker.latencies == {"obj_team": [2.0]}
+
+    def test_subjective_qr_teams(self):
+        self.tracker.qr_inserted(0.0, {"match_number": 1, "scout_name": "A"})
+        # Subjective QRs get their teams from the documents of their match and scout
+        self.tracker.documents_written({"subj_tim": {(1, "1678", "A"), (1, "254", "B")}}, 1.0)
+        self.tracker.documents_written({"subj_team": {(None, "254", None)}}, 2.0)
+        self.tracker.documents_written({"subj_team": {(None, "1678", None)}}, 3.0)
+        assert self.tracker.latencies == {"subj_tim": [1.0], "subj_team": [3.0]}
+
+    def test_report(self):
+        for insert_time in range(4):
+            self.tracker.qr_inserted(float(insert_time), {"team_number": "1678"})
+        self.tracker.documents_written({"obj_team": {(None, "1678", None)}}, 2.0)
+
+
+def test_filter_tba_payloads():
+    payloads = {
+        "event/2023caln/matches": [
+            {"key": "2023caln_qm1", "post_result_time": 100},
+            {"key": "2023caln_qm2", "post_result_time": 200},
+            {"key": "2023caln_qm3", "post_result_time": None},
+        ],
+        "event/2023caln/teams/simple": [{"team_number": 1678}],
+    }
+    filtered = replay_event.filter_tba_payloads(payloads, 150)
+    assert [match["key"] for match in filtered["event/2023caln/matches"]] == ["2023caln_qm1"]
+    assert filtered["event/2023caln/teams/simple"] == [{"team_number": 1678}]
@@ -3,6 +3,7 @@ from unittest import mock
 import pytest
 
 import server
+from calculations.base_calculations import BaseCalculations
 from data_transfer import database, cloud_db_updater
 
 
@@ -66,3 +67,101 @@ class TestServer:
         s.run_calculations()
         for c in calcs:
             c.run.assert_called_once()
+
+    @mock.patch("server.Server.ask_calc_all_data", return_value=False)
+    def test_run_calculations_checkpoints(self, mock_calc_all_data):
+        class Checkpointed:
+            def run(self):
+                s.db.insert_documents("test", {"a": 1})
+
+        class Failing:
+            def run(self):
+                raise ValueError
+
+        with mock.patch(
+            "server.Server.load_calculations", return_value=[Checkpointed(), Failing()]
+        ) as _:
+            s = server.Server()
+        s.db.db[database.CHECKPOINT_COLLECTION].delete_many({"calculation": "Failing"})
+        start = s.get_latest_timestamp()
+        with pytest.raises(ValueError):
+            s.run_calculations()
+        checkpoints = s.db.get_checkpoints()
+        # The checkpoint is from the start of the cycle, so this cycle's writes are included
+        assert checkpoints["Checkpointed"] == start
+        assert "Failing" not in checkpoints
+
+    @mock.patch("server.Server.ask_calc_all_data", return_value=False)
+    def test_run_calculations_profiling(self, mock_calc_all_data):
+        calcs = [mock.MagicMock()]
+        with mock.patch("server.Server.load_calculations", return_value=calcs) as _:
+            s = server.Server()
+        s.enable_profiling(1)
+        with mock.patch("server.profiler.SamplingProfiler.write", return_value=[]) as mock_write:
+            s.run_calculations()
+            s.run_calculations()
+        # Only the first cycle is profiled
+        mock_write.assert_called_once()
+        assert s.profile_cycles == 0
+        assert calcs[0].run.call_count == 2
+
+    @mock.patch("server.Server.ask_calc_all_data", return_value=False)
+    def test_run_calculations_switch_calc_all_data(self, mock_calc_all_data):
+        s = None
+        runs = []
+
+        class Recorder(BaseCalculations):
+            def run(self):
+                runs.append((self.calc_all_data, s.db._rebuilding is not None))
+
+        with mock.patch("server.Server.load_calculations", return_value=[]) as _:
+            s = server.Server()
+        s.calculations = [Recorder(s)]
+        # The answer is asked again before every cycle
+        for answer in [False, True, False]:
+            s.calc_all_data = answer
+            s.run_calculations()
+        # Calculations only recalculate all data while the server rebuilds it
+        assert runs == [(False, False), (True, True), (False, False)]
+
+    @mock.patch("server.Server.ask_calc_all_data", return_value=True)
+    def test_run_calculations_rebuild(self, mock_calc_all_data):
+        s = None
+        live = []
+
+        class Rebuild:
+            def run(self):
+                s.db.delete_data("obj_team")
+                s.db.update_document("obj_team", {"a": 2}, {"team_number": "1678"})
+                live.append(list(s.db.db.obj_team.find({}, {"_id": 0})))
+
+        with mock.patch("server.Server.load_calculations", return_value=[Rebuild()]) as _:
+            s = server.Server()
+        s.db.delete_data("obj_team")
+        s.db.update_document("obj_team", {"a": 1}, {"team_number": "1678"})
+        s.run_calculations()
+        # The live collection was unchanged until the rebuild finished
+        assert live == [[{"team_number": "1678", "a": 1}]]
+        assert s.db.find("obj_team")[0]["a"] == 2
+        # The rebuilt collection has the indexes from the schema, which other tests don't expect
+        s.db.db.drop_collection("obj_team")
+
+    @mock.patch("server.Server.ask_calc_all_data", return_value=True)
+    def test_run_in_parallel(self, mock_calc_all_data):
+        order = []
+
+        def calculation(name):
+            return type(name, (), {"run": lambda self: order.append(name)})()
+
+        calcs = [calculation(name) for name in ["A", "B", "C", "D"]]
+        with mock.patch("server.Server.load_calculations", return_value=calcs) as _:
+            s = server.Server()
+        # D has no dependencies listed, so it waits for every calculation before it
+        s.dependencies = {"A": [], "B": ["A"], "C": []}
+        s.rebuild_workers = 2
+        s.run_calculations()
+        assert order.index("A") < order.index("B") < order.index("D")
+        assert order.index("C") < order.index("D")
+        s.dependencies = {"A": ["B"], "B": ["A"]}
+        with pytest.raises(ValueError):
+            s.run_calculations()
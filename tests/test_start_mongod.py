@@ -0,0 +1,49 @@
+import threading
+from unittest import mock
+
+import pytest
+
+import start_mongod
+
+
+@pytest.fixture
+def not_started(monkeypatch):
+    monkeypatch.setattr(start_mongod, "_started", False)
+    with mock.patch.object(start_mongod, "start_mongod") as start, mock.patch.object(
+        start_mongod, "initiate_replica_set"
+    ) as initiate:
+        yield start, initiate
+
+
+def test_ensure_started_running(not_started):
+    start, initiate = not_started
+    with mock.patch.object(start_mongod, "is_running", return_value=True), mock.patch.object(
+        start_mongod, "is_replica_set_initiated", return_value=True
+    ):
+        start_mongod.ensure_started()
+    start.assert_not_called()
+    initiate.assert_not_called()
+
+
+def test_ensure_started_not_initiated(not_started):
+    start, initiate = not_started
+    # A mongod that was started without initiating its replica set has no oplog
+    with mock.patch.object(start_mongod, "is_running", return_value=True), mock.patch.object(
+        start_mongod, "is_replica_set_initiated", return_value=False
+    ):
+        start_mongod.ensure_started()
+    start.assert_not_called()
+    initiate.assert_called_once()
+
+
+def test_ensure_started_threads(not_started):
+    start, _ = not_started
+    with mock.patch.object(start_mongod, "is_running", return_value=False):
+        threads = [threading.Thread(target=start_mongod.ensure_started) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    # mongod is only started once, even when it is first needed by several threads at once
+    start.assert_called_once()
+    assert start_mongod._started
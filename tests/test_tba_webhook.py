@@ -0,0 +1,104 @@
+import threading
+from unittest import mock
+
+import pytest
+
+from data_transfer import database
+import tba_webhook
+
+SECRET = "secret"
+
+
+def match_score(match_number, score, comp_level="qm", event_key="2023test"):
+    return {
+        "message_type": "match_score",
+        "message_data": {
+            "event_key": event_key,
+            "match_key": f"{event_key}_{comp_level}{match_number}",
+            "match": {
+                "key": f"{event_key}_{comp_level}{match_number}",
+                "comp_level": comp_level,
+                "match_number": match_number,
+                "alliances": {"red": {"score": score}, "blue": {"score": 0}},
+            },
+        },
+    }
+
+
+@pytest.mark.clouddb
+class TestWebhookReceiver:
+    def setup_method(self, method):
+        self.db = database.Database()
+        self.db.db[database.DIRTY_MATCH_COLLECTION].delete_many({})
+        self.db.db.tba_cache.delete_many({})
+        self.receiver = tba_webhook.WebhookReceiver(self.db, "2023test")
+
+    def teardown_method(self, method):
+        self.db.db[database.DIRTY_MATCH_COLLECTION].delete_many({})
+        self.db.db.tba_cache.delete_many({})
+
+    def test_verify(self):
+        body = b'{"message_type": "ping"}'
+        assert tba_webhook.verify(body, tba_webhook.sign(body, SECRET), SECRET)
+        assert not tba_webhook.verify(body, tba_webhook.sign(body, "other"), SECRET)
+        assert not tba_webhook.verify(body, None, SECRET)
+
+    def test_match_score(self):
+        self.db.update_tba_cache(
+            [match_score(1, 10)["message_data"]["match"]], self.receiver.matches_url, "etag"
+        )
+        self.receiver.handle(match_score(1, 20))
+        self.receiver.handle(match_score(2, 30))
+        cached = self.db.get_tba_cache(self.receiver.matches_url)
+        assert [match["alliances"]["red"]["score"] for match in cached["data"]] == [20, 30]
+        assert cached["etag"] == "etag"
+        # Each calculation recalculates the matches once
+        assert self.db.take_dirty_matches("TBATIMCalc") == {1, 2}
+        assert self.db.take_dirty_matches("TBATIMCalc") == set()
+        assert self.db.take_dirty_matches("PredictedAimCalc") == {1, 2}
+        # Playoff matches and other events don't mark matches dirty
+        self.receiver.handle(match_score(1, 5, "sf"))
+        self.receiver.handle(match_score(3, 5, event_key="2023other"))
+        assert self.db.take_dirty_matches("SimPrecisionCalc") == {1, 2}
+        assert len(self.db.get_tba_cache(self.receiver.matches_url)["data"]) == 3
+
+    def test_match_score_concurrent_write(self):
+        self.db.update_tba_cache([], self.receiver.matches_url, "etag")
+        get_tba_cache = self.db.get_tba_cache
+
+        def poll_between_read_and_write(api_url):
+            cached = get_tba_cache(api_url)
+            if not cached["data"]:
+                # A poll writes the matches after the receiver read them
+                self.db.update_tba_cache(
+                    [match_score(2, 30)["message_data"]["match"]], api_url, "new", cached
+                )
+            return cached
+
+        with mock.patch.object(self.db, "get_tba_cache", poll_between_read_and_write):
+            self.receiver.handle(match_score(1, 20))
+        cached = self.db.get_tba_cache(self.receiver.matches_url)
+        # The score is applied to the polled matches instead of replacing them
+        assert [match["alliances"]["red"]["score"] for match in cached["data"]] == [30, 20]
+        assert cached["etag"] == "new"
+
+    def test_alliance_selection(self):
+        with mock.patch("tba_webhook.tba_communicator.tba_request") as tba_request:
+            self.receiver.handle(
+                {"message_type": "alliance_selection", "message_data": {"event_key": "2023test"}}
+            )
+        tba_request.assert_called_once_with(self.receiver.alliances_url)
+        assert self.db.take_dirty_matches("PredictedAimCalc") == {None}
+        assert self.db.take_dirty_matches("TBATIMCalc") == set()
+
+    def test_server(self):
+        server = tba_webhook.make_server(self.receiver, SECRET, "localhost", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://localhost:{server.server_address[1]}/"
+        try:
+            assert tba_webhook.send_webhook(url, match_score(4, 1), SECRET).status_code == 200
+            assert tba_webhook.send_webhook(url, match_score(5, 1), "wrong").status_code == 401
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert self.db.take_dirty_matches("TBATIMCalc") == {4}
@@ -0,0 +1,110 @@
+import gzip
+import http.client
+import json
+import threading
+
+import pytest
+
+from data_transfer import database
+import viewer_api
+
+
+@pytest.mark.clouddb
+class TestViewerApi:
+    def setup_method(self, method):
+        self.db = database.Database()
+        self.db.delete_data("obj_team")
+        self.db.delete_data("predicted_aim")
+        self.db.insert_documents(
+            "obj_team", [{"team_number": "1678", "a": 1}, {"team_number": "254", "a": 2}]
+        )
+        self.db.insert_documents(
+            "predicted_aim", {"match_number": 1, "alliance_color_is_red": True, "score": 3}
+        )
+        self.cache = viewer_api.ResponseCache(self.db, ["obj_team", "predicted_aim"])
+        self.cache.load_all()
+
+    def teardown_method(self, method):
+        self.db.delete_data("obj_team")
+        self.db.delete_data("predicted_aim")
+
+    def test_get(self):
+        assert json.loads(self.cache.get("/obj_team").body) == [
+            {"team_number": "1678", "a": 1},
+            {"team_number": "254", "a": 2},
+        ]
+        assert json.loads(self.cache.get("/obj_team/team/254").body) == [
+            {"team_number": "254", "a": 2}
+        ]
+        assert json.loads(self.cache.get("/predicted_aim/match/1").body)[0]["score"] == 3
+        assert json.loads(self.cache.get("/obj_team/team/1").body) == []
+        assert gzip.decompress(self.cache.get("/obj_team").gzip_body) == (
+            self.cache.get("/obj_team").body
+        )
+        assert self.cache.get("/raw_qr") is None
+        assert self.cache.get("/obj_team/scout/1") is None
+
+    def test_refresh(self):
+        etag = self.cache.get("/obj_team/team/1678").etag
+        assert self.cache.refresh() == set()
+        self.db.update_document("obj_team", {"a": 5}, {"team_number": "1678"})
+        assert self.cache.refresh() == {"obj_team"}
+        assert json.loads(self.cache.get("/obj_team/team/1678").body)[0]["a"] == 5
+        assert self.cache.get("/obj_team/team/1678").etag != etag
+        # Swapping in a rebuilt collection replaces every document
+        with self.db.rebuild():
+            self.db.delete_data("obj_team")
+            self.db.insert_documents("obj_team", {"team_number": "1", "a": 0})
+        assert self.cache.refresh() == {"obj_team"}
+        assert json.loads(self.cache.get("/obj_team").body) == [{"team_number": "1", "a": 0}]
+        self.db.db.drop_collection("obj_team")
+
+    def test_server(self):
+        server = viewer_api.make_server(self.cache, "localhost", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            connection = http.client.HTTPConnection("localhost", server.server_address[1])
+            connection.request("GET", "/obj_team/team/1678", headers={"Accept-Encoding": "gzip"})
+            response = connection.getresponse()
+            body = response.read()
+            assert response.status == 200
+            assert response.getheader("Content-Encoding") == "gzip"
+            assert response.getheader("Vary") == "Accept-Encoding"
+            assert json.loads(gzip.decompress(body)) == [{"team_number": "1678", "a": 1}]
+            # The same connection is reused, and unchanged data isn't sent again
+            etag = response.getheader("ETag")
+            connection.request("GET", "/obj_team/team/1678", headers={"If-None-Match": etag})
+            response = connection.getresponse()
+            assert response.status == 304
+            assert response.read() == b""
+            connection.request(
+                "GET", "/obj_team/team/1678", headers={"If-None-Match": f'"other", W/{etag}'}
+            )
+            response = connection.getresponse()
+            assert response.status == 304
+            response.read()
+            connection.request("GET", "/missing")
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 404
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def test_etag_matches():
+    assert viewer_api.etag_matches('"abc"', '"abc"')
+    assert viewer_api.etag_matches('"other", "abc"', '"abc"')
+    assert viewer_api.etag_matches('W/"abc"', '"abc"')
+    assert viewer_api.etag_matches("*", '"abc"')
+    assert not viewer_api.etag_matches('"other"', '"abc"')
+    assert not viewer_api.etag_matches(None, '"abc"')
+
+
+def test_accepts_gzip():
+    assert viewer_api.accepts_gzip("gzip, deflate, br")
+    assert viewer_api.accepts_gzip("deflate, gzip;q=0.5")
+    assert viewer_api.accepts_gzip("*")
+    assert not viewer_api.accepts_gzip("gzip;q=0, deflate")
+    assert not viewer_api.accepts_gzip("deflate")
+    assert not viewer_api.accepts_gzip(None)